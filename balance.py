@@ -0,0 +1,97 @@
+from itertools import combinations
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+from riot import LeagueEntry
+
+TIERS = (
+    "IRON",
+    "BRONZE",
+    "SILVER",
+    "GOLD",
+    "PLATINUM",
+    "EMERALD",
+    "DIAMOND",
+    "MASTER",
+    "GRANDMASTER",
+    "CHALLENGER",
+)
+DIVISIONS = {"IV": 0, "III": 1, "II": 2, "I": 3}
+# ソロ/デュオを優先し、無ければフレックスのランクを使う
+QUEUES = ("RANKED_SOLO_5x5", "RANKED_FLEX_SR")
+# ランクの無いプレイヤーが一人もいない場合はゴールドIV相当とみなす
+DEFAULT_RATING = TIERS.index("GOLD") * 400
+POSITIONS = ("top", "jungle", "mid", "bottom", "support")
+# 同じチームでポジションが一つ重なるごとに、1ティア分の差として扱う
+ROLE_PENALTY = 400
+
+TEAM_SIZE = 5
+PLAYERS = TEAM_SIZE * 2
+ALL = (1 << PLAYERS) - 1
+# 青チームに入る5人をビットで表した全252通り
+SPLITS: Tuple[int, ...] = tuple(sum(1 << i for i in team) for team in combinations(range(PLAYERS), TEAM_SIZE))
+# 部分集合の値を一つ少ない集合から求めるため、最下位ビットの位置を引けるようにしておく
+_LOWEST = tuple((mask & -mask).bit_length() - 1 for mask in range(1 << PLAYERS))
+
+
+# ティアとディビジョンを段階的な数値にする (1ディビジョン100、マスター以上はLPのみで比べる)
+def rating(entries: Sequence[LeagueEntry]) -> Optional[int]:
+    by_queue = {entry.queue_type: entry for entry in entries}
+    for queue in QUEUES:
+        entry = by_queue.get(queue)
+        if entry is None or entry.tier not in TIERS:
+            continue
+        tier = TIERS.index(entry.tier)
+        if tier >= TIERS.index("MASTER"):
+            return TIERS.index("MASTER") * 400 + entry.league_points
+        return tier * 400 + DIVISIONS.get(entry.rank, 0) * 100 + entry.league_points
+    return None
+
+
+# ランクの無いプレイヤーは、他のプレイヤーの平均とみなす
+def fill_unranked(ratings: Sequence[Optional[int]]) -> List[int]:
+    ranked = [value for value in ratings if value is not None]
+    default = sum(ranked) // len(ranked) if ranked else DEFAULT_RATING
+    return [value if value is not None else default for value in ratings]
+
+
+class Split(NamedTuple):
+    blue: Tuple[int, ...]
+    red: Tuple[int, ...]
+    difference: int
+    role_conflicts: int
+
+
+def _members(mask: int) -> Tuple[int, ...]:
+    return tuple(i for i in range(PLAYERS) if mask >> i & 1)
+
+
+# 10人の全ての分け方を一度に評価し、レートの差とポジションの重なりが最も小さいものを選ぶ
+# 同じ評価の分け方が複数ある場合は、現在のチームから移動する人数が少ないものを選ぶ
+def balance(
+    ratings: Sequence[int], positions: Optional[Sequence[str]] = None, current: int = (1 << TEAM_SIZE) - 1
+) -> Split:
+    if len(ratings) != PLAYERS:
+        raise ValueError(f"balance needs exactly {PLAYERS} players")
+
+    # 全1024通りの部分集合について、合計レートと含まれるポジションを一つ前の部分集合から求める
+    sums = [0] * (1 << PLAYERS)
+    roles = [0] * (1 << PLAYERS)
+    bits = [1 << POSITIONS.index(p) if p in POSITIONS else 0 for p in positions] if positions else [0] * PLAYERS
+    for mask in range(1, 1 << PLAYERS):
+        low = _LOWEST[mask]
+        rest = mask & (mask - 1)
+        sums[mask] = sums[rest] + ratings[low]
+        roles[mask] = roles[rest] | bits[low]
+
+    total = sums[ALL]
+    best: Optional[Tuple[int, int, int, int]] = None
+    for mask in SPLITS:
+        difference = abs(2 * sums[mask] - total)
+        conflicts = 0
+        if positions:
+            conflicts = 2 * TEAM_SIZE - bin(roles[mask]).count("1") - bin(roles[ALL ^ mask]).count("1")
+        key = (difference + ROLE_PENALTY * conflicts, bin(mask ^ current).count("1"), mask, conflicts)
+        if best is None or key < best:
+            best = key
+
+    _, _, mask, conflicts = best
+    return Split(_members(mask), _members(ALL ^ mask), abs(2 * sums[mask] - total), conflicts)
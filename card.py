@@ -0,0 +1,296 @@
+import asyncio
+import hashlib
+import importlib.util
+import io
+import json
+import math
+import mmap
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+# Pillowの読み込みは起動を遅くするため、描画するプロセスで初めて使う時に読み込む
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
+if TYPE_CHECKING:
+    from PIL import Image, ImageDraw
+
+TILE_SIZE = 80
+PADDING = 20
+GAP = 24
+ARROW_HEIGHT = 64
+LABEL_HEIGHT = 36
+TITLE_HEIGHT = 28
+WIDTH = PADDING * 2 + TILE_SIZE * 5 + GAP * 4
+TEAM_HEIGHT = TITLE_HEIGHT + ARROW_HEIGHT + TILE_SIZE + LABEL_HEIGHT
+HEIGHT = PADDING * 2 + TEAM_HEIGHT * 2
+
+BACKGROUND = (32, 34, 37)
+TEXT = (220, 221, 222)
+MISSING = (79, 84, 92)
+TEAM_COLORS = {"blue": (88, 135, 242), "red": (237, 66, 69)}
+WOLF = (163, 73, 222)
+ELECTED = (250, 196, 45)
+
+
+class CardPlayer(NamedTuple):
+    name: str
+    # champion.json の image.full (例: "Ahri.png")
+    image: Optional[str]
+    is_wolf: bool
+    voted_to: int
+    elected: bool
+
+
+class ResultCard(NamedTuple):
+    blue: Tuple[CardPlayer, ...]
+    red: Tuple[CardPlayer, ...]
+
+    # 同じ結果は同じ画像になるため、内容のハッシュをキャッシュのキーにする
+    def digest(self) -> str:
+        return hashlib.sha1(repr(self).encode("utf-8")).hexdigest()
+
+
+# 全チャンピオンのポートレートを縮小済みの生のRGBとして一つのファイルに並べたもの
+# mmapで開くため、複数のワーカープロセスでもページキャッシュを共有できる
+class SpriteAtlas(object):
+    def __init__(self, path: str):
+        with open(path + ".json", encoding="utf-8") as f:
+            index = json.load(f)
+        self.tile_size: int = index["tile_size"]
+        self.names: Dict[str, int] = {name: i for i, name in enumerate(index["names"])}
+        self._file = open(path, "rb")
+        self._map: mmap.mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def tile(self, name: Optional[str]) -> Optional["Image.Image"]:
+        from PIL import Image
+
+        i = self.names.get(name) if name is not None else None
+        if i is None:
+            return None
+        size = self.tile_size * self.tile_size * 3
+        return Image.frombuffer("RGB", (self.tile_size, self.tile_size), self._map[i * size:(i + 1) * size], "raw")
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    @staticmethod
+    def is_stale(source: str, path: str) -> bool:
+        if not os.path.exists(path) or not os.path.exists(path + ".json"):
+            return True
+        built = os.path.getmtime(path)
+        return any(os.path.getmtime(os.path.join(source, name)) > built for name in os.listdir(source))
+
+    @staticmethod
+    def build(source: str, path: str, tile_size: int = TILE_SIZE):
+        from PIL import Image
+
+        names = sorted(name for name in os.listdir(source) if name.endswith(".png"))
+        # 書き込み途中のファイルを他のプロセスが読まないよう、一時ファイルから置き換える
+        with open(path + ".tmp", "wb") as f:
+            for name in names:
+                with Image.open(os.path.join(source, name)) as image:
+                    f.write(image.convert("RGB").resize((tile_size, tile_size), Image.LANCZOS).tobytes())
+        with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"tile_size": tile_size, "names": names}, f)
+        os.replace(path + ".tmp", path)
+        os.replace(path + ".json.tmp", path + ".json")
+
+
+# ワーカープロセスごとに一度だけアトラスとフォントを開く
+_atlas: Optional[SpriteAtlas] = None
+_font = None
+
+
+def _init_worker(atlas_path: str, font_path: Optional[str]):
+    global _atlas, _font
+    from PIL import ImageFont
+
+    _atlas = SpriteAtlas(atlas_path)
+    _font = ImageFont.truetype(font_path, 14) if font_path else ImageFont.load_default()
+
+
+def _tile_x(i: int) -> int:
+    return PADDING + i * (TILE_SIZE + GAP)
+
+
+def _draw_arrow(draw: "ImageDraw.ImageDraw", start: int, end: int, top: int, color: Tuple[int, int, int]):
+    # 投票者から投票先へ、ポートレートの上に弧を描く
+    x0 = _tile_x(start) + TILE_SIZE // 2 + (6 if end > start else -6)
+    x1 = _tile_x(end) + TILE_SIZE // 2 + (-6 if end > start else 6)
+    bottom = top + ARROW_HEIGHT - 4
+    height = min(ARROW_HEIGHT - 10, 14 * abs(end - start))
+    points = []
+    for step in range(17):
+        t = step / 16
+        x = x0 + (x1 - x0) * t
+        y = bottom - height * 4 * t * (1 - t)
+        points.append((x, y))
+    draw.line(points, fill=color, width=2)
+    angle = math.atan2(points[-1][1] - points[-2][1], points[-1][0] - points[-2][0])
+    head = [
+        points[-1],
+        (points[-1][0] - 8 * math.cos(angle - 0.5), points[-1][1] - 8 * math.sin(angle - 0.5)),
+        (points[-1][0] - 8 * math.cos(angle + 0.5), points[-1][1] - 8 * math.sin(angle + 0.5)),
+    ]
+    draw.polygon(head, fill=color)
+
+
+def _draw_team(
+    image: "Image.Image", draw: "ImageDraw.ImageDraw", team: str, players: Tuple[CardPlayer, ...], top: int
+):
+    color = TEAM_COLORS[team]
+    draw.text((PADDING, top + 6), team.upper(), fill=color, font=_font)
+    tiles = top + TITLE_HEIGHT + ARROW_HEIGHT
+    for i, player in enumerate(players):
+        if 0 <= player.voted_to < len(players) and player.voted_to != i:
+            _draw_arrow(draw, i, player.voted_to, top + TITLE_HEIGHT, color)
+
+    for i, player in enumerate(players):
+        x = _tile_x(i)
+        tile = _atlas.tile(player.image)
+        if tile is not None:
+            image.paste(tile, (x, tiles))
+        else:
+            draw.rectangle([x, tiles, x + TILE_SIZE - 1, tiles + TILE_SIZE - 1], fill=MISSING)
+        if player.elected:
+            draw.rectangle([x - 3, tiles - 3, x + TILE_SIZE + 2, tiles + TILE_SIZE + 2], outline=ELECTED, width=3)
+        if player.is_wolf:
+            draw.rectangle([x, tiles, x + TILE_SIZE - 1, tiles + TILE_SIZE - 1], outline=WOLF, width=4)
+            draw.rectangle([x, tiles + TILE_SIZE - 18, x + TILE_SIZE - 1, tiles + TILE_SIZE - 1], fill=WOLF)
+            draw.text((x + 6, tiles + TILE_SIZE - 16), "WOLF", fill=TEXT, font=_font)
+        draw.text((x, tiles + TILE_SIZE + 4), player.name[:12], fill=TEXT, font=_font)
+
+
+def render(card: ResultCard) -> bytes:
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (WIDTH, HEIGHT), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    _draw_team(image, draw, "blue", card.blue, PADDING)
+    _draw_team(image, draw, "red", card.red, PADDING + TEAM_HEIGHT)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", optimize=False, compress_level=1)
+    return buffer.getvalue()
+
+
+def _ping() -> bool:
+    return _atlas is not None
+
+
+def _prepare(source: str, path: str):
+    if SpriteAtlas.is_stale(source, path):
+        SpriteAtlas.build(source, path)
+
+
+# 結果画像の描画はプロセスプールで行い、イベントループを止めない
+class ResultCardRenderer(object):
+    DEFAULT_CACHE_SIZE = 64
+
+    def __init__(
+        self,
+        source: str = "resources/champion",
+        atlas_path: str = "resources/champion.atlas",
+        workers: int = 1,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        font_path: Optional[str] = None,
+    ):
+        self.source: str = source
+        self.atlas_path: str = atlas_path
+        self.workers: int = workers
+        self.cache_size: int = cache_size
+        self.font_path: Optional[str] = font_path
+        self.hits: int = 0
+        self.misses: int = 0
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._ready: Optional[asyncio.Future] = None
+
+    @property
+    def available(self) -> bool:
+        return PIL_AVAILABLE and self.workers > 0
+
+    # アトラスが無いか古い場合は、最初の描画の前に一度だけ作り直す
+    async def _ensure_ready(self):
+        loop = asyncio.get_event_loop()
+        if self._ready is None:
+            self._ready = asyncio.ensure_future(loop.run_in_executor(None, _prepare, self.source, self.atlas_path))
+        try:
+            await asyncio.shield(self._ready)
+        except Exception:
+            # 次の描画で作り直しを再試行する
+            self._ready = None
+            raise
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.atlas_path, self.font_path)
+            )
+
+    # 起動時に呼んでおくと、最初の描画でアトラスの作成やプロセスの起動を待たずに済む
+    async def warm(self):
+        if not self.available:
+            return
+        try:
+            await self._ensure_ready()
+            await asyncio.get_event_loop().run_in_executor(self._pool, _ping)
+        except Exception as e:
+            print("Failed to prepare result card renderer: {!r}".format(e))
+
+    async def render(self, card: ResultCard) -> Optional[bytes]:
+        if not self.available:
+            return None
+        key = card.digest()
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        # 同じ結果の描画が進行中であれば、その結果を待つ
+        if key not in self._pending:
+            self.misses += 1
+            self._pending[key] = asyncio.ensure_future(self._render(key, card))
+        try:
+            return await asyncio.shield(self._pending[key])
+        except Exception as e:
+            print("Failed to render result card: {!r}".format(e))
+            return None
+
+    async def _render(self, key: str, card: ResultCard) -> bytes:
+        try:
+            await self._ensure_ready()
+            data = await asyncio.get_event_loop().run_in_executor(self._pool, render, card)
+        finally:
+            self._pending.pop(key, None)
+        self._cache[key] = data
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return data
+
+    # チャンピオン画像が追加された場合に、次の描画の前にアトラスを作り直させる
+    def reload(self):
+        self._ready = None
+        self._cache.clear()
+        self.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+# python card.py で事前にアトラスを作っておける
+def main(args: List[str]):
+    source = args[0] if len(args) > 0 else "resources/champion"
+    path = args[1] if len(args) > 1 else "resources/champion.atlas"
+    SpriteAtlas.build(source, path)
+    print("Built {} from {}".format(path, source))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
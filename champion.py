@@ -0,0 +1,144 @@
+import json
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class Champion(object):
+    __slots__ = ("key", "id", "name", "image")
+
+    def __init__(self, key: int, id: str, name: str, image: str):
+        self.key: int = key
+        self.id: str = id
+        self.name: str = name
+        self.image: str = image
+
+    def __repr__(self) -> str:
+        return f"Champion({self.key}, {self.id!r}, {self.name!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Champion):
+            return NotImplemented
+        return (self.key, self.id, self.name, self.image) == (other.key, other.id, other.name, other.image)
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    @classmethod
+    def from_json(cls, value: Dict) -> "Champion":
+        return cls(int(value["key"]), value["id"], value["name"], value["image"]["full"])
+
+
+class ChampionDiff(NamedTuple):
+    added: Tuple[Champion, ...]
+    changed: Tuple[Champion, ...]
+    removed: Tuple[Champion, ...]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+def parse_champions(data: Dict) -> List[Champion]:
+    return [Champion.from_json(value) for value in data["data"].values()]
+
+
+# パッチごとのチャンピオン情報をSQLiteに保存し、起動時にJSON全体を解析せずに読み込めるようにする
+class ChampionStore(object):
+    def __init__(self, path: str = "champions.db"):
+        self.db: sqlite3.Connection = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS champions ("
+            "key INTEGER PRIMARY KEY, id TEXT NOT NULL, name TEXT NOT NULL, image TEXT NOT NULL)"
+        )
+        self.db.commit()
+
+    @property
+    def version(self) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        return row[0] if row is not None else None
+
+    def load(self) -> List[Champion]:
+        return [Champion(*row) for row in self.db.execute("SELECT key, id, name, image FROM champions")]
+
+    def diff(self, champions: Iterable[Champion]) -> ChampionDiff:
+        current = {champion.key: champion for champion in self.load()}
+        latest = {champion.key: champion for champion in champions}
+        return ChampionDiff(
+            tuple(champion for key, champion in latest.items() if key not in current),
+            tuple(champion for key, champion in latest.items() if key in current and current[key] != champion),
+            tuple(champion for key, champion in current.items() if key not in latest),
+        )
+
+    # 差分のみを一つのトランザクションで書き込む
+    def apply(self, version: str, diff: ChampionDiff):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO champions (key, id, name, image) VALUES (?, ?, ?, ?)",
+                [(c.key, c.id, c.name, c.image) for c in diff.added + diff.changed],
+            )
+            self.db.executemany("DELETE FROM champions WHERE key = ?", [(c.key,) for c in diff.removed])
+            self.db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (version,))
+
+    def close(self):
+        self.db.close()
+
+
+class _Tables(NamedTuple):
+    version: Optional[str]
+    by_key: Dict[int, Champion]
+    by_id: Dict[str, Champion]
+    by_name: Dict[str, Champion]
+
+
+# キー・ID・名前で引けるようにする
+# storeを指定した場合はそこから読み込み、空であれば champion.json の内容を初期データとして書き込む
+class ChampionRegistry(object):
+    def __init__(self, path: str = "resources/champion.json", store: Optional[ChampionStore] = None):
+        self.path: str = path
+        self.store: Optional[ChampionStore] = store
+        self._tables: Optional[_Tables] = None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._ensure_loaded().version
+
+    def load(self):
+        if self.store is not None and self.store.version is not None:
+            self.swap(self.store.version, self.store.load())
+            return
+
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        champions = parse_champions(data)
+        if self.store is not None:
+            self.store.apply(data.get("version", ""), self.store.diff(champions))
+        self.swap(data.get("version"), champions)
+
+    # 参照を一度に差し替えるため、読み込み中の他の処理が新旧の混ざった状態を見ることは無い
+    def swap(self, version: Optional[str], champions: Iterable[Champion]):
+        by_key, by_id, by_name = {}, {}, {}
+        for champion in champions:
+            by_key[champion.key] = champion
+            by_id[champion.id] = champion
+            by_name[champion.name] = champion
+        self._tables = _Tables(version, by_key, by_id, by_name)
+
+    def _ensure_loaded(self) -> _Tables:
+        if self._tables is None:
+            self.load()
+        return self._tables
+
+    def by_key(self, key: int) -> Optional[Champion]:
+        return self._ensure_loaded().by_key.get(key)
+
+    def by_id(self, id: str) -> Optional[Champion]:
+        return self._ensure_loaded().by_id.get(id)
+
+    def by_name(self, name: str) -> Optional[Champion]:
+        return self._ensure_loaded().by_name.get(name)
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded().by_key)
+
+    def __iter__(self) -> Iterator[Champion]:
+        return iter(list(self._ensure_loaded().by_key.values()))
@@ -0,0 +1,126 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from metrics import QueueMetrics
+
+_REQUIRED = object()
+
+
+class ArgumentError(Exception):
+    pass
+
+
+class Arg(object):
+    __slots__ = ("name", "type", "default", "rest")
+
+    def __init__(self, name: str, type: type = str, default: Any = _REQUIRED, rest: bool = False):
+        self.name: str = name
+        self.type: type = type
+        self.default: Any = default
+        # Trueの場合は残りの文字列全体 (空白を含む) を一つの引数として受け取る
+        self.rest: bool = rest
+
+    @property
+    def required(self) -> bool:
+        return self.default is _REQUIRED
+
+    def convert(self, value: str) -> Any:
+        if self.type is int:
+            if not value.isdecimal():
+                raise ArgumentError(f"{self.name} must be a number")
+            return int(value)
+        return value
+
+
+# メッセージ以外 (将来的にはスラッシュコマンドのインタラクションなど) からも呼び出せるようにする
+class Context(object):
+    __slots__ = ("author", "channel", "is_dm")
+
+    def __init__(self, author: Any, channel: Any, is_dm: bool = False):
+        self.author: Any = author
+        self.channel: Any = channel
+        self.is_dm: bool = is_dm
+
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class Command(object):
+    def __init__(self, name: str, handler: Handler, args: Tuple[Arg, ...], dm: bool):
+        self.name: str = name
+        self.handler: Handler = handler
+        self.args: Tuple[Arg, ...] = args
+        self.dm: bool = dm
+        self.latency: QueueMetrics = QueueMetrics()
+
+        # スキーマは登録時に一度だけ検証する
+        for i, arg in enumerate(args):
+            if arg.rest and i != len(args) - 1:
+                raise ValueError(f"{name}: only the last argument can take the rest of the message")
+            if i > 0 and args[i - 1].default is not _REQUIRED and arg.required:
+                raise ValueError(f"{name}: required argument {arg.name} follows an optional one")
+        self._min_args: int = sum(1 for arg in args if arg.required)
+        self._has_rest: bool = bool(args) and args[-1].rest
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        if self._has_rest:
+            values: List[str] = text.split(None, len(self.args) - 1) if text else []
+            if len(values) == len(self.args):
+                values[-1] = values[-1].strip()
+        else:
+            values = text.split()
+        if len(values) < self._min_args or len(values) > len(self.args):
+            raise ArgumentError(f"{self.name} takes {self._min_args} to {len(self.args)} arguments")
+
+        kwargs = {}
+        for i, arg in enumerate(self.args):
+            if i < len(values):
+                kwargs[arg.name] = arg.convert(values[i])
+            elif not arg.required:
+                kwargs[arg.name] = arg.default
+        return kwargs
+
+
+class CommandRegistry(object):
+    def __init__(self, on_invalid: Callable[[Context], Awaitable[Any]]):
+        self.on_invalid: Callable[[Context], Awaitable[Any]] = on_invalid
+        self.guild_commands: Dict[str, Command] = {}
+        self.dm_commands: Dict[str, Command] = {}
+
+    def command(self, name: str, *args: Arg, dm: bool = False) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            table = self.dm_commands if dm else self.guild_commands
+            if name in table:
+                raise ValueError(f"{name} is already registered")
+            table[name] = Command(name, handler, args, dm)
+            return handler
+
+        return decorator
+
+    def lookup(self, name: str, dm: bool = False) -> Optional[Command]:
+        return (self.dm_commands if dm else self.guild_commands).get(name)
+
+    # "/name arg..." を名前と残りに分け、該当するコマンドを返す
+    def resolve(self, content: str, dm: bool = False) -> Tuple[Optional[Command], str]:
+        parts = content.split(None, 1)
+        if not parts:
+            return None, ""
+        return self.lookup(parts[0], dm), parts[1] if len(parts) == 2 else ""
+
+    async def dispatch(self, command: Command, ctx: Context, text: str):
+        start = time.monotonic()
+        try:
+            try:
+                kwargs = command.parse(text)
+            except ArgumentError:
+                await self.on_invalid(ctx)
+                return
+            await command.handler(ctx, **kwargs)
+        finally:
+            command.latency.observe(time.monotonic() - start)
+
+    def stats(self) -> Dict[str, object]:
+        stats = {}
+        for command in list(self.guild_commands.values()) + list(self.dm_commands.values()):
+            key = "dm " + command.name if command.dm else command.name
+            stats[key] = command.latency.snapshot()
+        return stats
@@ -0,0 +1,125 @@
+import os
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple, TypeVar
+from ddragon import ChampionSync, DataDragon
+from game_registry import GameRegistry
+from outbox import Outbox
+from shard import parse_peers, parse_shard_ids
+
+T = TypeVar("T")
+
+
+class ConfigError(Exception):
+    def __init__(self, problems: List[str]):
+        super().__init__("Invalid configuration:\n" + "\n".join(problems))
+        self.problems: List[str] = problems
+
+
+# 環境変数から起動時に一度だけ読み込み、全ての問題をまとめて報告する
+class Config(NamedTuple):
+    discord_token: str
+    riot_api_key: str
+    shard_count: int = 1
+    shard_ids: Tuple[int, ...] = (0,)
+    shard_directory: str = "members.db"
+    shard_peers: Optional[Dict[int, str]] = None
+    shard_bus_port: int = 0
+    # 転送されたDMを受け付ける際に照合する、全プロセスで共通の秘密鍵
+    shard_secret: str = ""
+    # シミュレータなどからスタブサーバや一時ファイルに差し替えられるようにする
+    riot_api_base_url: Optional[str] = None
+    games_db: str = "games.db"
+    summoners_db: str = "summoners.db"
+    # どちらも指定しない場合は計測用のタスクやAPIのラップを一切行わない
+    metrics_port: Optional[int] = None
+    metrics_host: str = "127.0.0.1"
+    metrics_log_interval: float = 0.0
+    # 操作の無いゲームを破棄するまでの秒数と、同時に保持するゲーム数の上限
+    game_idle_ttl: float = GameRegistry.DEFAULT_TTL
+    max_games: int = GameRegistry.DEFAULT_MAX_GAMES
+    # 結果画像を描画するプロセス数 (0の場合は描画しない) と、日本語名を描画する場合のフォント
+    card_workers: int = 1
+    card_font: Optional[str] = None
+    # チャンピオン情報の取得元 (Data DragonのURLまたは同じ構成のディレクトリ、空の場合は更新しない)
+    champions_db: str = "champions.db"
+    ddragon_url: str = DataDragon.DEFAULT_URL
+    ddragon_locale: str = "ja_JP"
+    ddragon_sync_interval: float = ChampionSync.DEFAULT_INTERVAL
+    # チャンネルへの発言をまとめて送るまでの待ち時間 (秒)
+    outbox_debounce: float = Outbox.DEFAULT_DEBOUNCE
+    # 試合結果と成績、取り込み待ちのジョブを保存するデータベース
+    history_db: str = "history.db"
+
+    @property
+    def metrics_enabled(self) -> bool:
+        return self.metrics_port is not None or self.metrics_log_interval > 0
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> "Config":
+        environ = os.environ if environ is None else environ
+        problems: List[str] = []
+
+        def parse(
+            name: str, convert: Callable[[str], T], default: T, check: Optional[Callable[[T], bool]] = None
+        ) -> T:
+            text = environ.get(name)
+            if text is None or text == "":
+                return default
+            try:
+                value = convert(text)
+            except ValueError:
+                problems.append(f"{name}: cannot parse {text!r}")
+                return default
+            if check is not None and not check(value):
+                problems.append(f"{name}: {text!r} is out of range")
+                return default
+            return value
+
+        def required(name: str) -> str:
+            value = environ.get(name, "")
+            if not value:
+                problems.append(f"{name}: required")
+            return value
+
+        shard_count = parse("SHARD_COUNT", int, 1, lambda value: value >= 1)
+        shard_ids = parse("SHARD_IDS", parse_shard_ids, list(range(shard_count)))
+        if any(shard_id < 0 or shard_id >= shard_count for shard_id in shard_ids):
+            problems.append(f"SHARD_IDS: {shard_ids} is not within 0-{shard_count - 1}")
+        shard_peers = parse("SHARD_PEERS", parse_peers, None)
+        shard_secret = environ.get("SHARD_SECRET", "")
+        if shard_peers is not None and not shard_secret:
+            problems.append("SHARD_SECRET: required when SHARD_PEERS is set")
+        card_font = environ.get("CARD_FONT") or None
+        if card_font is not None and not os.path.exists(card_font):
+            problems.append(f"CARD_FONT: {card_font} does not exist")
+
+        config = cls(
+            discord_token=required("DISCORD_TOKEN"),
+            riot_api_key=required("RIOT_API_KEY"),
+            shard_count=shard_count,
+            shard_ids=tuple(shard_ids),
+            shard_directory=environ.get("SHARD_DIRECTORY", "members.db"),
+            shard_peers=shard_peers,
+            shard_bus_port=parse("SHARD_BUS_PORT", int, 0, lambda value: 0 <= value < 65536),
+            shard_secret=shard_secret,
+            riot_api_base_url=environ.get("RIOT_API_BASE_URL") or None,
+            games_db=environ.get("GAMES_DB", "games.db"),
+            summoners_db=environ.get("SUMMONERS_DB", "summoners.db"),
+            metrics_port=parse("METRICS_PORT", int, None, lambda value: 0 <= value < 65536),
+            metrics_host=environ.get("METRICS_HOST", "127.0.0.1"),
+            metrics_log_interval=parse("METRICS_LOG_INTERVAL", float, 0.0, lambda value: value >= 0),
+            game_idle_ttl=parse("GAME_IDLE_TTL", float, GameRegistry.DEFAULT_TTL, lambda value: value > 0),
+            max_games=parse("MAX_GAMES", int, GameRegistry.DEFAULT_MAX_GAMES, lambda value: value >= 1),
+            card_workers=parse("CARD_WORKERS", int, 1, lambda value: value >= 0),
+            card_font=card_font,
+            champions_db=environ.get("CHAMPIONS_DB", "champions.db"),
+            ddragon_url=environ.get("DDRAGON_URL", DataDragon.DEFAULT_URL),
+            ddragon_locale=environ.get("DDRAGON_LOCALE", "ja_JP"),
+            ddragon_sync_interval=parse(
+                "DDRAGON_SYNC_INTERVAL", float, ChampionSync.DEFAULT_INTERVAL, lambda value: value > 0
+            ),
+            outbox_debounce=parse("OUTBOX_DEBOUNCE", float, Outbox.DEFAULT_DEBOUNCE, lambda value: value >= 0),
+            history_db=environ.get("HISTORY_DB", "history.db"),
+        )
+        if problems:
+            raise ConfigError(problems)
+        return config
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import os
+import sys
+import aiohttp
+from typing import Any, Callable, List, Optional
+from champion import Champion, ChampionDiff, ChampionRegistry, ChampionStore, parse_champions
+
+
+class DataDragonError(Exception):
+    pass
+
+
+# Data Dragonと同じ構成 (api/versions.json, cdn/<version>/...) のURLかローカルのディレクトリから読む
+class DataDragon(object):
+    DEFAULT_URL = "https://ddragon.leagueoflegends.com"
+
+    def __init__(self, base: str = DEFAULT_URL, locale: str = "ja_JP", timeout: float = 30.0):
+        self.base: str = base.rstrip("/")
+        self.locale: str = locale
+        self.timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def is_remote(self) -> bool:
+        return self.base.startswith("http://") or self.base.startswith("https://")
+
+    async def _read(self, path: str) -> bytes:
+        if not self.is_remote:
+            local = os.path.join(self.base, *path.split("/"))
+            try:
+                return await asyncio.get_event_loop().run_in_executor(None, _read_file, local)
+            except OSError as e:
+                raise DataDragonError(str(e))
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        try:
+            async with self._session.get(self.base + "/" + path) as response:
+                if response.status != 200:
+                    raise DataDragonError(f"{path} returned {response.status}")
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise DataDragonError(f"{path}: {e!r}")
+
+    async def latest_version(self) -> str:
+        versions = json.loads(await self._read("api/versions.json"))
+        if not versions:
+            raise DataDragonError("no versions available")
+        return versions[0]
+
+    async def champions(self, version: str) -> List[Champion]:
+        data = json.loads(await self._read(f"cdn/{version}/data/{self.locale}/champion.json"))
+        return parse_champions(data)
+
+    async def image(self, version: str, image: str) -> bytes:
+        return await self._read(f"cdn/{version}/img/champion/{image}")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, data: bytes):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+# 新しいパッチが出た場合のみ、追加・変更されたチャンピオンの画像とデータを取り込み、実行中のレジストリを差し替える
+class ChampionSync(object):
+    DEFAULT_INTERVAL = 6 * 60 * 60
+    RETRY_DELAY = 60.0
+    MAX_DOWNLOADS = 8
+
+    def __init__(
+        self,
+        registry: ChampionRegistry,
+        store: ChampionStore,
+        dragon: DataDragon,
+        image_dir: str = "resources/champion",
+        on_images_changed: Optional[Callable[[], Any]] = None,
+    ):
+        self.registry: ChampionRegistry = registry
+        self.store: ChampionStore = store
+        self.dragon: DataDragon = dragon
+        self.image_dir: str = image_dir
+        self.on_images_changed: Optional[Callable[[], Any]] = on_images_changed
+        self.last_error: Optional[Exception] = None
+        self.failures: int = 0
+        self._task: Optional[asyncio.Future] = None
+
+    async def sync(self) -> Optional[ChampionDiff]:
+        version = await self.dragon.latest_version()
+        if version == self.store.version:
+            return None
+
+        champions = await self.dragon.champions(version)
+        diff = self.store.diff(champions)
+
+        # 画像が手元に無いものだけを取得する
+        missing = set(
+            champion.image
+            for champion in champions
+            if not os.path.exists(os.path.join(self.image_dir, champion.image))
+        )
+        semaphore = asyncio.Semaphore(ChampionSync.MAX_DOWNLOADS)
+
+        async def download(image: str):
+            async with semaphore:
+                data = await self.dragon.image(version, image)
+            await asyncio.get_event_loop().run_in_executor(
+                None, _write_file, os.path.join(self.image_dir, image), data
+            )
+
+        await asyncio.gather(*[download(image) for image in sorted(missing)])
+
+        self.store.apply(version, diff)
+        self.registry.swap(version, champions)
+        if missing and self.on_images_changed is not None:
+            self.on_images_changed()
+        return diff
+
+    def start(self, interval: float = DEFAULT_INTERVAL, retry_delay: float = RETRY_DELAY):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run(interval, retry_delay))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, interval: float, retry_delay: float):
+        while True:
+            delay = interval
+            try:
+                diff = await self.sync()
+                self.last_error = None
+                self.failures = 0
+                if diff is not None:
+                    print(
+                        "Champion data updated to {}: {} added, {} changed, {} removed".format(
+                            self.registry.version, len(diff.added), len(diff.changed), len(diff.removed)
+                        )
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 画像の書き込みやSQLiteのエラーでもタスクを止めず、間隔を広げながら再試行する
+                self.last_error = e
+                self.failures += 1
+                delay = min(interval, retry_delay * 2 ** (self.failures - 1))
+                print("Failed to sync champion data: {!r}".format(e))
+            await asyncio.sleep(delay)
+
+
+# python ddragon.py <URLまたはディレクトリ> で一度だけ同期する
+async def _main(args: List[str]):
+    base = args[0] if len(args) > 0 else DataDragon.DEFAULT_URL
+    store = ChampionStore(args[1] if len(args) > 1 else "champions.db")
+    registry = ChampionRegistry("resources/champion.json", store)
+    dragon = DataDragon(base)
+    try:
+        registry.load()
+        diff = await ChampionSync(registry, store, dragon).sync()
+    finally:
+        await dragon.close()
+        store.close()
+    if diff is None:
+        print("Already up to date ({})".format(registry.version))
+    else:
+        print(
+            "Updated to {}: added {}, changed {}, removed {}".format(
+                registry.version,
+                [c.id for c in diff.added],
+                [c.id for c in diff.changed],
+                [c.id for c in diff.removed],
+            )
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
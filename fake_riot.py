@@ -0,0 +1,180 @@
+import time
+from aiohttp import web
+from typing import Any, Dict, List, Optional
+from ratelimit import parse_rate_limit
+from summoner_cache import normalize_name
+
+
+# テスト用にオフラインで動作するRiot APIのスタブサーバ
+class FakeRiotServer(object):
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host: str = host
+        self.port: int = port
+        self.summoners: Dict[str, Dict[str, Any]] = {}
+        self.active_games: Dict[str, Dict[str, Any]] = {}
+        self.matches: Dict[str, Dict[str, Any]] = {}
+        self.league_entries: Dict[str, List[Dict[str, Any]]] = {}
+        self.requests: List[str] = []
+        self.app_rate_limit: str = "20:1,100:120"
+        self.method_rate_limit: str = "2000:60"
+        self.throttled: int = 0
+        self.retry_after: int = 1
+        # 制限ごとの (ウィンドウの開始時刻, リクエスト数)
+        self._windows: Dict[tuple, List[float]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app: web.Application = web.Application()
+        self.app.router.add_get("/lol/summoner/v4/summoners/by-name/{name}", self._summoner_by_name)
+        self.app.router.add_get("/lol/summoner/v4/summoners/{id}", self._summoner_by_id)
+        self.app.router.add_get("/lol/spectator/v4/active-games/by-summoner/{id}", self._active_game)
+        self.app.router.add_get("/lol/match/v5/matches/{match_id}", self._match)
+        self.app.router.add_get("/lol/league/v4/entries/by-summoner/{id}", self._league_entries)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def add_summoner(self, name: str, summoner_id: Optional[str] = None) -> Dict[str, Any]:
+        summoner_id = summoner_id or f"id-{name}"
+        summoner = {
+            "id": summoner_id,
+            "accountId": f"account-{summoner_id}",
+            "puuid": f"puuid-{summoner_id}",
+            "name": name,
+            "summonerLevel": 30,
+        }
+        self.summoners[normalize_name(name)] = summoner
+        return summoner
+
+    # participants は (サモナーネーム, チャンピオンID) のリスト
+    def start_game(self, participants: List[tuple], game_id: int = 1) -> Dict[str, Any]:
+        game = {"gameId": game_id, "gameStartTime": 0, "participants": []}
+        for i, (name, champion_id) in enumerate(participants):
+            summoner = self.summoners.get(normalize_name(name)) or self.add_summoner(name)
+            game["participants"].append(
+                {
+                    "summonerId": summoner["id"],
+                    "summonerName": summoner["name"],
+                    "championId": champion_id,
+                    "teamId": 100 if i < len(participants) // 2 else 200,
+                }
+            )
+        for participant in game["participants"]:
+            self.active_games[participant["summonerId"]] = game
+        return game
+
+    def end_game(self, game_id: int = 1):
+        self.active_games = {k: v for k, v in self.active_games.items() if v["gameId"] != game_id}
+
+    # ソロ/デュオのランクを設定する (tierがNoneの場合はランク無し)
+    def set_rank(self, name: str, tier: Optional[str], rank: str = "IV", league_points: int = 0):
+        summoner = self.summoners.get(normalize_name(name)) or self.add_summoner(name)
+        if tier is None:
+            self.league_entries.pop(summoner["id"], None)
+            return
+        self.league_entries[summoner["id"]] = [
+            {
+                "queueType": "RANKED_SOLO_5x5",
+                "summonerId": summoner["id"],
+                "summonerName": summoner["name"],
+                "tier": tier,
+                "rank": rank,
+                "leaguePoints": league_points,
+                "wins": 10,
+                "losses": 10,
+            }
+        ]
+
+    # 試合を終了し、match-v5で結果を取得できるようにする
+    def finish_game(self, game_id: int = 1, winning_team: int = 100, platform: str = "JP1") -> Dict[str, Any]:
+        game = next(v for v in self.active_games.values() if v["gameId"] == game_id)
+        match_id = f"{platform}_{game_id}"
+        participants = []
+        for participant in game["participants"]:
+            summoner = next(s for s in self.summoners.values() if s["id"] == participant["summonerId"])
+            participants.append(
+                {
+                    "puuid": summoner["puuid"],
+                    "summonerId": summoner["id"],
+                    "summonerName": summoner["name"],
+                    "championId": participant["championId"],
+                    "teamId": participant["teamId"],
+                    "win": participant["teamId"] == winning_team,
+                    "kills": 0,
+                    "deaths": 0,
+                    "assists": 0,
+                }
+            )
+        self.matches[match_id] = {
+            "metadata": {"matchId": match_id},
+            "info": {"gameId": game_id, "gameDuration": 1800, "participants": participants},
+        }
+        self.end_game(game_id)
+        return self.matches[match_id]
+
+    # 次の n 回のリクエストに429を返す
+    def throttle(self, n: int = 1, retry_after: int = 1):
+        self.throttled = n
+        self.retry_after = retry_after
+
+    # 本物のAPIと同様に、最初のリクエストから始まる固定ウィンドウで数える
+    # メソッドの制限は簡単のため全てのエンドポイントで共通とする
+    def _count(self, kind: str, limits: str) -> str:
+        now = time.monotonic()
+        counts = []
+        for limit, window in parse_rate_limit(limits):
+            state = self._windows.get((kind, window))
+            if state is None or now >= state[0] + window:
+                state = self._windows[(kind, window)] = [now, 0]
+            state[1] += 1
+            counts.append("{}:{}".format(int(state[1]), int(window)))
+        return ",".join(counts)
+
+    def _respond(self, body: Any) -> web.Response:
+        headers = {
+            "X-App-Rate-Limit": self.app_rate_limit,
+            "X-App-Rate-Limit-Count": self._count("app", self.app_rate_limit),
+            "X-Method-Rate-Limit": self.method_rate_limit,
+            "X-Method-Rate-Limit-Count": self._count("method", self.method_rate_limit),
+        }
+        if self.throttled > 0:
+            self.throttled -= 1
+            headers["Retry-After"] = str(self.retry_after)
+            headers["X-Rate-Limit-Type"] = "method"
+            return web.json_response({"status": {"status_code": 429}}, status=429, headers=headers)
+        if body is None:
+            return web.json_response({"status": {"status_code": 404}}, status=404, headers=headers)
+        return web.json_response(body, headers=headers)
+
+    async def _summoner_by_name(self, request: web.Request) -> web.Response:
+        self.requests.append(request.path)
+        return self._respond(self.summoners.get(normalize_name(request.match_info["name"])))
+
+    async def _summoner_by_id(self, request: web.Request) -> web.Response:
+        self.requests.append(request.path)
+        summoners = [s for s in self.summoners.values() if s["id"] == request.match_info["id"]]
+        return self._respond(summoners[0] if summoners else None)
+
+    async def _active_game(self, request: web.Request) -> web.Response:
+        self.requests.append(request.path)
+        return self._respond(self.active_games.get(request.match_info["id"]))
+
+    async def _league_entries(self, request: web.Request) -> web.Response:
+        self.requests.append(request.path)
+        return self._respond(self.league_entries.get(request.match_info["id"], []))
+
+    async def _match(self, request: web.Request) -> web.Response:
+        self.requests.append(request.path)
+        return self._respond(self.matches.get(request.match_info["match_id"]))
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,72 @@
+import asyncio
+import time
+import discord
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+from metrics import QueueMetrics
+
+T = TypeVar("T")
+
+
+class FanOutResult(object):
+    def __init__(self, label: str, total: int, failures: List[Tuple[Any, Exception]], elapsed: float):
+        self.label: str = label
+        self.total: int = total
+        self.failures: List[Tuple[Any, Exception]] = failures
+        self.elapsed: float = elapsed
+
+    @property
+    def sent(self) -> int:
+        return self.total - len(self.failures)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures
+
+
+def _retry_after(e: discord.HTTPException) -> Optional[float]:
+    if getattr(e, "status", None) != 429:
+        return None
+    retry_after = getattr(e, "retry_after", None)
+    if retry_after is None and getattr(e, "response", None) is not None:
+        retry_after = e.response.headers.get("Retry-After")
+    return float(retry_after) if retry_after is not None else 1.0
+
+
+# 複数の相手へのDiscord API呼び出しを、同時実行数を制限しながら並行に行う
+class FanOut(object):
+    DEFAULT_LIMIT = 5
+    MAX_RETRIES = 3
+
+    def __init__(self, limit: int = DEFAULT_LIMIT, max_retries: int = MAX_RETRIES):
+        self.limit: int = limit
+        self.max_retries: int = max_retries
+        self.durations: Dict[str, QueueMetrics] = {}
+
+    async def _call(self, semaphore: asyncio.Semaphore, func: Callable[[T], Awaitable[Any]], target: T):
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await func(target)
+                except discord.HTTPException as e:
+                    retry_after = _retry_after(e)
+                    if retry_after is None or attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(retry_after)
+
+    async def run(self, targets: Iterable[T], func: Callable[[T], Awaitable[Any]], label: str = "") -> FanOutResult:
+        targets = list(targets)
+        semaphore = asyncio.Semaphore(self.limit)
+        start = time.monotonic()
+        results = await asyncio.gather(
+            *[self._call(semaphore, func, target) for target in targets], return_exceptions=True
+        )
+        elapsed = time.monotonic() - start
+
+        failures = [(target, result) for target, result in zip(targets, results) if isinstance(result, Exception)]
+        if label not in self.durations:
+            self.durations[label] = QueueMetrics()
+        self.durations[label].observe(elapsed)
+        return FanOutResult(label, len(targets), failures, elapsed)
+
+    def stats(self) -> Dict[str, object]:
+        return {label: metrics.snapshot() for label, metrics in self.durations.items()}
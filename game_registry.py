@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, List, Optional
+
+
+class _Entry(object):
+    __slots__ = ("game", "last_active")
+
+    def __init__(self, game: Any, last_active: float):
+        self.game: Any = game
+        self.last_active: float = last_active
+
+
+# チャンネルIDからゲームを引く表
+# 最後に操作された順に並べておき、一定時間操作の無いゲームや上限を超えた分を古い順に破棄する
+# ゲームには busy (タイマーや監視が動いているか)、evictable (上限に達した時に破棄してよいか)、close() を要求する
+class GameRegistry(object):
+    DEFAULT_TTL = 2 * 60 * 60
+    DEFAULT_MAX_GAMES = 10000
+    SWEEP_INTERVAL = 60.0
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_games: int = DEFAULT_MAX_GAMES):
+        self.ttl: float = ttl
+        self.max_games: int = max_games
+        self.evicted: int = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_sweep: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._entries
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter([entry.game for entry in self._entries.values()])
+
+    def get(self, channel_id: int) -> Optional[Any]:
+        self.sweep()
+        entry = self._entries.get(channel_id)
+        if entry is None:
+            return None
+        self._touch(channel_id, entry)
+        return entry.game
+
+    # 上限に達していて破棄できるゲームも無い場合はFalseを返す
+    def add(self, game: Any) -> bool:
+        self.sweep()
+        channel_id = game.channel.id
+        if channel_id not in self._entries and len(self._entries) >= self.max_games:
+            if not self._evict_oldest():
+                return False
+        self._entries[channel_id] = _Entry(game, time.monotonic())
+        self._entries.move_to_end(channel_id)
+        return True
+
+    def touch(self, channel_id: int):
+        entry = self._entries.get(channel_id)
+        if entry is not None:
+            self._touch(channel_id, entry)
+
+    def _touch(self, channel_id: int, entry: _Entry):
+        entry.last_active = time.monotonic()
+        self._entries.move_to_end(channel_id)
+
+    def remove(self, channel_id: int):
+        entry = self._entries.pop(channel_id, None)
+        if entry is not None:
+            entry.game.close()
+            self.evicted += 1
+
+    def _evict_oldest(self) -> bool:
+        for channel_id, entry in self._entries.items():
+            if entry.game.evictable:
+                self.remove(channel_id)
+                return True
+        return False
+
+    # 古い順に並んでいるため、期限内のゲームが見つかった時点で打ち切れる
+    def sweep(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now < self._next_sweep:
+            return
+        self._next_sweep = now + GameRegistry.SWEEP_INTERVAL
+
+        expired: List[int] = []
+        for channel_id, entry in self._entries.items():
+            if now - entry.last_active < self.ttl:
+                break
+            expired.append(channel_id)
+        for channel_id in expired:
+            entry = self._entries[channel_id]
+            # フェーズのタイマーや試合の監視を待っているゲームは操作が無くても残す
+            if entry.game.busy:
+                self._touch(channel_id, entry)
+            else:
+                self.remove(channel_id)
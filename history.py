@@ -0,0 +1,173 @@
+import sqlite3
+from typing import Iterable, List, NamedTuple, Optional
+
+# 村人は試合に勝つか人狼に投票すると、人狼は試合に負けるか投票で選ばれなければ得点する
+VILLAGER_WIN_POINTS = 1
+VILLAGER_CORRECT_VOTE_POINTS = 1
+WOLF_LOSE_POINTS = 2
+WOLF_ESCAPE_POINTS = 1
+
+
+class PlayerResult(NamedTuple):
+    member_id: int
+    team: str
+    is_wolf: bool
+    voted_correctly: bool
+    elected: bool
+    # 試合結果を取得できなかった場合はNone
+    won: Optional[bool] = None
+
+    # 役職としての勝利 (人狼は自チームが負けた場合)
+    @property
+    def victory(self) -> bool:
+        if self.won is None:
+            return False
+        return not self.won if self.is_wolf else self.won
+
+    @property
+    def score(self) -> int:
+        if self.is_wolf:
+            return (WOLF_LOSE_POINTS if self.won is False else 0) + (0 if self.elected else WOLF_ESCAPE_POINTS)
+        return (VILLAGER_WIN_POINTS if self.won else 0) + (VILLAGER_CORRECT_VOTE_POINTS if self.voted_correctly else 0)
+
+
+class PlayerStats(NamedTuple):
+    member_id: int
+    games: int
+    wins: int
+    wolf_games: int
+    wolf_wins: int
+    correct_votes: int
+    score: int
+
+
+# 試合ごとの結果を追記し、集計値はプレイヤーごとの行に積み上げておく
+# ランキングや個人成績は集計済みの行を索引から引くだけなので、記録した試合数に関わらず一定の時間で返せる
+class HistoryStore(object):
+    def __init__(self, path: str = "history.db"):
+        self.db: sqlite3.Connection = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS games ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL UNIQUE, guild_id INTEGER NOT NULL, "
+            "channel_id INTEGER NOT NULL, match_id TEXT, finished_at REAL NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "game_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, member_id INTEGER NOT NULL, team TEXT NOT NULL, "
+            "is_wolf INTEGER NOT NULL, voted_correctly INTEGER NOT NULL, elected INTEGER NOT NULL, won INTEGER, "
+            "score INTEGER NOT NULL, finished_at REAL NOT NULL, PRIMARY KEY (game_id, member_id)) WITHOUT ROWID"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS results_member ON results (guild_id, member_id, finished_at DESC)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS player_stats ("
+            "guild_id INTEGER NOT NULL, member_id INTEGER NOT NULL, games INTEGER NOT NULL DEFAULT 0, "
+            "wins INTEGER NOT NULL DEFAULT 0, wolf_games INTEGER NOT NULL DEFAULT 0, "
+            "wolf_wins INTEGER NOT NULL DEFAULT 0, correct_votes INTEGER NOT NULL DEFAULT 0, "
+            "score INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (guild_id, member_id)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS player_stats_score ON player_stats (guild_id, score DESC)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS player_stats_member ON player_stats (member_id)")
+        self.db.commit()
+
+    # keyが記録済みの場合は何もせずFalseを返すため、同じ試合を再試行しても二重に数えない
+    def record(
+        self,
+        key: str,
+        guild_id: int,
+        channel_id: int,
+        match_id: Optional[str],
+        finished_at: float,
+        results: Iterable[PlayerResult],
+    ) -> bool:
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO games (key, guild_id, channel_id, match_id, finished_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, guild_id, channel_id, match_id, finished_at),
+            )
+            if cursor.rowcount == 0:
+                return False
+            game_id = cursor.lastrowid
+            results = list(results)
+            self.db.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        game_id,
+                        guild_id,
+                        r.member_id,
+                        r.team,
+                        r.is_wolf,
+                        r.voted_correctly,
+                        r.elected,
+                        r.won,
+                        r.score,
+                        finished_at,
+                    )
+                    for r in results
+                ],
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO player_stats (guild_id, member_id) VALUES (?, ?)",
+                [(guild_id, r.member_id) for r in results],
+            )
+            self.db.executemany(
+                "UPDATE player_stats SET games = games + 1, wins = wins + ?, wolf_games = wolf_games + ?, "
+                "wolf_wins = wolf_wins + ?, correct_votes = correct_votes + ?, score = score + ? "
+                "WHERE guild_id = ? AND member_id = ?",
+                [
+                    (r.victory, r.is_wolf, r.is_wolf and r.victory, r.voted_correctly, r.score, guild_id, r.member_id)
+                    for r in results
+                ],
+            )
+        return True
+
+    def leaderboard(self, guild_id: int, limit: int = 10) -> List[PlayerStats]:
+        return [
+            PlayerStats(*row)
+            for row in self.db.execute(
+                "SELECT member_id, games, wins, wolf_games, wolf_wins, correct_votes, score FROM player_stats "
+                "WHERE guild_id = ? ORDER BY score DESC LIMIT ?",
+                (guild_id, limit),
+            )
+        ]
+
+    # guild_idを省略した場合は全サーバーの合計
+    def stats(self, member_id: int, guild_id: Optional[int] = None) -> Optional[PlayerStats]:
+        if guild_id is not None:
+            row = self.db.execute(
+                "SELECT member_id, games, wins, wolf_games, wolf_wins, correct_votes, score FROM player_stats "
+                "WHERE guild_id = ? AND member_id = ?",
+                (guild_id, member_id),
+            ).fetchone()
+        else:
+            row = self.db.execute(
+                "SELECT member_id, SUM(games), SUM(wins), SUM(wolf_games), SUM(wolf_wins), SUM(correct_votes), "
+                "SUM(score) FROM player_stats WHERE member_id = ? GROUP BY member_id",
+                (member_id,),
+            ).fetchone()
+        return PlayerStats(*row) if row is not None else None
+
+    def recent(self, member_id: int, guild_id: int, limit: int = 10) -> List[PlayerResult]:
+        return [
+            PlayerResult(
+                member_id,
+                team,
+                bool(is_wolf),
+                bool(voted_correctly),
+                bool(elected),
+                None if won is None else bool(won),
+            )
+            for team, is_wolf, voted_correctly, elected, won in self.db.execute(
+                "SELECT team, is_wolf, voted_correctly, elected, won FROM results "
+                "WHERE guild_id = ? AND member_id = ? ORDER BY finished_at DESC LIMIT ?",
+                (guild_id, member_id, limit),
+            )
+        ]
+
+    def close(self):
+        self.db.close()
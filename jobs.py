@@ -0,0 +1,143 @@
+import asyncio
+import json
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# 成功した場合はTrue、後で再試行する場合はFalseを返す (最後の試行ではfinal=Trueで呼ばれる)
+JobHandler = Callable[[Dict[str, Any], bool], Awaitable[bool]]
+
+
+# SQLiteに永続化するジョブキュー
+# 失敗したジョブは指数的に間隔を空けて再試行し、再起動しても残ったジョブから再開する
+class JobQueue(object):
+    MAX_ATTEMPTS = 6
+    BASE_DELAY = 30.0
+    MAX_DELAY = 30 * 60.0
+
+    def __init__(
+        self,
+        path: str,
+        handler: JobHandler,
+        max_attempts: int = MAX_ATTEMPTS,
+        base_delay: float = BASE_DELAY,
+        concurrency: int = 2,
+    ):
+        self.handler: JobHandler = handler
+        self.max_attempts: int = max_attempts
+        self.base_delay: float = base_delay
+        self.concurrency: int = concurrency
+        self.completed: int = 0
+        self.retried: int = 0
+        self.failed: int = 0
+        self.db: sqlite3.Connection = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, run_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_run_at ON jobs (run_at)")
+        self.db.commit()
+        self._running: Dict[int, asyncio.Future] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Future] = None
+        self.closed: bool = False
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def enqueue(self, payload: Dict[str, Any]) -> int:
+        cursor = self.db.execute(
+            "INSERT INTO jobs (payload, run_at) VALUES (?, ?)", (json.dumps(payload), time.time())
+        )
+        self.db.commit()
+        self._ensure_running()
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    # 起動時に、前回の実行で残ったジョブの処理を始める
+    def start(self):
+        self._ensure_running()
+
+    def pending(self) -> int:
+        # 終了後にメトリクスが収集されても落ちないようにする
+        if self.closed:
+            return 0
+        return self.db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for future in list(self._running.values()):
+            future.cancel()
+
+    def close(self):
+        self.stop()
+        self.closed = True
+        self.db.close()
+
+    def _due(self, now: float, limit: int) -> List[Tuple[int, str, int]]:
+        running = list(self._running)
+        query = "SELECT id, payload, attempts FROM jobs WHERE run_at <= ?"
+        if running:
+            query += " AND id NOT IN ({})".format(",".join("?" * len(running)))
+        return self.db.execute(query + " ORDER BY run_at LIMIT ?", [now] + running + [limit]).fetchall()
+
+    def _next_run_at(self) -> Optional[float]:
+        running = list(self._running)
+        query = "SELECT MIN(run_at) FROM jobs"
+        if running:
+            query += " WHERE id NOT IN ({})".format(",".join("?" * len(running)))
+        return self.db.execute(query, running).fetchone()[0]
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            for job_id, payload, attempts in self._due(now, self.concurrency - len(self._running)):
+                future = asyncio.ensure_future(self._execute(job_id, json.loads(payload), attempts))
+                self._running[job_id] = future
+                future.add_done_callback(lambda _: self._wakeup.set())
+
+            run_at = self._next_run_at()
+            timeout = None if run_at is None else max(run_at - now, 0.0)
+            if len(self._running) >= self.concurrency:
+                timeout = None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job_id: int, payload: Dict[str, Any], attempts: int):
+        final = attempts + 1 >= self.max_attempts
+        try:
+            done = await self.handler(payload, final)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("Job {} failed (attempt {}): {!r}".format(job_id, attempts + 1, e))
+            done = False
+        finally:
+            self._running.pop(job_id, None)
+
+        if done:
+            self.completed += 1
+            self.db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        elif final:
+            self.failed += 1
+            print("Job {} gave up after {} attempts".format(job_id, attempts + 1))
+            self.db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        else:
+            self.retried += 1
+            delay = min(self.base_delay * 2 ** attempts, JobQueue.MAX_DELAY)
+            self.db.execute(
+                "UPDATE jobs SET attempts = ?, run_at = ? WHERE id = ?", (attempts + 1, time.time() + delay, job_id)
+            )
+        self.db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": self.pending(), "completed": self.completed, "retried": self.retried, "failed": self.failed}
@@ -1,76 +1,304 @@
 import discord
 import random
+import argparse
 import asyncio
-import os
+import io
 import json
-import urllib
-import requests
-from transitions import Machine
-from typing import List, Dict, Optional
-
-TOKEN = os.environ["DISCORD_TOKEN"]
-RIOT_API_KEY = os.environ["RIOT_API_KEY"]
+import sys
+import time
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+from balance import POSITIONS, balance, fill_unranked, rating
+from card import CardPlayer, ResultCard, ResultCardRenderer
+from champion import ChampionRegistry, ChampionStore
+from command import Arg, CommandRegistry, Context
+from config import Config, ConfigError
+from ddragon import ChampionSync, DataDragon
+from message import CatalogError, MessageCatalog
+from outbox import Outbox
+from metrics import (
+    DiscordMetrics,
+    LoopLagMonitor,
+    Metric,
+    Metrics,
+    MetricsLogger,
+    MetricsServer,
+    collect_commands,
+    collect_fanout,
+    collect_riot,
+)
+from fanout import FanOut, FanOutResult
+from game_registry import GameRegistry
+from history import HistoryStore, PlayerResult
+from jobs import JobQueue
+from player import PlayerRegistry, Seat, User
+from riot import RiotClient, RiotAPIError
+from store import GameRecord, PlayerRecord, SQLiteStateStore, StateStore, TallyRecord
+from state_machine import StateMachine
+from shard import HttpBus, LocalBus, MemberDirectory, MemoryDirectory, ShardBus, SQLiteDirectory
+from summoner_cache import LeagueCache, SummonerCache
+from tally import Tally, TallyResult
+from timer import DeadlineScheduler
+from watcher import ActiveGameWatcher
+
+DEFAULT_LANGUAGE = "ja"
+# 使用するメッセージのキーとプレースホルダの数 (起動時に OutputMessage.json と照合する)
+REQUIRED_MESSAGES = {
+    "werewolf": 0,
+    "villager": 0,
+    "HelpMessage": 0,
+    "HelpReset": 0,
+    "HelpJoinHost": 0,
+    "HelpJoinTeams": 0,
+    "HelpQuit": 0,
+    "HelpStatus": 0,
+    "HelpStart": 0,
+    "HelpFinish": 0,
+    "HelpAggregate": 0,
+    "WarningHostOnly": 0,
+    "WarningPlayerOnly": 0,
+    "AlreadyJoined": 0,
+    "RedTeamFull": 0,
+    "BlueTeamFull": 0,
+    "RedTeamJoined": 0,
+    "BlueTeamJoined": 0,
+    "WarningInvalidTeam": 0,
+    "HostAlreadyExist": 0,
+    "HostJoined": 0,
+    "ResetGame": 0,
+    "InvalidVoteTarget": 0,
+    "VoteAccepted": 0,
+    "AlreadyVoted": 0,
+    "GameAlreadyBegin": 0,
+    "NotEnoughMember": 0,
+    "BeginGame": 0,
+    "WhatYouAre": 1,
+    "DecidedRoles": 0,
+    "AnnounceBanPick": 1,
+    "AnnounceStartGame": 0,
+    "WarningNotInGame": 0,
+    "AnnounceGG": 0,
+    "AnnounceBeginThinkingTime": 1,
+    "AnnounceEndThinkingTime": 0,
+    "AnnounceVoting": 0,
+    "WarningNotInVoting": 0,
+    "NotEnoughVote": 0,
+    "AnnounceResult": 0,
+    "BlueVoteResult": 1,
+    "RedVoteResult": 1,
+    "NotVotingProcess": 0,
+    "MaxTimeLimit": 1,
+    "NotInPreGame": 0,
+    "AnnounceInformYourName": 0,
+    "WarningInvalidCommand": 0,
+    "HelpExtend": 0,
+    "AnnounceExtended": 2,
+    "NoRunningTimer": 0,
+    "RiotAPIFailed": 1,
+    "SummonerNotFound": 0,
+    "SummonerRegistered": 1,
+    "SummonerReregistered": 1,
+    "QuitHost": 0,
+    "QuitPlayer": 0,
+    "UnregisteredSummoner": 0,
+    "DMFailed": 1,
+    "SearchingActiveGame": 0,
+    "SummonerMismatch": 0,
+    "FoundActiveGame": 0,
+    "NotImplementedYet": 0,
+    "AnnounceRevote": 0,
+    "RevoteCandidates": 1,
+    "Voted": 0,
+    "NotVoted": 0,
+    "Seconds": 1,
+    "HelpLanguage": 0,
+    "LanguageChanged": 1,
+    "UnsupportedLanguage": 1,
+    "WarningManageGuildOnly": 0,
+    "TooManyGames": 0,
+    "HelpLeaderboard": 0,
+    "HelpStats": 0,
+    "NoHistory": 0,
+    "HelpBalance": 0,
+    "HelpPosition": 0,
+    "TeamsBalanced": 2,
+    "PositionChanged": 1,
+    "InvalidPosition": 1,
+}
 
 # TODO: 後々RiotAPIと連携してチャンピオンとリンクできるようにしたい
 # TODO: Discordの表示名を自動的にチャンピオン名に変更するようになるといいね
 # TODO: 設定はどこかで弄れるようにしたいね
 
 
-class User(object):
-    def __init__(self, info: discord.Member):
-        self.info: discord.Member = info
-        self.is_wolf: bool = False
-        self.is_vote: bool = False
-        self.is_votable: bool = True
-        self.voted_to: int = -1
-        self.voted_from: int = 0
-        self.summoner_name: Optional[str] = None
-        self.summoner_id: Optional[str] = None
-        self.champion_name: Optional[str] = None
-        self.position: str = "mid"
-        self.display_name = self.info.display_name
+class Progress(StateMachine):
+    __slots__ = ()
 
-    def __eq__(self, other: object) -> bool:
-        if not isinstance(other, User):
-            raise NotImplementedError("Different type equality check happned.")
-        return self.info == other.info
+    STATES = (
+        "pre-game",
+        "ban-pick",
+        "in-game",
+        "thinking-time",
+        "voting",
+        "end",
+    )
+    TRANSITIONS = {
+        "begin": ("pre-game", "ban-pick"),
+        "start": ("ban-pick", "in-game"),
+        "finish": ("in-game", "thinking-time"),
+        "vote": ("thinking-time", "voting"),
+        "aggregate": ("voting", "end"),
+    }
+    INITIAL = "pre-game"
 
 
 class Game(object):
     MAX_TEAMMATES = 5
+    WOLVES_PER_TEAM = 1
     MAX_TIMELIMIT = 600
 
+    __slots__ = (
+        "progress",
+        "channel",
+        "host",
+        "blue_team",
+        "red_team",
+        "is_host_playing",
+        "watching",
+        "deadline",
+        "version",
+        "status_cache",
+        "status_message",
+        "status_rendered",
+        "tallies",
+        "match_id",
+    )
+
     def __init__(self, channel: discord.TextChannel):
-        states = [
-            "pre-game",
-            "ban-pick",
-            "in-game",
-            "thinking-time",
-            "voting",
-            "end",
-        ]
-        transitions = [
-            {"trigger": "begin", "source": "pre-game", "dest": "ban-pick"},
-            {"trigger": "start", "source": "ban-pick", "dest": "in-game"},
-            {"trigger": "finish", "source": "in-game", "dest": "thinking-time"},
-            {"trigger": "vote", "source": "thinking-time", "dest": "voting"},
-            {"trigger": "aggregate", "source": "voting", "dest": "end"},
-        ]
-        self.progress: Machine = Machine(
-            states=states,
-            transitions=transitions,
-            initial="pre-game",
-            auto_transitions=False,
-        )
+        self.progress: Progress = Progress()
         self.channel: discord.TextChannel = channel
         self.host: Optional[User] = None
         self.blue_team: List[User] = []
         self.red_team: List[User] = []
+        self.is_host_playing: bool = False
+        self.watching: Optional[asyncio.Future] = None
+        self.deadline: Optional[float] = None
+        # 状態が変わるたびにversionを進め、ステータス表示のキャッシュを無効化する
+        self.version: int = 0
+        self.status_cache: Dict[tuple, discord.Embed] = {}
+        self.status_message: Optional[discord.Message] = None
+        self.status_rendered: Optional[tuple] = None
+        self.tallies: Dict[str, Tally] = {}
+        # 試合を見つけた時点で記録し、集計後に試合結果を取得する
+        self.match_id: Optional[str] = None
+
+    @classmethod
+    async def restore(cls, channel: discord.TextChannel, record: GameRecord) -> "Game":
+        game = cls(channel)
+        game.progress.set_state(record.state)
+        game.deadline = record.deadline
+        game.match_id = record.match_id
+
+        async def fetch_member(member_id: int) -> Optional[discord.Member]:
+            member = channel.guild.get_member(member_id)
+            if member is None:
+                try:
+                    member = await channel.guild.fetch_member(member_id)
+                except discord.HTTPException:
+                    return None
+            return member
+
+        for record_player in sorted(record.players, key=lambda p: (p.team, p.slot)):
+            member = await fetch_member(record_player.member_id)
+            if member is None:
+                continue
+            player = User(member)
+            for field in PlayerRecord._fields[3:]:
+                setattr(player, field, getattr(record_player, field))
+            team = game.blue_team if record_player.team == "blue" else game.red_team
+            # 終了したゲームの参加者は集計時に解放済みのため、表示用に残すだけで席には着かせない
+            if record.state != "end":
+                players.seat(player, game, record_player.team, len(team))
+            team.append(player)
+
+        if record.host_id is not None:
+            seat = players.seat_of(record.host_id)
+            if seat is not None and seat.game is game:
+                game.host = seat.user
+            else:
+                member = await fetch_member(record.host_id)
+                game.host = User(member) if member is not None else None
+
+        for tally in record.tallies:
+            game._tally(tally.team, tally.round, tally.elected)
+        return game
+
+    # 復元したゲームの待機中だったタイマーや監視を再開する
+    def resume(self):
+        if self.progress.state == "ban-pick" and self.deadline is not None:
+            timers.schedule(self.channel.id, self.deadline, self._end_ban_pick)
+        elif self.progress.state == "in-game" and self.match_id is None:
+            # 試合を見つけた後に再起動した場合は、再び探したり名前を変えたりしない
+            asyncio.ensure_future(self._watch_active_game())
+        elif self.progress.state == "thinking-time" and self.deadline is not None:
+            timers.schedule(self.channel.id, self.deadline, self._end_thinking_time)
+
+    def _touch(self):
+        self.version += 1
+        self.status_cache.clear()
+        games.touch(self.channel.id)
+
+    # タイマーや試合の監視を待っている間は、操作が無くても破棄しない
+    @property
+    def busy(self) -> bool:
+        return self.watching is not None or timers.get(self.channel.id) is not None
+
+    # 上限に達した時は、まだ始まっていないか終わったゲームから破棄する
+    @property
+    def evictable(self) -> bool:
+        return not self.busy and self.progress.state in ("pre-game", "end")
+
+    def close(self):
+        self._stop_watching()
+        self._clear_deadline()
+        players.release(self, self.blue_team + self.red_team)
+        store.delete_game(self.channel.id)
+
+    def _save_game(self):
+        self._touch()
+        host_id = self.host.info.id if self.host is not None else None
+        store.save_game(self.channel.id, self.progress.state, host_id, self.deadline, self.match_id)
+
+    def _save_players(self, users: List[User]):
+        self._touch()
+        for user in users:
+            seat = self._seat(user)
+            if seat is None:
+                continue
+            fields = {field: getattr(seat.user, field) for field in PlayerRecord._fields[3:]}
+            store.save_player(self.channel.id, PlayerRecord(user.info.id, seat.team, seat.slot, **fields))
+
+    def _transition(self, trigger: str):
+        self.progress.trigger(trigger)
+        self._save_game()
+
+    # フェーズ終了時のコールバックを共有スケジューラに登録する
+    def _set_deadline(self, seconds: int, callback):
+        self.deadline = time.time() + seconds
+        timers.schedule(self.channel.id, self.deadline, callback)
+        self._save_game()
+
+    def _clear_deadline(self):
+        timers.cancel(self.channel.id)
+        self.deadline = None
+
+    def message(self, key: str, *args) -> str:
+        return catalog.get(key, language_of(self.channel.guild), *args)
 
     def only_host(func):
         async def wrapper(self, user: User, *args, **kwargs):
             if not await self._is_host(user):
-                await self._reply(user, output["WarningHostOnly"][language])
+                await self._reply(user, self.message("WarningHostOnly"))
                 return
             await func(self, user, *args, **kwargs)
 
@@ -79,7 +307,7 @@ class Game(object):
     def only_player(func):
         async def wrapper(self, user: User, *args, **kwargs):
             if not await self._is_player(user):
-                await self._reply(user, output["WarningPlayerOnly"][language])
+                await self._reply(user, self.message("WarningPlayerOnly"))
                 return
             await func(self, user, *args, **kwargs)
 
@@ -88,41 +316,81 @@ class Game(object):
     def only_pre_game(func):
         async def wrapper(self, user: User, *args, **kwargs):
             if self.progress.state != "pre-game":
-                await self._reply(user, output["NotInPreGame"][language])
+                await self._reply(user, self.message("NotInPreGame"))
                 return
             await func(self, user, *args, **kwargs)
 
         return wrapper
 
-    async def _send_dm_all_(self, text: str):
-        for player in self.blue_team + self.red_team:
-            await player.info.send(text)
+    async def _fan_out(self, players: List[User], func, label: str) -> FanOutResult:
+        result = await fanout.run(players, func, label)
+        for player, e in result.failures:
+            print("{} failed for {}: {}".format(label, player.display_name, e))
+        return result
+
+    async def _send_dm_all_(self, text: str) -> FanOutResult:
+        return await self._fan_out(self.blue_team + self.red_team, lambda player: player.info.send(text), "dm_all")
 
-    async def _send_dm_team(self, text: str, team: str):
+    async def _send_dm_team(self, text: str, team: str) -> FanOutResult:
         if team == "blue":
-            for player in self.blue_team:
-                await player.info.send(text)
+            players = self.blue_team
         elif team == "red":
-            for player in self.red_team:
-                await player.info.send(text)
+            players = self.red_team
         else:
             raise RuntimeError("Invalid Team Color")
+        return await self._fan_out(players, lambda player: player.info.send(text), "dm_team")
+
+    def _stop_watching(self):
+        if self.watching is not None and not self.watching.done():
+            self.watching.cancel()
+        self.watching = None
+
+    # 投票状況はUserに保存されているため、集計エンジンはそこから必要になった時に作る
+    # 決選投票の回数と確定済みの投票先はUserに無いため、復元時に保存したものを渡す
+    def _tally(self, team_name: str, round: int = 1, elected: Tuple[int, ...] = ()) -> Tally:
+        if team_name not in self.tallies:
+            team = self.blue_team if team_name == "blue" else self.red_team
+            candidates = [i for i, player in enumerate(team) if player.is_votable]
+            tally = Tally(len(team), Game.WOLVES_PER_TEAM, candidates, elected=elected, round=round)
+            for i, player in enumerate(team):
+                if player.is_vote and player.voted_to >= 0:
+                    tally.cast(i, player.voted_to)
+            self.tallies[team_name] = tally
+        return self.tallies[team_name]
+
+    def _player_name(self, player: User) -> str:
+        return player.champion_name if player.champion_name is not None else player.display_name
 
     async def _reply(self, user: User, text: str):
         text_m = f"{user.info.mention} " + text
-        await self.channel.send(text_m)
+        self._post(text_m)
+
+    # チャンネルへの発言は送信キューに入れ、続けて送られたものと一つのメッセージにまとめる
+    def _post(
+        self,
+        content: Optional[str] = None,
+        embed: Optional[discord.Embed] = None,
+        file: Optional[discord.File] = None,
+    ):
+        outbox.post(self.channel, content, embed, file)
 
     async def _is_host(self, user: User) -> bool:
         return self.host is not None and user == self.host
 
+    def _seat(self, user: User) -> Optional[Seat]:
+        seat = players.seat_of(user.info.id)
+        return seat if seat is not None and seat.game is self else None
+
     async def _is_in_blue(self, user: User) -> bool:
-        return user in self.blue_team
+        seat = self._seat(user)
+        return seat is not None and seat.team == "blue"
 
     async def _is_in_red(self, user: User) -> bool:
-        return user in self.red_team
+        seat = self._seat(user)
+        return seat is not None and seat.team == "red"
 
     async def _is_player(self, user: User) -> bool:
-        return await self._is_in_blue(user) or await self._is_in_red(user)
+        return self._seat(user) is not None
 
     async def is_exist(self, user: User) -> bool:
         return await self._is_host(user) or await self._is_player(user)
@@ -131,311 +399,487 @@ class Game(object):
     async def join_as_host(self, user: User):
         if self.host is None:
             self.host = user
-            await self._reply(user, output["HostJoined"][language])
+            self._save_game()
+            await self._reply(user, self.message("HostJoined"))
         else:
-            await self._reply(user, output["HostAlreadyExist"][language])
+            await self._reply(user, self.message("HostAlreadyExist"))
 
     @only_pre_game
     async def join_as_player(self, user: User, team: str):
-        if await self._is_player(user):
-            await self._reply(user, output["AlreadyJoined"][language])
+        # 他のチャンネルのゲームに参加中の場合も受け付けない
+        if players.seat_of(user.info.id) is not None:
+            await self._reply(user, self.message("AlreadyJoined"))
             return
 
         if team == "blue":
             if len(self.blue_team) >= Game.MAX_TEAMMATES:
-                await self._reply(user, output["BlueTeamFull"][language])
+                await self._reply(user, self.message("BlueTeamFull"))
                 return
 
+            players.seat(user, self, "blue", len(self.blue_team))
             self.blue_team.append(user)
-            await self._reply(user, output["BlueTeamJoined"][language])
-            await user.info.send(output["AnnounceInformYourName"][language])
+            self._save_game()
+            self._save_players([user])
+            await self._reply(user, self.message("BlueTeamJoined"))
+            await user.info.send(self.message("AnnounceInformYourName"))
         elif team == "red":
             if len(self.red_team) >= Game.MAX_TEAMMATES:
-                await self._reply(user, output["RedTeamFull"][language])
+                await self._reply(user, self.message("RedTeamFull"))
                 return
 
+            players.seat(user, self, "red", len(self.red_team))
             self.red_team.append(user)
-            await self._reply(user, output["RedTeamJoined"][language])
-            await user.info.send(output["AnnounceInformYourName"][language])
+            self._save_game()
+            self._save_players([user])
+            await self._reply(user, self.message("RedTeamJoined"))
+            await user.info.send(self.message("AnnounceInformYourName"))
         else:
-            await self._reply(user, output["WarningInvalidTeam"][language])
+            await self._reply(user, self.message("WarningInvalidTeam"))
 
     @only_player
     @only_pre_game
     async def inform_summoner_name(self, user: User, summoner_name: str):
-        url = "https://jp1.api.riotgames.com/lol/summoner/v4/summoners/by-name/{}".format(
-            urllib.parse.quote(summoner_name)
-        )
-        api_key = "?api_key={}".format(RIOT_API_KEY)
+        try:
+            summoner = await riot.get_summoner_by_name(summoner_name)
+        except RiotAPIError as e:
+            await user.info.send(self.message("RiotAPIFailed", e.status))
+            return
 
-        result = requests.get(url + api_key)
+        if summoner is None:
+            await user.info.send(self.message("SummonerNotFound"))
+            return
 
-        if result.status_code == 404:
-            await user.info.send("サモナーが見つかりませんでした。名前はあっていますか？")
+        seat = self._seat(user)
+        if seat is None:
             return
+        player = seat.user
+        if player.summoner_name is None:
+            await user.info.send(self.message("SummonerRegistered", summoner_name))
+        else:
+            await user.info.send(self.message("SummonerReregistered", summoner_name))
+        player.summoner_name = summoner_name
+        player.summoner_id = summoner.id
+        self._save_players([player])
 
-        if result.status_code != 200:
-            await user.info.send("何らかの問題により、Riot APIが正常に完了しませんでした。(エラーコード: {})".format(result.status_code))
+    @only_player
+    @only_pre_game
+    async def set_position(self, user: User, position: str):
+        position = position.lower()
+        if position not in POSITIONS:
+            await user.info.send(self.message("InvalidPosition", ", ".join(POSITIONS)))
             return
 
-        if await self._is_in_blue(user):
-            index = self.blue_team.index(user)
-            if self.blue_team[index].summoner_name is None:
-                await user.info.send("サモナーネームとして{}が登録されました。".format(summoner_name))
-            else:
-                await user.info.send("サモナーネームとして{}が再登録されました。".format(summoner_name))
+        seat = self._seat(user)
+        if seat is None:
+            return
+        seat.user.position = position
+        self._save_players([seat.user])
+        await user.info.send(self.message("PositionChanged", position))
 
-            self.blue_team[index].summoner_name = summoner_name
-            self.blue_team[index].summoner_id = result.json()["id"]
-        else:
-            index = self.red_team.index(user)
-            if self.red_team[index].summoner_name is None:
-                await user.info.send("サモナーネームとして{}が登録されました。".format(summoner_name))
-            else:
-                await user.info.send("サモナーネームとして{}が再登録されました。".format(summoner_name))
-            self.red_team[index].summoner_name = summoner_name
-            self.red_team[index].summoner_id = result.json()["id"]
+    # 参加者のランクから、レートの差が最も小さくなるようにチームを組み直す
+    @only_host
+    @only_pre_game
+    async def balance_teams(self, user: User, use_positions: bool = False):
+        members = self.blue_team + self.red_team
+        if len(members) != 2 * Game.MAX_TEAMMATES:
+            self._post(self.message("NotEnoughMember"))
+            return
+
+        if any(player.summoner_id is None for player in members):
+            self._post(self.message("UnregisteredSummoner"))
+            return
+
+        try:
+            entries = await asyncio.gather(*[riot.get_league_entries(player.summoner_id) for player in members])
+        except RiotAPIError as e:
+            self._post(self.message("RiotAPIFailed", e.status))
+            return
+
+        # 取得を待つ間に参加者が入れ替わった場合は何もしない
+        if self.progress.state != "pre-game" or self.blue_team + self.red_team != members:
+            return
+
+        ratings = fill_unranked([rating(entry) for entry in entries])
+        split = balance(ratings, [player.position for player in members] if use_positions else None)
+        self.blue_team = [members[i] for i in split.blue]
+        self.red_team = [members[i] for i in split.red]
+        players.reindex(self, "blue", self.blue_team)
+        players.reindex(self, "red", self.red_team)
+        self._save_players(members)
+
+        self._post(
+            self.message(
+                "TeamsBalanced",
+                sum(ratings[i] for i in split.blue) // Game.MAX_TEAMMATES,
+                sum(ratings[i] for i in split.red) // Game.MAX_TEAMMATES,
+            )
+        )
+        await self.show_status(True)
 
     @only_host
     @only_pre_game
     async def quit_host(self, user: User):
         self.host = None
-        await self._reply(user, "ホストを辞めました。")
+        self._save_game()
+        await self._reply(user, self.message("QuitHost"))
 
     @only_player
     @only_pre_game
     async def quit_player(self, user: User, team: str):
         if team not in ["red", "blue"]:
-            await self._reply(user, output["WarningInvalidTeam"][language])
+            await self._reply(user, self.message("WarningInvalidTeam"))
             return
 
-        if await self._is_in_blue(user):
-            self.blue_team.remove(user)
-        else:
-            self.red_team.remove(user)
-        await self._reply(user, "プレイヤーを辞めました。")
+        seat = self._seat(user)
+        team = self.blue_team if seat.team == "blue" else self.red_team
+        del team[seat.slot]
+        players.unseat(user)
+        players.reindex(self, seat.team, team)
+        store.delete_player(self.channel.id, user.info.id)
+        self._save_players(team)
+        await self._reply(user, self.message("QuitPlayer"))
 
     @only_host
     async def reset(self, user: User):
+        players.release(self, self.blue_team + self.red_team)
         self.host = None
         self.blue_team = []
         self.red_team = []
+        self._stop_watching()
+        self._clear_deadline()
+        self.tallies.clear()
+        self.match_id = None
         self.progress.set_state("pre-game")
-        await self.channel.send(output["ResetGame"][language])
+        store.delete_game(self.channel.id)
+        self._touch()
+        outbox.take_saved(self.channel.id)
+        self._post(self.message("ResetGame"))
 
     @only_host
     @only_pre_game
     async def start(self, user: User, time: int = 180):
         if time <= 0 or time > Game.MAX_TIMELIMIT:
-            await self.channel.send(output["MaxTimeLimit"][language].format(Game.MAX_TIMELIMIT))
+            self._post(self.message("MaxTimeLimit", Game.MAX_TIMELIMIT))
             return
 
         if self.progress.state == "in-game":
-            await self.channel.send(output["GameAlreadyBegin"][language])
+            self._post(self.message("GameAlreadyBegin"))
             return
 
         if len(self.blue_team + self.red_team) != 2 * Game.MAX_TEAMMATES:
-            await self.channel.send(output["NotEnoughMember"][language])
+            self._post(self.message("NotEnoughMember"))
             return
 
         for player in self.blue_team + self.red_team:
             if player.summoner_name is None:
                 # TODO: 未登録プレイヤー一覧を表示する
-                await self.channel.send("サモナーネーム未登録のプレイヤーがいます。")
+                self._post(self.message("UnregisteredSummoner"))
                 return
 
-        await self.channel.send(output["BeginGame"][language])
-        self.progress.begin()
+        self._post(self.message("BeginGame"))
+        self._transition("begin")
 
         # プレイヤがホストを兼任しているかどうかの確認
-        self.is_host_playing: bool = self.host in self.red_team + self.blue_team
+        self.is_host_playing = self.host in self.red_team + self.blue_team
 
         # 人狼を決定する
-        self.red_team[random.randint(0, Game.MAX_TEAMMATES - 1)].is_wolf = True
-        self.blue_team[random.randint(0, Game.MAX_TEAMMATES - 1)].is_wolf = True
+        for player in random.sample(self.red_team, Game.WOLVES_PER_TEAM) + random.sample(
+            self.blue_team, Game.WOLVES_PER_TEAM
+        ):
+            player.is_wolf = True
+        self.tallies.clear()
+        store.delete_tallies(self.channel.id)
+        self._save_players(self.blue_team + self.red_team)
 
         # ホストに全情報を送信(ホストがプレイヤでないときのみ)
         if not self.is_host_playing:
             await self.host.info.send(embed=await self.get_current_status(False))
 
         # テキストチャットに役職を伏せた全情報を送信
-        await self.channel.send(embed=await self.get_current_status(True, True))
+        await self.show_status(True, True)
 
         # 個別にDMで連絡
-        for player in self.red_team + self.blue_team:
-            await player.info.send(
-                output["WhatYouAre"][language].format(
-                    output["werewolf"][language] if player.is_wolf else output["villager"][language]
-                )
+        result = await self._fan_out(
+            self.red_team + self.blue_team,
+            lambda player: player.info.send(
+                self.message("WhatYouAre", self.message("werewolf") if player.is_wolf else self.message("villager"))
+            ),
+            "dm_roles",
+        )
+        if not result.ok:
+            self._post(
+                self.message("DMFailed", "\n".join([player.info.mention for player, _ in result.failures]))
             )
 
-        await self.channel.send(output["DecidedRoles"][language])
+        self._post(self.message("DecidedRoles"))
 
         # Ban/Pick相談
-        await self.channel.send(output["AnnounceBanPick"][language].format(time))
-        await asyncio.sleep(time)
+        self._post(self.message("AnnounceBanPick", time))
+        self._set_deadline(time, self._end_ban_pick)
+
+    async def _end_ban_pick(self):
         if self.progress.state != "ban-pick":
             return
 
         # 試合開始コール
-        await self.channel.send(output["AnnounceStartGame"][language])
-        self.progress.start()
+        self._post(self.message("AnnounceStartGame"))
+        self._clear_deadline()
+        self._transition("start")
+        await self._watch_active_game()
+
+    async def _watch_active_game(self):
+        # 登録された全プレイヤーのサモナーIDを監視サービスに登録し、見つかるまで待つ
+        watching = watcher.watch([player.summoner_id for player in self.blue_team + self.red_team])
+        self.watching = watching
+        while not watching.done():
+            self._post(self.message("SearchingActiveGame"))
+            await asyncio.wait([watching], timeout=30)
+
+        if watching.cancelled() or self.progress.state != "in-game":
+            return
 
-        count: int = 0
-        while self.progress.state == "in-game" or count >= 600:
-            if count % 30 == 0:
-                await self.channel.send("アクティブなゲームを探しています。")
+        self.watching = None
+        active_game = watching.result()
+        if active_game is None:
+            return
 
-            await asyncio.sleep(1)
-            if self.progress.state != "in-game":
-                return
+        summoners = active_game.participants
+        summoner_names = set([summoner.summoner_name for summoner in summoners])
+        informed_names = set([player.summoner_name for player in self.blue_team + self.red_team])
 
-            url = "https://jp1.api.riotgames.com/lol/spectator/v4/active-games/by-summoner/{}".format(
-                self.red_team[0].summoner_id
-            )
-            api_key = "?api_key={}".format(RIOT_API_KEY)
-            result = requests.get(url + api_key)
-            count += 1
+        if summoner_names != informed_names:
+            # TODO: 途中で修正できるようにする -> リアクションなどで簡単に修正できると良いか？
+            self._post(self.message("SummonerMismatch"))
+            return
 
-            if result.status_code != 200:
-                print("Not in active")
+        self._post(self.message("FoundActiveGame"))
+        self.match_id = riot.match_id(active_game.game_id)
+        self._save_game()
+        participants = {summoner.summoner_name: summoner for summoner in summoners}
+        renamed = []
+        for player in self.blue_team + self.red_team:
+            champion = champions.by_key(participants[player.summoner_name].champion_id)
+            if champion is None:
                 continue
-
-            summoners = result.json()["participants"]
-            summoner_names = set([summoner["summonerName"] for summoner in summoners])
-            informed_names = set([player.summoner_name for player in self.blue_team + self.red_team])
-            print(summoner_names)
-            print(informed_names)
-
-            if summoner_names != informed_names:
-                # TODO: 途中で修正できるようにする -> リアクションなどで簡単に修正できると良いか？
-                await self.channel.send("申請されたサモナーネームと異なるサモナーを見つけました。\n表示名自動変更をオフにします。")
-                return
-
-            await self.channel.send("アクティブなゲームを見つけました！\n皆さんの表示名を一時的にチャンピオン名に変更します！")
-            for player in self.blue_team + self.red_team:
-                for summoner in summoners:
-                    if summoner["summonerName"] == player.summoner_name:
-                        for champion in champions.values():
-                            if int(champion["key"]) == summoner["championId"]:
-                                player.champion_name = champion["name"]
-                                await player.info.edit(nick=champion["name"])
-                                break
-            return
+            player.champion_name = champion.name
+            renamed.append(player)
+        self._save_players(renamed)
+        await self._fan_out(renamed, lambda player: player.info.edit(nick=player.champion_name), "nick_champion")
 
     @only_host
     async def restart(self, user: User):
-        await self.channel.send("すみません、こちらは未実装です。")
+        self._post(self.message("NotImplementedYet"))
 
     @only_host
     async def finish(self, user: User, time: int = 300):
         if time <= 0 or time > Game.MAX_TIMELIMIT:
-            await self.channel.send(output["MaxTimeLimit"][language].format(Game.MAX_TIMELIMIT))
+            self._post(self.message("MaxTimeLimit", Game.MAX_TIMELIMIT))
             return
 
         if self.progress.state != "in-game":
-            await self.channel.send(output["WarningNotInGame"][language])
+            self._post(self.message("WarningNotInGame"))
             return
 
-        await self.channel.send(output["AnnounceGG"][language])
-        self.progress.finish()
+        self._post(self.message("AnnounceGG"))
+        self._stop_watching()
+        self._transition("finish")
+
+        self._post(self.message("AnnounceBeginThinkingTime", time))
+        self._set_deadline(time, self._end_thinking_time)
 
-        await self.channel.send(output["AnnounceBeginThinkingTime"][language].format(time))
-        await asyncio.sleep(time)
+    async def _end_thinking_time(self):
         if self.progress.state != "thinking-time":
             return
 
-        await self.channel.send(output["AnnounceEndThinkingTime"][language])
-        self.progress.vote()
+        self._post(self.message("AnnounceEndThinkingTime"))
+        self._clear_deadline()
+        self._transition("vote")
+
+        self._post(self.message("AnnounceVoting"))
+
+    @only_host
+    async def extend(self, user: User, time: int = 60):
+        if time <= 0 or time > Game.MAX_TIMELIMIT:
+            self._post(self.message("MaxTimeLimit", Game.MAX_TIMELIMIT))
+            return
+
+        if self.deadline is None or timers.get(self.channel.id) is None:
+            self._post(self.message("NoRunningTimer"))
+            return
 
-        await self.channel.send(output["AnnounceVoting"][language])
+        self.deadline += time
+        timers.reschedule(self.channel.id, self.deadline)
+        self._save_game()
+        self._post(
+            self.message("AnnounceExtended", time, int(timers.remaining(self.channel.id)))
+        )
 
     @only_host
     async def aggregate(self, user: User):
         if self.progress.state != "voting":
-            await self.channel.send(output["WarningNotInVoting"][language])
+            self._post(self.message("WarningNotInVoting"))
             return
 
         if not all([player.is_vote for player in self.red_team + self.blue_team]):
-            await self.channel.send(output["NotEnoughVote"][language])
+            self._post(self.message("NotEnoughVote"))
             return
 
-        # 同票数がいる場合に再投票
-        def is_revote(team: List[User]) -> bool:
-            votes = sorted([player.voted_from for player in team])
-            if votes == [0, 0, 1, 2, 2]:
-                for player in team:
-                    player.voted_from = 0
-                    if player.voted_from != 2:
-                        player.voted_to = -1
-                        player.is_vote = False
-                        player.is_votable = False
-                return True
-            if votes == [1, 1, 1, 1, 1]:
-                for player in team:
-                    player.voted_to = -1
-                    player.voted_from = 0
-                    player.is_vote = False
-                return True
-            return False
-
         async def inform_revote(team: List[User]):
             text: str = ""
             for i, player in enumerate(team):
                 if player.is_votable:
-                    text += "Player {} : {}\n".format(
-                        i + 1, player.champion_name if player.champion_name is not None else player.display_name
-                    )
-            for player in team:
-                if not player.is_vote:
-                    await player.info.send("再投票が必要です。以下の候補者からもう一度選んでください。\n{}".format(text))
+                    text += "Player {} : {}\n".format(i + 1, self._player_name(player))
+            await self._fan_out(
+                [player for player in team if not player.is_vote],
+                lambda player: player.info.send(self.message("RevoteCandidates", text)),
+                "dm_revote",
+            )
+
+        # 同票数がいる場合は同票の候補者のみで再投票
+        results = {}
+        revote_teams = []
+        for team_name, team in (("blue", self.blue_team), ("red", self.red_team)):
+            tally = self._tally(team_name)
+            result = tally.result()
+            if result.decided:
+                results[team_name] = result
+                continue
+            runoff = tally.runoff()
+            self.tallies[team_name] = runoff
+            store.save_tally(self.channel.id, TallyRecord(team_name, runoff.round, runoff.elected))
+            for i, player in enumerate(team):
+                player.is_vote = False
+                player.voted_to = -1
+                player.voted_from = 0
+                player.is_votable = runoff.is_candidate(i)
+            revote_teams.append(team)
+
+        if revote_teams:
+            self._save_players(self.blue_team + self.red_team)
+            self._post(self.message("AnnounceRevote"))
+            for team in revote_teams:
+                await inform_revote(team)
+            return
 
-        if is_revote(self.blue_team) or is_revote(self.red_team):
-            await self.channel.send("再投票が必要です。該当者には改めてDMで通知されます。")
-            await inform_revote(self.blue_team)
-            await inform_revote(self.red_team)
+        self._post(self.message("AnnounceResult"))
+        for key, team_name, team in (
+            ("BlueVoteResult", "blue", self.blue_team),
+            ("RedVoteResult", "red", self.red_team),
+        ):
+            names = ", ".join([self._player_name(team[i]) for i in results[team_name].elected])
+            self._post(self.message(key, names))
+
+        self._enqueue_results(results)
+        card = await cards.render(self._result_card(results))
+        if card is not None:
+            self._post(file=discord.File(io.BytesIO(card), filename="result.png"))
+        self._post(embed=await self.get_current_status(False, True))
+
+        self._transition("aggregate")
+        # 終了したゲームの参加者は他のゲームに参加できるようにする
+        players.release(self, self.blue_team + self.red_team)
+
+        await self._fan_out(
+            self.blue_team + self.red_team, lambda player: player.info.edit(nick=player.display_name), "nick_reset"
+        )
 
-        await self.channel.send(output["AnnounceResult"][language])
+        # まとめて送ったことで減らせたメッセージ数をゲームごとに記録する
+        await outbox.flush(self.channel)
+        saved = outbox.take_saved(self.channel.id)
+        print("Game {} finished, {} messages saved by batching".format(self.channel.id, saved))
 
-        # TODO: 点数計算
-        # TODO: 画像を出力
-        await self.channel.send(await self.get_current_status(False, True))
+    # 試合結果の取得と点数計算は、コマンドの応答を待たせないようジョブキューで行う
+    def _enqueue_results(self, results: Dict[str, TallyResult]):
+        finished_at = time.time()
+        entries = []
+        for team_name, team in (("blue", self.blue_team), ("red", self.red_team)):
+            for i, player in enumerate(team):
+                # 村人が自チームの人狼に投票できたか
+                voted_correctly = (
+                    not player.is_wolf and 0 <= player.voted_to < len(team) and team[player.voted_to].is_wolf
+                )
+                entries.append(
+                    {
+                        "member_id": player.info.id,
+                        "team": team_name,
+                        "is_wolf": player.is_wolf,
+                        "summoner_id": player.summoner_id,
+                        "voted_correctly": voted_correctly,
+                        "elected": i in results[team_name].elected,
+                    }
+                )
+        jobs.enqueue(
+            {
+                "key": "{}-{}".format(self.channel.id, int(finished_at * 1000)),
+                "guild_id": self.channel.guild.id,
+                "channel_id": self.channel.id,
+                "match_id": self.match_id,
+                "finished_at": finished_at,
+                "players": entries,
+            }
+        )
 
-        self.progress.aggregate()
+    def _result_card(self, results: Dict[str, TallyResult]) -> ResultCard:
+        def card_players(team_name: str, team: List[User]) -> Tuple[CardPlayer, ...]:
+            card = []
+            for i, player in enumerate(team):
+                champion = champions.by_name(player.champion_name) if player.champion_name is not None else None
+                image = champion.image if champion is not None else None
+                elected = i in results[team_name].elected
+                card.append(CardPlayer(self._player_name(player), image, player.is_wolf, player.voted_to, elected))
+            return tuple(card)
 
-        for player in self.blue_team + self.red_team:
-            await player.info.edit(nick=player.display_name)
+        return ResultCard(card_players("blue", self.blue_team), card_players("red", self.red_team))
 
     @only_player
     async def vote(self, voter: User, vote_to: int) -> bool:
         if self.progress.state != "voting":
-            await voter.info.send(output["NotVotingProcess"][language])
+            await voter.info.send(self.message("NotVotingProcess"))
             return False
 
         if vote_to <= 0 or vote_to > Game.MAX_TEAMMATES:
-            await voter.info.send(output["InvalidVoteTarget"][language])
+            await voter.info.send(self.message("InvalidVoteTarget"))
             return False
 
-        team = self.red_team if voter in self.red_team else self.blue_team
-        i = team.index(voter)
+        seat = self._seat(voter)
+        team = self.red_team if seat.team == "red" else self.blue_team
+        tally = self._tally(seat.team)
+        i = seat.slot
+        target = vote_to - 1
 
         # 既に投票済みの場合
-        if team[i].is_vote:
-            await voter.info.send(output["AlreadyVoted"][language])
+        if tally.has_voted(i):
+            await voter.info.send(self.message("AlreadyVoted"))
             return False
 
         # 投票不可能な対象の場合 (再投票の場合など)
-        if not team[vote_to - 1].is_votable:
-            await voter.info.send(output["InvalidVoteTarget"][language])
+        if not tally.is_candidate(target):
+            await voter.info.send(self.message("InvalidVoteTarget"))
             return False
 
+        tally.cast(i, target)
         team[i].is_vote = True
-        team[i].voted_to = vote_to - 1
-        team[vote_to - 1].voted_from += 1
-        await voter.info.send(output["VoteAccepted"][language])
+        team[i].voted_to = target
+        team[target].voted_from = tally.counts[target]
+        self._save_players([team[i], team[target]])
+        await voter.info.send(self.message("VoteAccepted"))
         return True
 
     async def get_current_status(self, is_blind: bool = True, is_mention: bool = False) -> discord.Embed:
+        key = (self.version, is_blind, is_mention, language_of(self.channel.guild))
+        embed = self.status_cache.get(key)
+        if embed is None:
+            embed = self._render_status(is_blind, is_mention)
+            self.status_cache[key] = embed
+
+        # 残り時間は刻々と変わるため、キャッシュしたものに後から追加する
+        remaining = timers.remaining(self.channel.id)
+        if remaining is not None:
+            embed = embed.copy()
+            embed.insert_field_at(1, name="Time Remaining", value=self.message("Seconds", int(remaining)))
+        return embed
+
+    def _render_status(self, is_blind: bool, is_mention: bool) -> discord.Embed:
         embed = discord.Embed(title="Current Game Status", description="", color=0x00FF00)
         embed.add_field(name="Game Progress", value=self.progress.state)
 
@@ -445,155 +889,563 @@ class Game(object):
             text = "Not exist"
         embed.add_field(name="Host", value=text, inline=False)
 
+        voted, not_voted, werewolf = self.message("Voted"), self.message("NotVoted"), self.message("werewolf")
+
         def loop_player(team: List[User]) -> str:
             if len(team) == 0:
                 return "Not exist"
-            text = ""
-            for i, player in enumerate(team):
-                text += "Player{} ({}):\t{} ({})\t{}\t{}\n".format(
-                    i + 1,
-                    player.champion_name,
-                    player.info.mention if is_mention else player.info.display_name,
-                    player.summoner_name,
-                    "投票済み" if player.is_vote else "未投票",
-                    output["werewolf"][language] if not is_blind and player.is_wolf else "",
-                )
-            return text
+            return "".join(
+                [
+                    "Player{} ({}):\t{} ({})\t{}\t{}\n".format(
+                        i + 1,
+                        player.champion_name,
+                        player.info.mention if is_mention else player.info.display_name,
+                        player.summoner_name,
+                        voted if player.is_vote else not_voted,
+                        werewolf if not is_blind and player.is_wolf else "",
+                    )
+                    for i, player in enumerate(team)
+                ]
+            )
 
         embed.add_field(name="Blue side (Left side)", value=loop_player(self.blue_team), inline=False)
         embed.add_field(name="Red side (Right side)", value=loop_player(self.red_team))
 
         return embed
 
+    # チャンネルに一つだけピン留めしたステータスを、新しく投稿せずに編集して更新する
+    async def show_status(self, is_blind: bool = True, is_mention: bool = False):
+        embed = await self.get_current_status(is_blind, is_mention)
+        rendered = (self.version, is_blind, is_mention, language_of(self.channel.guild))
+        if self.status_message is not None:
+            # 内容が変わっていない場合は何もしない
+            if rendered == self.status_rendered and self.deadline is None:
+                return
+            try:
+                await self.status_message.edit(embed=embed)
+                self.status_rendered = rendered
+                return
+            except discord.NotFound:
+                self.status_message = None
 
-client = discord.Client()
-games: Dict[discord.TextChannel, Game] = {}
-champions = json.load(open("resources/champion.json"))["data"]
-output = json.load(open("OutputMessage.json", "r"))
-language = "ja"
+        # 固定するため、送信待ちの発言とはまとめずに単独のメッセージとして送る
+        self.status_message = await outbox.send(self.channel, embed=embed, alone=True)
+        if self.status_message is None:
+            return
+        self.status_rendered = rendered
+        try:
+            await self.status_message.pin()
+        except discord.HTTPException:
+            pass
+
+
+# 設定に依存するものはimport時には作らず、create_appで生成する
+config: Optional[Config] = None
+client: Optional[discord.Client] = None
+directory: Optional[MemberDirectory] = None
+bus: Optional[ShardBus] = None
+games: Optional[GameRegistry] = None
+store: Optional[StateStore] = None
+timers: Optional[DeadlineScheduler] = None
+players: Optional[PlayerRegistry] = None
+fanout: Optional[FanOut] = None
+outbox: Optional[Outbox] = None
+riot: Optional[RiotClient] = None
+watcher: Optional[ActiveGameWatcher] = None
+champion_store: Optional[ChampionStore] = None
+champions: Optional[ChampionRegistry] = None
+cards: Optional[ResultCardRenderer] = None
+champion_sync: Optional[ChampionSync] = None
+history: Optional[HistoryStore] = None
+jobs: Optional[JobQueue] = None
+catalog: Optional[MessageCatalog] = None
+guild_languages: Optional[Dict[int, str]] = None
+
+
+async def ingest_results(payload: Dict, final: bool) -> bool:
+    won: Dict[str, bool] = {}
+    if payload["match_id"] is not None:
+        match = await riot.get_match(payload["match_id"])
+        # 試合終了直後はまだ結果が公開されていないことがあるため、最後の試行以外は後で再試行する
+        if match is None and not final:
+            return False
+        if match is not None:
+            won = {participant.summoner_id: participant.win for participant in match.participants}
+
+    results = [
+        PlayerResult(
+            player["member_id"],
+            player["team"],
+            player["is_wolf"],
+            player["voted_correctly"],
+            player["elected"],
+            won.get(player["summoner_id"]),
+        )
+        for player in payload["players"]
+    ]
+    history.record(
+        payload["key"],
+        payload["guild_id"],
+        payload["channel_id"],
+        payload["match_id"],
+        payload["finished_at"],
+        results,
+    )
+    return True
+
+
+metrics = Metrics()
+loop_lag = LoopLagMonitor()
+discord_metrics = DiscordMetrics()
+metrics_server: Optional[MetricsServer] = None
+metrics_logger: Optional[MetricsLogger] = None
+
+
+def collect_games() -> List[Metric]:
+    counts = Counter(game.progress.state for game in games)
+    states = Metric("lolwolf_games", "gauge", "Games by state")
+    for state in Progress.STATES:
+        states.add(counts.get(state, 0), state=state)
+    return [
+        states,
+        Metric("lolwolf_games_evicted_total", "counter", "Games evicted for being idle").add(games.evicted),
+        Metric("lolwolf_result_card_cache_total", "counter", "Result card cache lookups")
+        .add(cards.hits, result="hit")
+        .add(cards.misses, result="miss"),
+        Metric("lolwolf_outbox_messages_total", "counter", "Channel messages requested and actually sent")
+        .add(outbox.requested, result="requested")
+        .add(outbox.sent, result="sent")
+        .add(outbox.failed, result="failed"),
+        Metric("lolwolf_seated_players", "gauge", "Players seated in a game").add(len(players)),
+        Metric("lolwolf_result_jobs_pending", "gauge", "Match results waiting to be ingested").add(jobs.pending()),
+        Metric("lolwolf_result_jobs_total", "counter", "Match result ingestion attempts")
+        .add(jobs.completed, result="completed")
+        .add(jobs.retried, result="retried")
+        .add(jobs.failed, result="failed"),
+        Metric("lolwolf_timers", "gauge", "Scheduled phase deadlines").add(len(timers)),
+    ]
+
+
+metrics.register(collect_games)
+metrics.register(loop_lag.collect)
+metrics.register(discord_metrics.collect)
+metrics.register(lambda: collect_riot(riot))
+metrics.register(lambda: collect_fanout(fanout))
+metrics.register(lambda: collect_commands(commands))
+
+
+def language_of(guild: Optional[discord.Guild]) -> str:
+    if guild is None:
+        return DEFAULT_LANGUAGE
+    return guild_languages.get(guild.id, DEFAULT_LANGUAGE)
+
+
+# DMの場合は参加中のゲームのサーバーの言語を使う
+def context_language(ctx: Context) -> str:
+    if ctx.is_dm:
+        seat = players.seat_of(ctx.author.info.id)
+        return language_of(seat.game.channel.guild) if seat is not None else DEFAULT_LANGUAGE
+    return language_of(ctx.channel.guild)
+
+
+async def restore_games():
+    for record in store.load():
+        channel = client.get_channel(record.channel_id)
+        if channel is None:
+            # 他のシャードが担当するチャンネルの場合があるため、単一シャードの場合のみ削除する
+            if config.shard_count == 1:
+                store.delete_game(record.channel_id)
+            continue
+        game = await Game.restore(channel, record)
+        if not games.add(game):
+            # 保存された状態は消さずに残し、上限に空きがある次回の起動時に復元する
+            print("Too many games to restore {}".format(record.channel_id))
+            players.release(game, game.blue_team + game.red_team)
+            continue
+        game.resume()
+
+
+started = False
+
+
+# 初回の接続時に、前回の終了時に残ったゲームやジョブを再開する
+async def startup():
+    await bus.start()
+    await restore_games()
+    asyncio.ensure_future(cards.warm())
+    jobs.start()
+    if config.ddragon_url:
+        champion_sync.start(config.ddragon_sync_interval)
 
 
-@client.event
 async def on_ready():
+    global started
+    # 再接続時にもon_readyは呼ばれるため、復元は初回のみ行う
+    if not started:
+        started = True
+        await startup()
+    if config.metrics_enabled:
+        loop_lag.start()
+    if config.metrics_port is not None:
+        await metrics_server.start()
+    if config.metrics_log_interval > 0:
+        metrics_logger.start()
     print("Bot Started")
 
 
-@client.event
-async def on_message(message: discord.Message):
+async def reply_invalid(ctx: Context):
+    if ctx.is_dm:
+        await ctx.author.info.send(catalog.get("WarningInvalidCommand", context_language(ctx)))
+    else:
+        outbox.post(
+            ctx.channel, ctx.author.info.mention + catalog.get("WarningInvalidCommand", context_language(ctx))
+        )
 
-    # bot自身の発言は無視する
-    if message.author.bot:
-        return
 
-    # スラッシュから始まる文言以外は無視する
-    if not message.content.startswith("/"):
-        return
+commands = CommandRegistry(reply_invalid)
 
-    channel: discord.TextChannel = message.channel
-    author: User = User(message.author)
-    commands = message.content.split()
 
-    # DMでのコマンド
-    if isinstance(message.channel, discord.DMChannel) and client.user == message.channel.me:
-        if commands[0] == "/vote":
-            if len(commands) != 2 or not commands[1].isdecimal():
-                await author.info.send(output["WarningInvalidCommand"][language])
-                return
+# ゲームが無い場合、状態を変えないコマンドには保持しない一時的なゲームで応答する
+# ゲームを作成するのは参加コマンドのみで、上限に達している場合はNoneを返す
+def game_of(channel: discord.TextChannel, create: bool = False) -> Optional[Game]:
+    game = games.get(channel.id)
+    if game is None:
+        game = Game(channel)
+        if create and not games.add(game):
+            return None
+    return game
 
-            for game in games.values():
-                if await game.is_exist(author) and await game.vote(author, int(commands[1])):
-                    return
-            return
 
-        if commands[0] == "/name":
-            for game in games.values():
-                if await game.is_exist(author):
-                    await game.inform_summoner_name(author, message.content[6:])
-                    return
+# チャンネルで開催されているゲーム情報を全てリセット
+@commands.command("/reset")
+async def reset_command(ctx: Context):
+    await game_of(ctx.channel).reset(ctx.author)
 
-        return
 
-    # スラッシュコマンドは削除する
-    await message.delete()
+@commands.command("/join", Arg("target"))
+async def join_command(ctx: Context, target: str):
+    game = game_of(ctx.channel, create=True)
+    if game is None:
+        outbox.post(ctx.channel, ctx.author.info.mention + catalog.get("TooManyGames", context_language(ctx)))
+    elif target == "host":
+        await game.join_as_host(ctx.author)
+    else:
+        await game.join_as_player(ctx.author, target)
 
-    # もしコマンド受付が初回だった場合はゲームオブジェクトを作成
-    if channel not in games:
-        games[channel] = Game(channel)
 
-    # チャンネルで開催されているゲーム情報を全てリセット
-    if commands[0] == "/reset":
-        await games[channel].reset(author)
-        return
+@commands.command("/quit", Arg("target"))
+async def quit_command(ctx: Context, target: str):
+    if target == "host":
+        await game_of(ctx.channel).quit_host(ctx.author)
+    else:
+        await game_of(ctx.channel).quit_player(ctx.author, target)
 
-    if commands[0] == "/join":
-        if len(commands) != 2:
-            await channel.send(author.info.mention + output["WarningInvalidCommand"][language])
-            return
 
-        if commands[1] == "host":
-            await games[channel].join_as_host(author)
-        else:
-            await games[channel].join_as_player(author, commands[1])
+@commands.command("/status")
+async def status_command(ctx: Context):
+    game = games.get(ctx.channel.id)
+    if game is None:
+        # ゲームが無いチャンネルでは一時的なゲームで応答するため、毎回新しいメッセージを固定しない
+        outbox.post(ctx.channel, embed=await Game(ctx.channel).get_current_status(True))
         return
+    await game.show_status(True)
 
-    if commands[0] == "/quit":
-        if len(commands) != 2:
-            await channel.send(author.info.mention + output["WarningInvalidCommand"][language])
-            return
 
-        if commands[1] == "host":
-            await games[channel].quit_host(author)
-        else:
-            await games[channel].quit_player(author, commands[1])
+@commands.command("/start", Arg("time", int, 180))
+async def start_command(ctx: Context, time: int):
+    await game_of(ctx.channel).start(ctx.author, time)
+
+
+@commands.command("/balance", Arg("mode", str, ""))
+async def balance_command(ctx: Context, mode: str):
+    await game_of(ctx.channel).balance_teams(ctx.author, mode == "roles")
+
+
+@commands.command("/restart")
+async def restart_command(ctx: Context):
+    await game_of(ctx.channel).restart(ctx.author)
+
+
+@commands.command("/finish", Arg("time", int, 300))
+async def finish_command(ctx: Context, time: int):
+    await game_of(ctx.channel).finish(ctx.author, time)
+
+
+@commands.command("/extend", Arg("time", int, 60))
+async def extend_command(ctx: Context, time: int):
+    await game_of(ctx.channel).extend(ctx.author, time)
+
+
+@commands.command("/aggregate")
+async def aggregate_command(ctx: Context):
+    await game_of(ctx.channel).aggregate(ctx.author)
+
+
+@commands.command("/help")
+async def help_command(ctx: Context):
+    language = context_language(ctx)
+    embed = discord.Embed(title="Help", color=0x0000FF)
+    embed.add_field(name=":comet: /reset", value=catalog.get("HelpReset", language))
+    embed.add_field(name=":angel: /join host", value=catalog.get("HelpJoinHost", language))
+    embed.add_field(name=":person_raising_hand: /join [blue|red]", value=catalog.get("HelpJoinTeams", language))
+    embed.add_field(name=":gloves: /quit [host|blue|red]", value=catalog.get("HelpQuit", language))
+    embed.add_field(name=":gear: /status", value=catalog.get("HelpStatus", language))
+    embed.add_field(name=":video_game: /start", value=catalog.get("HelpStart", language))
+    embed.add_field(name=":alarm_clock: /finish", value=catalog.get("HelpFinish", language))
+    embed.add_field(name=":hourglass: /extend", value=catalog.get("HelpExtend", language))
+    embed.add_field(name=":desktop: /aggregate", value=catalog.get("HelpAggregate", language))
+    embed.add_field(name=":globe_with_meridians: /language [code]", value=catalog.get("HelpLanguage", language))
+    embed.add_field(name=":scales: /balance [roles]", value=catalog.get("HelpBalance", language))
+    embed.add_field(name=":compass: /position [role]", value=catalog.get("HelpPosition", language))
+    embed.add_field(name=":trophy: /leaderboard", value=catalog.get("HelpLeaderboard", language))
+    embed.add_field(name=":bar_chart: /stats", value=catalog.get("HelpStats", language))
+    outbox.post(ctx.channel, embed=embed)
+
+
+@commands.command("/language", Arg("code"))
+async def language_command(ctx: Context, code: str):
+    language = context_language(ctx)
+    if not ctx.author.info.guild_permissions.manage_guild:
+        outbox.post(ctx.channel, ctx.author.info.mention + catalog.get("WarningManageGuildOnly", language))
         return
 
-    if commands[0] == "/status":
-        await channel.send(embed=await games[channel].get_current_status(True))
+    if code not in catalog.languages:
+        outbox.post(ctx.channel, catalog.get("UnsupportedLanguage", language, ", ".join(catalog.languages)))
         return
 
-    if commands[0] == "/start":
-        if len(commands) == 2:
-            if commands[1].isdecimal():
-                await games[channel].start(author, int(commands[1]))
-            else:
-                await channel.send(output["WarningInvalidCommand"][language])
-        else:
-            await games[channel].start(author)
+    guild_languages[ctx.channel.guild.id] = code
+    store.save_language(ctx.channel.guild.id, code)
+    outbox.post(ctx.channel, catalog.get("LanguageChanged", code, code))
+
+
+@commands.command("/leaderboard")
+async def leaderboard_command(ctx: Context):
+    ranking = history.leaderboard(ctx.channel.guild.id)
+    if not ranking:
+        outbox.post(ctx.channel, catalog.get("NoHistory", context_language(ctx)))
         return
 
-    if commands[0] == "/restart":
-        await games[channel].restart(author)
+    embed = discord.Embed(title="Leaderboard", color=0xFFD700)
+    embed.description = "".join(
+        [
+            "{}. <@{}>\t{} pts\t({}/{} wins)\n".format(i + 1, stats.member_id, stats.score, stats.wins, stats.games)
+            for i, stats in enumerate(ranking)
+        ]
+    )
+    outbox.post(ctx.channel, embed=embed)
+
+
+@commands.command("/stats")
+async def stats_command(ctx: Context):
+    stats = history.stats(ctx.author.info.id, ctx.channel.guild.id)
+    if stats is None:
+        outbox.post(ctx.channel, ctx.author.info.mention + catalog.get("NoHistory", context_language(ctx)))
         return
 
-    if commands[0] == "/finish":
-        if len(commands) == 2:
-            if commands[1].isdecimal():
-                await games[channel].finish(author, int(commands[1]))
-            else:
-                await channel.send(output["WarningInvalidCommand"][language])
-        else:
-            await games[channel].finish(author)
+    recent = history.recent(ctx.author.info.id, ctx.channel.guild.id)
+    embed = discord.Embed(title="Stats", description=ctx.author.info.mention, color=0xFFD700)
+    embed.add_field(name="Score", value=str(stats.score))
+    embed.add_field(name="Wins", value="{}/{}".format(stats.wins, stats.games))
+    embed.add_field(name="Werewolf Wins", value="{}/{}".format(stats.wolf_wins, stats.wolf_games))
+    embed.add_field(name="Correct Votes", value=str(stats.correct_votes))
+    embed.add_field(name="Recent Scores", value=" ".join([str(result.score) for result in recent]), inline=False)
+    outbox.post(ctx.channel, embed=embed)
+
+
+@commands.command("/vote", Arg("target", int), dm=True)
+async def vote_command(ctx: Context, target: int):
+    seat = players.seat_of(ctx.author.info.id)
+    if seat is not None:
+        await seat.game.vote(ctx.author, target)
+
+
+@commands.command("/name", Arg("summoner_name", rest=True), dm=True)
+async def name_command(ctx: Context, summoner_name: str):
+    seat = players.seat_of(ctx.author.info.id)
+    if seat is not None:
+        await seat.game.inform_summoner_name(ctx.author, summoner_name)
+
+
+@commands.command("/position", Arg("position"), dm=True)
+async def position_command(ctx: Context, position: str):
+    seat = players.seat_of(ctx.author.info.id)
+    if seat is not None:
+        await seat.game.set_position(ctx.author, position)
+
+
+async def handle_forwarded_dm(member_id: int, content: str) -> bool:
+    seat = players.seat_of(member_id)
+    command, text = commands.resolve(content, dm=True)
+    if seat is None or command is None:
+        return False
+    await commands.dispatch(command, Context(seat.user, None, is_dm=True), text)
+    return True
+
+
+async def on_message(message: discord.Message):
+
+    # bot自身の発言は無視する
+    if message.author.bot:
         return
 
-    if commands[0] == "/aggregate":
-        await games[channel].aggregate(author)
+    # スラッシュから始まる文言以外は無視する
+    if not message.content.startswith("/"):
         return
 
-    if commands[0] == "/help":
-        embed = discord.Embed(title="Help", color=0x0000FF)
-        embed.add_field(name=":comet: /reset", value=output["HelpReset"][language])
-        embed.add_field(name=":angel: /join host", value=output["HelpJoinHost"][language])
-        embed.add_field(name=":person_raising_hand: /join [blue|red]", value=output["HelpJoinTeams"][language])
-        embed.add_field(name=":gloves: /quit [host|blue|red]", value=output["HelpQuit"][language])
-        embed.add_field(name=":gear: /status", value=output["HelpStatus"][language])
-        embed.add_field(name=":video_game: /start", value=output["HelpStart"][language])
-        embed.add_field(name=":alarm_clock: /finish", value=output["HelpFinish"][language])
-        embed.add_field(name=":desktop: /aggregate", value=output["HelpAggregate"][language])
-        await channel.send(embed=embed)
+    # 登録されていないコマンドは、DMでは無視し、チャンネルではヘルプの案内を返す
+    is_dm = message.guild is None
+    command, text = commands.resolve(message.content, dm=is_dm)
+    if command is None:
+        if not is_dm:
+            await message.delete()
+            outbox.post(message.channel, catalog.get("HelpMessage", language_of(message.guild)))
+        return
+
+    author: User = players.user(message.author)
+
+    # DMでのコマンド
+    if is_dm:
+        # 他のシャードのゲームに参加している場合はそのシャードに転送する
+        if players.seat_of(author.info.id) is None:
+            shard_id = directory.lookup(author.info.id)
+            if shard_id is not None and not bus.is_local(shard_id):
+                await bus.forward(shard_id, author.info.id, message.content)
+                return
+        await commands.dispatch(command, Context(author, message.channel, is_dm=True), text)
         return
 
-    # どのコマンドにも一致しない場合
-    await channel.send(output["HelpMessage"][language])
+    # スラッシュコマンドは削除する
+    await message.delete()
+    await commands.dispatch(command, Context(author, message.channel), text)
+
+
+def create_app(app_config: Config) -> discord.Client:
+    global config, client, directory, bus, games, store, timers, players, fanout, outbox, riot, watcher
+    global champion_store, champions, cards, champion_sync, history, jobs, catalog, guild_languages
+    global metrics_server, metrics_logger
+    config = app_config
+
+    # 特権インテントはメッセージ本文のみを使い、メンバーは必要な時にAPIから取得する
+    intents = discord.Intents.default()
+    # discord.py 2.0以降はメッセージ本文の取得に明示的な指定が必要
+    if hasattr(intents, "message_content"):
+        intents.message_content = True
+
+    # 複数シャードの場合は、このプロセスが担当するシャードのギルドのゲームのみを持つ
+    if config.shard_count > 1:
+        client = discord.AutoShardedClient(
+            shard_count=config.shard_count, shard_ids=list(config.shard_ids), intents=intents
+        )
+        directory = SQLiteDirectory(config.shard_directory)
+    else:
+        client = discord.Client(intents=intents)
+        directory = MemoryDirectory()
+    if config.shard_peers is not None:
+        bus = HttpBus(config.shard_peers, config.shard_secret, port=config.shard_bus_port)
+    else:
+        bus = LocalBus()
+    bus.register(list(config.shard_ids), handle_forwarded_dm)
+
+    # メッセージの不足は接続する前に検出する
+    catalog = MessageCatalog.load("OutputMessage.json", DEFAULT_LANGUAGE, REQUIRED_MESSAGES)
+    games = GameRegistry(config.game_idle_ttl, config.max_games)
+    store = SQLiteStateStore(config.games_db)
+    guild_languages = store.load_languages()
+    timers = DeadlineScheduler()
+    players = PlayerRegistry(directory, config.shard_count)
+    fanout = FanOut()
+    outbox = Outbox(config.outbox_debounce)
+    riot = RiotClient(
+        config.riot_api_key,
+        base_url=config.riot_api_base_url,
+        cache=SummonerCache(config.summoners_db),
+        league_cache=LeagueCache(config.summoners_db),
+    )
+    watcher = ActiveGameWatcher(riot)
+    # チャンピオン情報はSQLiteのスナップショットから最初に使う時に読み込む
+    champion_store = ChampionStore(config.champions_db)
+    champions = ChampionRegistry("resources/champion.json", champion_store)
+    cards = ResultCardRenderer(
+        "resources/champion", "resources/champion.atlas", config.card_workers, font_path=config.card_font
+    )
+    champion_sync = ChampionSync(
+        champions,
+        champion_store,
+        DataDragon(config.ddragon_url, config.ddragon_locale),
+        "resources/champion",
+        cards.reload,
+    )
+    history = HistoryStore(config.history_db)
+    jobs = JobQueue(config.history_db, ingest_results)
+
+    metrics_server = MetricsServer(metrics, config.metrics_host, config.metrics_port or 0)
+    metrics_logger = MetricsLogger(metrics, config.metrics_log_interval)
+    if config.metrics_enabled:
+        discord_metrics.instrument(client)
+
+    client.event(on_ready)
+    client.event(on_message)
+    return client
+
+
+# 待機中の発言を送り、バックグラウンドの処理と接続を全て閉じる
+async def shutdown():
+    await outbox.flush_all()
+    champion_sync.stop()
+    jobs.close()
+    watcher.stop()
+    timers.stop()
+    loop_lag.stop()
+    metrics_logger.stop()
+    await metrics_server.stop()
+    await bus.stop()
+    cards.close()
+    await riot.close()
+    await champion_sync.dragon.close()
+    store.close()
+    history.close()
+    champion_store.close()
+
+
+# 接続以外の起動処理を行い、各段階にかかった時間をJSONで出力する
+async def dry_run(app_config: Config) -> Dict[str, float]:
+    phases: Dict[str, float] = {}
+    start = time.perf_counter()
+    create_app(app_config)
+    phases["create_app"] = time.perf_counter() - start
+
+    # 復元は接続後にチャンネルが必要なため、保存されたゲームの読み込みまでを計測する
+    start = time.perf_counter()
+    phases["saved_games"] = len(store.load())
+    phases["load_games"] = time.perf_counter() - start
+
+    await shutdown()
+    return phases
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="LoLWolf Discord bot")
+    parser.add_argument("--check-config", action="store_true", help="validate the configuration and exit")
+    parser.add_argument("--dry-run", action="store_true", help="start without connecting to Discord and exit")
+    args = parser.parse_args(argv)
+
+    # 設定やメッセージの誤りは、どの起動方法でもトレースバックではなくまとめて表示する
+    start = time.perf_counter()
+    try:
+        app_config = Config.from_env()
+        if args.check_config:
+            MessageCatalog.load("OutputMessage.json", DEFAULT_LANGUAGE, REQUIRED_MESSAGES)
+            print("Configuration OK")
+        elif args.dry_run:
+            phases = {"config": time.perf_counter() - start}
+            phases.update(asyncio.run(dry_run(app_config)))
+            print(json.dumps(phases))
+        else:
+            create_app(app_config).run(app_config.discord_token)
+    except (ConfigError, CatalogError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
 
 
-client.run(TOKEN)
+if __name__ == "__main__":
+    main()
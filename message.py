@@ -0,0 +1,109 @@
+import json
+import string
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+
+class CatalogError(Exception):
+    def __init__(self, problems: List[str]):
+        super().__init__("Invalid message catalog:\n" + "\n".join(problems))
+        self.problems: List[str] = problems
+
+
+class Message(object):
+    __slots__ = ("text", "fields", "format")
+
+    def __init__(self, text: str):
+        self.text: str = text
+        self.fields: Tuple[str, ...] = tuple(
+            field for _, field, _, _ in string.Formatter().parse(text) if field is not None
+        )
+        # プレースホルダが無いものは毎回formatせず、そのままの文字列を返す
+        self.format = text.format if self.fields else self._constant
+
+    def _constant(self, *args, **kwargs) -> str:
+        return self.text
+
+
+# OutputMessage.json を起動時に検証・コンパイルしたもの
+class MessageCatalog(object):
+    def __init__(self, tables: Dict[str, Dict[str, Message]], default_language: str):
+        self.tables: Dict[str, Dict[str, Message]] = tables
+        self.default_language: str = default_language
+
+    @property
+    def languages(self) -> List[str]:
+        return sorted(self.tables)
+
+    @classmethod
+    def load(
+        cls, path: str, default_language: str = "ja", required: Optional[Mapping[str, int]] = None
+    ) -> "MessageCatalog":
+        # json.loadは重複したキーを後のもので黙って上書きするため、読み込み時に検出する
+        duplicates: List[str] = []
+
+        def object_pairs(pairs: List[Tuple[str, Any]]) -> Dict[str, Any]:
+            result: Dict[str, Any] = {}
+            for key, value in pairs:
+                if key in result:
+                    duplicates.append(key)
+                result[key] = value
+            return result
+
+        with open(path, encoding="utf-8") as f:
+            raw: Dict[str, Dict[str, str]] = json.load(f, object_pairs_hook=object_pairs)
+        return cls.compile(raw, default_language, required, duplicates)
+
+    # requiredにはキーとプレースホルダの数を指定する (指定した場合、requiredに無いキーは使われていないとみなす)
+    @classmethod
+    def compile(
+        cls,
+        raw: Mapping[str, Mapping[str, str]],
+        default_language: str = "ja",
+        required: Optional[Mapping[str, int]] = None,
+        duplicates: Sequence[str] = (),
+    ) -> "MessageCatalog":
+        problems = [f"{key}: defined more than once" for key in duplicates]
+        languages = set(language for texts in raw.values() for language in texts)
+        languages.add(default_language)
+
+        compiled: Dict[str, Dict[str, Message]] = {}
+        for key, texts in raw.items():
+            compiled[key] = {}
+            for language, text in texts.items():
+                try:
+                    compiled[key][language] = Message(text)
+                except ValueError as e:
+                    problems.append(f"{key}[{language}]: {e}")
+            if default_language not in texts:
+                problems.append(f"{key}: missing default language {default_language!r}")
+
+            fields = set(message.fields for message in compiled[key].values())
+            if len(fields) > 1:
+                problems.append(f"{key}: placeholders differ between languages {sorted(fields)}")
+
+        if required is not None:
+            problems.extend(f"{key}: not used" for key in raw if key not in required)
+        for key, count in (required or {}).items():
+            if key not in raw:
+                problems.append(f"{key}: missing")
+                continue
+            for language, message in compiled[key].items():
+                if len(message.fields) != count:
+                    problems.append(f"{key}[{language}]: expected {count} placeholders, got {len(message.fields)}")
+
+        if problems:
+            raise CatalogError(problems)
+
+        # 言語ごとに、未翻訳のものは既定の言語で埋めた表を作っておく
+        tables = {}
+        for language in languages:
+            tables[language] = {
+                key: messages.get(language, messages[default_language]) for key, messages in compiled.items()
+            }
+        return cls(tables, default_language)
+
+    def get(self, key: str, language: Optional[str] = None, *args) -> str:
+        table = self.tables.get(language) if language is not None else None
+        if table is None:
+            table = self.tables[self.default_language]
+        return table[key].format(*args)
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+Labels = Dict[str, str]
+Collector = Callable[[], Iterable["Metric"]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, _escape(str(value))) for key, value in labels.items()) + "}"
+
+
+# 待ち時間や処理時間の分布 (Prometheusのヒストグラムとして出力する)
+class QueueMetrics(object):
+    BOUNDARIES = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+        self.histogram: List[int] = [0] * (len(QueueMetrics.BOUNDARIES) + 1)
+
+    def observe(self, wait: float):
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+        for i, boundary in enumerate(QueueMetrics.BOUNDARIES):
+            if wait <= boundary:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "histogram": dict(zip([str(b) for b in QueueMetrics.BOUNDARIES] + ["+Inf"], self.histogram)),
+        }
+
+
+# Prometheusのテキスト形式の1メトリクス分 (サンプルは収集時にのみ作る)
+class Metric(object):
+    def __init__(self, name: str, kind: str, help: str):
+        self.name: str = name
+        self.kind: str = kind
+        self.help: str = help
+        self.samples: List[Tuple[str, Labels, float]] = []
+
+    def add(self, value: float, **labels: Any) -> "Metric":
+        self.samples.append(("", labels, value))
+        return self
+
+    def add_histogram(self, metrics: QueueMetrics, **labels: Any) -> "Metric":
+        cumulative = 0
+        for boundary, count in zip(QueueMetrics.BOUNDARIES, metrics.histogram):
+            cumulative += count
+            self.samples.append(("_bucket", dict(labels, le=str(boundary)), cumulative))
+        self.samples.append(("_bucket", dict(labels, le="+Inf"), metrics.count))
+        self.samples.append(("_sum", labels, metrics.total))
+        self.samples.append(("_count", labels, metrics.count))
+        return self
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} {}".format(self.name, self.kind)]
+        for suffix, labels, value in self.samples:
+            lines.append("{}{}{} {}".format(self.name, suffix, _format_labels(labels), value))
+        return lines
+
+
+# 各コンポーネントが既に持っている統計を、スクレイプ・ログ出力の時にだけ集める
+class Metrics(object):
+    def __init__(self):
+        self.collectors: List[Collector] = []
+
+    def register(self, collector: Collector):
+        self.collectors.append(collector)
+
+    def collect(self) -> List[Metric]:
+        return [metric for collector in self.collectors for metric in collector()]
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.collect() for line in metric.render()) + "\n"
+
+    # 構造化ログ用に、ヒストグラムのバケットを除いた値を平坦な辞書にする
+    def snapshot(self) -> Dict[str, float]:
+        snapshot = {}
+        for metric in self.collect():
+            for suffix, labels, value in metric.samples:
+                if suffix != "_bucket":
+                    snapshot[metric.name + suffix + _format_labels(labels)] = value
+        return snapshot
+
+
+# 一定間隔でsleepし、予定より遅れて起きた時間をイベントループの遅延とみなす
+class LoopLagMonitor(object):
+    def __init__(self, interval: float = 0.5, keep_samples: bool = False):
+        self.interval: float = interval
+        self.lag: QueueMetrics = QueueMetrics()
+        self.last: float = 0.0
+        self.samples: Optional[List[float]] = [] if keep_samples else None
+        self._task: Optional[asyncio.Future] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last = max(loop.time() - start - self.interval, 0.0)
+            self.lag.observe(self.last)
+            if self.samples is not None:
+                self.samples.append(self.last)
+
+    def collect(self) -> List[Metric]:
+        return [
+            Metric("lolwolf_event_loop_lag_seconds", "histogram", "Event loop lag").add_histogram(self.lag),
+            Metric("lolwolf_event_loop_last_lag_seconds", "gauge", "Most recent event loop lag").add(self.last),
+        ]
+
+
+class _RateLimitHandler(logging.Handler):
+    def __init__(self, metrics: "DiscordMetrics"):
+        super().__init__(logging.WARNING)
+        self.metrics: DiscordMetrics = metrics
+
+    def emit(self, record: logging.LogRecord):
+        # discord.pyは429を内部で待って再試行し、その際に警告を出す
+        message = str(record.msg)
+        if "429" in message or "rate limited" in message:
+            self.metrics.rate_limited += 1
+
+
+# discord.pyのHTTPクライアントを包んで、APIの呼び出し回数とエラーを数える
+class DiscordMetrics(object):
+    def __init__(self):
+        self.calls: Dict[Tuple[str, str, str], int] = Counter()
+        self.latency: Dict[str, QueueMetrics] = {}
+        self.rate_limited: int = 0
+
+    def instrument(self, client: Any):
+        http = client.http
+        request = http.request
+
+        async def instrumented(route: Any, **kwargs: Any) -> Any:
+            start = time.monotonic()
+            status = "error"
+            try:
+                result = await request(route, **kwargs)
+                status = "ok"
+                return result
+            except Exception as e:
+                status = str(getattr(e, "status", "error"))
+                raise
+            finally:
+                self.calls[(route.method, route.path, status)] += 1
+                if route.path not in self.latency:
+                    self.latency[route.path] = QueueMetrics()
+                self.latency[route.path].observe(time.monotonic() - start)
+
+        http.request = instrumented
+        logging.getLogger("discord.http").addHandler(_RateLimitHandler(self))
+
+    def collect(self) -> List[Metric]:
+        calls = Metric("lolwolf_discord_requests_total", "counter", "Discord API requests")
+        for (method, path, status), count in self.calls.items():
+            calls.add(count, method=method, route=path, status=status)
+        latency = Metric("lolwolf_discord_request_seconds", "histogram", "Discord API request latency")
+        for path, metrics in self.latency.items():
+            latency.add_histogram(metrics, route=path)
+        rate_limited = Metric("lolwolf_discord_rate_limited_total", "counter", "Discord API 429 responses")
+        return [calls, latency, rate_limited.add(self.rate_limited)]
+
+
+def collect_riot(riot: Any) -> List[Metric]:
+    responses = Metric("lolwolf_riot_responses_total", "counter", "Riot API responses by status")
+    for (method, status), count in riot.responses.items():
+        responses.add(count, method=method, status=status)
+    latency = Metric("lolwolf_riot_request_seconds", "histogram", "Riot API request latency")
+    for method, metrics in riot.latency.items():
+        latency.add_histogram(metrics, method=method)
+    queue = Metric("lolwolf_riot_queue_wait_seconds", "histogram", "Time spent waiting for the Riot rate limit")
+    for priority, metrics in riot.scheduler.metrics.items():
+        queue.add_histogram(metrics, priority=priority.name.lower())
+    pending = Metric("lolwolf_riot_queue_pending", "gauge", "Riot API requests waiting for the rate limit")
+    metrics = [responses, latency, queue, pending.add(riot.scheduler.pending())]
+    if riot.cache is not None:
+        cache = Metric("lolwolf_summoner_cache_total", "counter", "Summoner cache lookups")
+        metrics.append(cache.add(riot.cache.hits, result="hit").add(riot.cache.misses, result="miss"))
+    if riot.league_cache is not None:
+        cache = Metric("lolwolf_league_cache_total", "counter", "Ranked entry cache lookups")
+        metrics.append(cache.add(riot.league_cache.hits, result="hit").add(riot.league_cache.misses, result="miss"))
+    return metrics
+
+
+def collect_commands(registry: Any) -> List[Metric]:
+    latency = Metric("lolwolf_command_seconds", "histogram", "Time spent handling a command")
+    for command in list(registry.guild_commands.values()) + list(registry.dm_commands.values()):
+        latency.add_histogram(command.latency, command=command.name, dm=str(command.dm).lower())
+    return [latency]
+
+
+def collect_fanout(fanout: Any) -> List[Metric]:
+    durations = Metric("lolwolf_fanout_seconds", "histogram", "Time to send one batch of DMs or nickname changes")
+    for label, metrics in fanout.durations.items():
+        durations.add_histogram(metrics, label=label)
+    return [durations]
+
+
+# /metrics でPrometheusのテキスト形式を返す
+class MetricsServer(object):
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 0):
+        self.metrics: Metrics = metrics
+        self.host: str = host
+        self.port: int = port
+        self._runner: Optional["web.AppRunner"] = None
+
+    async def _scrape(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        # エンドポイントを有効にした場合のみ使うため、aiohttp.webは起動時には読み込まない
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._scrape)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# 一定間隔で1行のJSONとして標準出力に書き出す
+class MetricsLogger(object):
+    def __init__(self, metrics: Metrics, interval: float = 60.0):
+        self.metrics: Metrics = metrics
+        self.interval: float = interval
+        self._task: Optional[asyncio.Future] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            line = json.dumps({"time": time.time(), "metrics": self.metrics.snapshot()}, ensure_ascii=False)
+            print(line, flush=True)
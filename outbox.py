@@ -0,0 +1,233 @@
+import asyncio
+import discord
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class _Item(object):
+    __slots__ = ("content", "embed", "file", "alone", "future", "parts")
+
+    def __init__(
+        self, content: Optional[str], embed: Optional[discord.Embed], file: Optional[discord.File], alone: bool
+    ):
+        self.content: Optional[str] = content
+        self.embed: Optional[discord.Embed] = embed
+        self.file: Optional[discord.File] = file
+        # 固定表示するメッセージなどは、前後の発言とまとめずに単独で送る
+        self.alone: bool = alone
+        self.future: asyncio.Future = asyncio.get_event_loop().create_future()
+        # 長い本文は複数のメッセージに分割されるため、全て送信し終えた時点で完了とする
+        self.parts: int = 0
+
+
+class _Batch(object):
+    __slots__ = ("lines", "length", "embeds", "embed_size", "file", "items")
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.length: int = 0
+        self.embeds: List[discord.Embed] = []
+        self.embed_size: int = 0
+        self.file: Optional[discord.File] = None
+        self.items: List[_Item] = []
+
+    def add(self, item: _Item):
+        if not self.items or self.items[-1] is not item:
+            self.items.append(item)
+            item.parts += 1
+
+
+class _Queue(object):
+    __slots__ = ("channel", "items", "handle", "lock")
+
+    def __init__(self, channel: Any):
+        self.channel: Any = channel
+        self.items: List[_Item] = []
+        self.handle: Optional[asyncio.TimerHandle] = None
+        self.lock: asyncio.Lock = asyncio.Lock()
+
+
+def split_content(content: str, limit: int) -> List[str]:
+    # なるべく改行の位置で分割する
+    chunks = []
+    while len(content) > limit:
+        cut = content.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            chunks.append(content[:limit])
+            content = content[limit:]
+        else:
+            chunks.append(content[:cut])
+            content = content[cut + 1:]
+    chunks.append(content)
+    return chunks
+
+
+# チャンネルごとの送信キュー
+# 短い間に続けて送られた文言や埋め込みを、順序を保ったまま一つのメッセージにまとめて送る
+class Outbox(object):
+    DEFAULT_DEBOUNCE = 0.2
+    MAX_CONTENT = 2000
+    # discord.py 1.x は一つのメッセージに一つの埋め込みしか送れない
+    MAX_EMBEDS = 10 if discord.version_info.major >= 2 else 1
+    MAX_EMBED_SIZE = 6000
+    MAX_CHANNEL_STATS = 10000
+
+    def __init__(self, debounce: float = DEFAULT_DEBOUNCE):
+        self.debounce: float = debounce
+        self.requested: int = 0
+        self.sent: int = 0
+        self.failed: int = 0
+        self._queues: Dict[int, _Queue] = {}
+        # チャンネルごとの (依頼数, 送信を試みた数)
+        self._channel_stats: "OrderedDict[int, List[int]]" = OrderedDict()
+
+    # 送信を予約してすぐに戻る (送信先のメッセージはfutureで受け取れる)
+    def post(
+        self,
+        channel: Any,
+        content: Optional[str] = None,
+        embed: Optional[discord.Embed] = None,
+        file: Optional[discord.File] = None,
+        alone: bool = False,
+    ) -> asyncio.Future:
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = _Queue(channel)
+        item = _Item(content, embed, file, alone)
+        queue.items.append(item)
+        self.requested += 1
+        self._count(channel.id, 1, 0)
+        if queue.handle is None:
+            queue.handle = asyncio.get_event_loop().call_later(
+                self.debounce, lambda: asyncio.ensure_future(self.flush(channel))
+            )
+        return item.future
+
+    # 予約済みのものと一緒にすぐに送信し、送信したメッセージを返す
+    async def send(
+        self,
+        channel: Any,
+        content: Optional[str] = None,
+        embed: Optional[discord.Embed] = None,
+        file: Optional[discord.File] = None,
+        alone: bool = False,
+    ) -> Optional[discord.Message]:
+        future = self.post(channel, content, embed, file, alone)
+        await self.flush(channel)
+        return await future
+
+    async def flush(self, channel: Any):
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            return
+        if queue.handle is not None:
+            queue.handle.cancel()
+            queue.handle = None
+
+        # 前の送信が終わるまで待ち、メッセージの順序が入れ替わらないようにする
+        async with queue.lock:
+            items, queue.items = queue.items, []
+            for batch in self._pack(items):
+                await self._send_batch(channel, batch)
+            if not queue.items and queue.handle is None and self._queues.get(channel.id) is queue:
+                del self._queues[channel.id]
+
+    # 終了時などに、待機中の発言を全て送る
+    async def flush_all(self):
+        await asyncio.gather(*[self.flush(queue.channel) for queue in list(self._queues.values())])
+
+    def _pack(self, items: List[_Item]) -> List[_Batch]:
+        batches = [_Batch()]
+
+        def current() -> _Batch:
+            return batches[-1]
+
+        def start() -> _Batch:
+            batches.append(_Batch())
+            return batches[-1]
+
+        for item in items:
+            if item.alone and current().items:
+                start()
+            if item.content:
+                for chunk in split_content(item.content, Outbox.MAX_CONTENT):
+                    batch = current()
+                    # 本文は埋め込みや添付より上に表示されるため、それらの後ろには追加しない
+                    if batch.embeds or batch.file is not None or batch.length + len(chunk) + 1 > Outbox.MAX_CONTENT:
+                        batch = start()
+                    batch.lines.append(chunk)
+                    batch.length += len(chunk) + 1
+                    batch.add(item)
+            if item.file is not None:
+                batch = current()
+                if batch.embeds or batch.file is not None:
+                    batch = start()
+                batch.file = item.file
+                batch.add(item)
+            if item.embed is not None:
+                batch = current()
+                size = len(item.embed)
+                if (
+                    batch.file is not None
+                    or len(batch.embeds) >= Outbox.MAX_EMBEDS
+                    or (batch.embeds and batch.embed_size + size > Outbox.MAX_EMBED_SIZE)
+                ):
+                    batch = start()
+                batch.embeds.append(item.embed)
+                batch.embed_size += size
+                batch.add(item)
+            if item.alone:
+                start()
+        return [batch for batch in batches if batch.items]
+
+    async def _send_batch(self, channel: Any, batch: _Batch):
+        kwargs: Dict[str, Any] = {}
+        if batch.lines:
+            kwargs["content"] = "\n".join(batch.lines)
+        if len(batch.embeds) == 1:
+            kwargs["embed"] = batch.embeds[0]
+        elif batch.embeds:
+            kwargs["embeds"] = batch.embeds
+        if batch.file is not None:
+            kwargs["file"] = batch.file
+
+        message: Optional[discord.Message] = None
+        try:
+            message = await channel.send(**kwargs)
+            self.sent += 1
+            self._count(channel.id, 0, 1)
+        except discord.HTTPException as e:
+            self.failed += 1
+            self._count(channel.id, 0, 1)
+            print("Failed to send to {}: {}".format(channel.id, e))
+        finally:
+            # 複数のメッセージに分割された場合は最後のメッセージを返す
+            for item in batch.items:
+                item.parts -= 1
+                if item.parts == 0 and not item.future.done():
+                    item.future.set_result(message)
+
+    def _count(self, channel_id: int, requested: int, sent: int):
+        stats = self._channel_stats.get(channel_id)
+        if stats is None:
+            stats = self._channel_stats[channel_id] = [0, 0]
+            if len(self._channel_stats) > Outbox.MAX_CHANNEL_STATS:
+                self._channel_stats.popitem(last=False)
+        self._channel_stats.move_to_end(channel_id)
+        stats[0] += requested
+        stats[1] += sent
+
+    # まとめたことで減らせたメッセージ数
+    def saved(self, channel_id: Optional[int] = None) -> int:
+        if channel_id is None:
+            return self.requested - self.sent - self.failed
+        requested, sent = self._channel_stats.get(channel_id, (0, 0))
+        return requested - sent
+
+    # ゲームの終了時に、そのチャンネルで減らせたメッセージ数を返して数え直す
+    def take_saved(self, channel_id: int) -> int:
+        requested, sent = self._channel_stats.pop(channel_id, (0, 0))
+        return requested - sent
+
+    def stats(self) -> Dict[str, int]:
+        return {"requested": self.requested, "sent": self.sent, "failed": self.failed, "pending": len(self._queues)}
@@ -0,0 +1,100 @@
+import discord
+from typing import Any, Dict, List, Optional
+from shard import MemberDirectory, shard_for_guild
+
+
+class User(object):
+    __slots__ = (
+        "info",
+        "is_wolf",
+        "is_vote",
+        "is_votable",
+        "voted_to",
+        "voted_from",
+        "summoner_name",
+        "summoner_id",
+        "champion_name",
+        "position",
+        "display_name",
+    )
+
+    def __init__(self, info: discord.Member):
+        self.info: discord.Member = info
+        self.is_wolf: bool = False
+        self.is_vote: bool = False
+        self.is_votable: bool = True
+        self.voted_to: int = -1
+        self.voted_from: int = 0
+        self.summoner_name: Optional[str] = None
+        self.summoner_id: Optional[str] = None
+        self.champion_name: Optional[str] = None
+        self.position: str = "mid"
+        self.display_name = self.info.display_name
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, User):
+            raise NotImplementedError("Different type equality check happned.")
+        return self.info.id == other.info.id
+
+    def __hash__(self) -> int:
+        return hash(self.info.id)
+
+
+class Seat(object):
+    __slots__ = ("game", "team", "slot", "user")
+
+    def __init__(self, game: Any, team: str, slot: int, user: User):
+        self.game: Any = game
+        self.team: str = team
+        self.slot: int = slot
+        self.user: User = user
+
+
+# DiscordのメンバーIDから参加中のゲーム・チーム・位置をO(1)で引けるようにする
+# directoryを指定すると、シャードを跨いだDMの転送先として参加先のシャードを登録する
+class PlayerRegistry(object):
+    def __init__(self, directory: Optional[MemberDirectory] = None, shard_count: int = 1):
+        self.seats: Dict[int, Seat] = {}
+        self.directory: Optional[MemberDirectory] = directory
+        self.shard_count: int = shard_count
+
+    def __len__(self) -> int:
+        return len(self.seats)
+
+    # 参加中のプレイヤーであれば既存のUserを再利用する
+    def user(self, member: discord.abc.User) -> User:
+        seat = self.seats.get(member.id)
+        if seat is None:
+            return User(member)
+        # DMからのメッセージではdiscord.Userになるため、Memberの場合のみ更新する
+        if isinstance(member, discord.Member):
+            seat.user.info = member
+        return seat.user
+
+    def seat_of(self, member_id: int) -> Optional[Seat]:
+        return self.seats.get(member_id)
+
+    def seat(self, user: User, game: Any, team: str, slot: int) -> Seat:
+        seat = Seat(game, team, slot, user)
+        self.seats[user.info.id] = seat
+        if self.directory is not None:
+            self.directory.assign(user.info.id, shard_for_guild(game.channel.guild.id, self.shard_count))
+        return seat
+
+    def unseat(self, user: User):
+        if self.seats.pop(user.info.id, None) is not None and self.directory is not None:
+            self.directory.release(user.info.id)
+
+    # プレイヤーが抜けた際にチーム内の位置を振り直す
+    def reindex(self, game: Any, team: str, users: List[User]):
+        for slot, user in enumerate(users):
+            seat = self.seats.get(user.info.id)
+            if seat is not None and seat.game is game:
+                seat.team = team
+                seat.slot = slot
+
+    def release(self, game: Any, users: List[User]):
+        for user in users:
+            seat = self.seats.get(user.info.id)
+            if seat is not None and seat.game is game:
+                self.unseat(user)
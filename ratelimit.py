@@ -0,0 +1,231 @@
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Dict, List, Mapping, Optional, Tuple
+from metrics import QueueMetrics
+
+
+class Priority(IntEnum):
+    # プレイヤーが応答を待っているリクエスト (サモナー検索など)
+    INTERACTIVE = 0
+    # バックグラウンドのポーリング (観戦APIなど)
+    BACKGROUND = 1
+
+
+# "20:1,100:120" 形式のヘッダを [(20, 1.0), (100, 120.0)] に変換する
+def parse_rate_limit(header: str) -> List[Tuple[int, float]]:
+    limits = []
+    for part in header.split(","):
+        if ":" not in part:
+            continue
+        count, window = part.strip().split(":")
+        limits.append((int(count), float(window)))
+    return limits
+
+
+# Riotのレート制限は固定ウィンドウで数えられる
+# ウィンドウは最初のリクエストで始まり、その時点からwindow秒後にカウントが0に戻る
+class FixedWindow(object):
+    def __init__(self, limit: int, window: float):
+        self.limit: int = limit
+        self.window: float = window
+        self.count: int = 0
+        self.started: Optional[float] = None
+
+    def _roll(self, now: float):
+        if self.started is not None and now >= self.started + self.window:
+            self.started = None
+            self.count = 0
+
+    def delay(self, now: float) -> float:
+        self._roll(now)
+        if self.count < self.limit:
+            return 0.0
+        return self.started + self.window - now
+
+    def consume(self, now: float):
+        self._roll(now)
+        if self.started is None:
+            self.started = now
+        self.count += 1
+
+    # サーバ側のカウントと同期して、ローカルの見積もりが甘い場合は補正する
+    def sync(self, used: int, now: float):
+        self._roll(now)
+        if used == 1:
+            # サーバではこのリクエストでウィンドウが始まったため、遅い方の応答時刻を開始とみなす
+            self.started = now
+        elif self.started is None and used > 0:
+            self.started = now
+        self.count = max(self.count, used)
+
+
+class RateLimit(object):
+    def __init__(self, limits: Optional[List[Tuple[int, float]]] = None):
+        self.windows: Dict[float, FixedWindow] = {}
+        self.blocked_until: float = 0.0
+        self.limit_header: Optional[str] = None
+        if limits:
+            self.configure(limits, time.monotonic())
+
+    def configure(self, limits: List[Tuple[int, float]], now: float):
+        windows = {}
+        for limit, window in limits:
+            current = self.windows.get(window)
+            if current is None:
+                current = FixedWindow(limit, window)
+            current.limit = limit
+            windows[window] = current
+        self.windows = windows
+
+    # 制限の設定が変わった場合はTrueを返す
+    def update(self, limit_header: Optional[str], count_header: Optional[str], now: float) -> bool:
+        changed = False
+        if limit_header and limit_header != self.limit_header:
+            self.limit_header = limit_header
+            self.configure(parse_rate_limit(limit_header), now)
+            changed = True
+        if count_header:
+            for used, window in parse_rate_limit(count_header):
+                current = self.windows.get(window)
+                if current is not None:
+                    current.sync(used, now)
+        return changed
+
+    def delay(self, now: float) -> float:
+        delay = max(0.0, self.blocked_until - now)
+        for window in self.windows.values():
+            delay = max(delay, window.delay(now))
+        return delay
+
+    def consume(self, now: float):
+        for window in self.windows.values():
+            window.consume(now)
+
+    def block(self, seconds: float, now: float):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class _Waiter(object):
+    __slots__ = ("priority", "seq", "region", "method", "enqueued", "future")
+
+    def __init__(self, priority: int, seq: int, region: str, method: str, future: asyncio.Future):
+        self.priority: int = priority
+        self.seq: int = seq
+        self.region: str = region
+        self.method: str = method
+        self.enqueued: float = time.monotonic()
+        self.future: asyncio.Future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+# 全てのRiot APIリクエストはこのスケジューラで順番待ちをしてから送信される
+class RiotScheduler(object):
+    # 開発用APIキーの初期値 (レスポンスヘッダで上書きされる)
+    DEFAULT_APP_LIMITS = [(20, 1.0), (100, 120.0)]
+
+    def __init__(self, app_limits: Optional[List[Tuple[int, float]]] = None):
+        self.app_limits: List[Tuple[int, float]] = app_limits or RiotScheduler.DEFAULT_APP_LIMITS
+        self.app: Dict[str, RateLimit] = {}
+        self.methods: Dict[Tuple[str, str], RateLimit] = {}
+        self.metrics: Dict[Priority, QueueMetrics] = {priority: QueueMetrics() for priority in Priority}
+        self._queue: List[_Waiter] = []
+        # 制限に掛かった待機は、送信できるようになる時刻まで優先度のキューから外しておく
+        self._parked: List[Tuple[float, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _app(self, region: str) -> RateLimit:
+        if region not in self.app:
+            self.app[region] = RateLimit(self.app_limits)
+        return self.app[region]
+
+    def _method(self, region: str, method: str) -> RateLimit:
+        key = (region, method)
+        if key not in self.methods:
+            self.methods[key] = RateLimit()
+        return self.methods[key]
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._dispatch())
+
+    async def acquire(self, region: str, method: str, priority: Priority = Priority.BACKGROUND):
+        self._ensure_running()
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._queue, _Waiter(priority, next(self._seq), region, method, future))
+        self._wakeup.set()
+        await future
+
+    def update(self, region: str, method: str, headers: Mapping[str, str]):
+        now = time.monotonic()
+        app_changed = self._app(region).update(
+            headers.get("X-App-Rate-Limit"), headers.get("X-App-Rate-Limit-Count"), now
+        )
+        method_changed = self._method(region, method).update(
+            headers.get("X-Method-Rate-Limit"), headers.get("X-Method-Rate-Limit-Count"), now
+        )
+        # 制限が緩くなった場合は予定より早く送れるため、外していた待機を全て戻す
+        if (app_changed or method_changed) and self._parked:
+            for _, _, waiter in self._parked:
+                heapq.heappush(self._queue, waiter)
+            self._parked = []
+            self._wakeup.set()
+
+    # 429を受け取った場合、Retry-Afterの間は該当する制限を止める
+    def penalize(self, region: str, method: str, headers: Mapping[str, str]) -> float:
+        retry_after = float(headers.get("Retry-After", 1))
+        now = time.monotonic()
+        if headers.get("X-Rate-Limit-Type") == "application":
+            self._app(region).block(retry_after, now)
+        else:
+            self._method(region, method).block(retry_after, now)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return retry_after
+
+    def pending(self) -> int:
+        return len(self._queue) + len(self._parked)
+
+    def stats(self) -> Dict[str, object]:
+        return {priority.name.lower(): metrics.snapshot() for priority, metrics in self.metrics.items()}
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._parked and self._parked[0][0] <= now:
+                heapq.heappush(self._queue, heapq.heappop(self._parked)[2])
+
+            # 優先度順に取り出し、送信可能な最初のリクエストを通す
+            dispatched = False
+            while self._queue:
+                waiter = heapq.heappop(self._queue)
+                if waiter.future.cancelled():
+                    continue
+                app = self._app(waiter.region)
+                method = self._method(waiter.region, waiter.method)
+                wait = max(app.delay(now), method.delay(now))
+                if wait > 0:
+                    heapq.heappush(self._parked, (now + wait, waiter.seq, waiter))
+                    continue
+                app.consume(now)
+                method.consume(now)
+                self.metrics[Priority(waiter.priority)].observe(now - waiter.enqueued)
+                waiter.future.set_result(None)
+                dispatched = True
+                break
+
+            if dispatched:
+                continue
+            delay = self._parked[0][0] - now if self._parked else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
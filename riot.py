@@ -0,0 +1,311 @@
+import asyncio
+import time
+import urllib.parse
+import aiohttp
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple
+from metrics import QueueMetrics
+from ratelimit import Priority, RiotScheduler
+
+if TYPE_CHECKING:
+    from summoner_cache import LeagueCache, SummonerCache
+
+
+class RiotAPIError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"Riot API returned {status} {message}".rstrip())
+        self.status: int = status
+
+
+class Summoner(NamedTuple):
+    id: str
+    account_id: str
+    puuid: str
+    name: str
+    summoner_level: int
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Summoner":
+        return cls(
+            id=data["id"],
+            account_id=data.get("accountId", ""),
+            puuid=data.get("puuid", ""),
+            name=data["name"],
+            summoner_level=data.get("summonerLevel", 0),
+        )
+
+
+class Participant(NamedTuple):
+    summoner_id: str
+    summoner_name: str
+    champion_id: int
+    team_id: int
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Participant":
+        return cls(
+            summoner_id=data.get("summonerId", ""),
+            summoner_name=data["summonerName"],
+            champion_id=data["championId"],
+            team_id=data.get("teamId", 0),
+        )
+
+
+class ActiveGame(NamedTuple):
+    game_id: int
+    game_start_time: int
+    participants: List[Participant]
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "ActiveGame":
+        return cls(
+            game_id=data.get("gameId", 0),
+            game_start_time=data.get("gameStartTime", 0),
+            participants=[Participant.from_json(p) for p in data["participants"]],
+        )
+
+
+class LeagueEntry(NamedTuple):
+    queue_type: str
+    tier: str
+    rank: str
+    league_points: int
+    wins: int
+    losses: int
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "LeagueEntry":
+        return cls(
+            queue_type=data["queueType"],
+            tier=data.get("tier", ""),
+            rank=data.get("rank", ""),
+            league_points=data.get("leaguePoints", 0),
+            wins=data.get("wins", 0),
+            losses=data.get("losses", 0),
+        )
+
+
+class MatchParticipant(NamedTuple):
+    puuid: str
+    summoner_id: str
+    summoner_name: str
+    champion_id: int
+    team_id: int
+    win: bool
+    kills: int
+    deaths: int
+    assists: int
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "MatchParticipant":
+        return cls(
+            puuid=data.get("puuid", ""),
+            summoner_id=data.get("summonerId", ""),
+            summoner_name=data.get("summonerName", ""),
+            champion_id=data.get("championId", 0),
+            team_id=data.get("teamId", 0),
+            win=bool(data.get("win", False)),
+            kills=data.get("kills", 0),
+            deaths=data.get("deaths", 0),
+            assists=data.get("assists", 0),
+        )
+
+
+class Match(NamedTuple):
+    match_id: str
+    game_duration: int
+    participants: List[MatchParticipant]
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Match":
+        info = data["info"]
+        return cls(
+            match_id=data["metadata"]["matchId"],
+            game_duration=info.get("gameDuration", 0),
+            participants=[MatchParticipant.from_json(p) for p in info["participants"]],
+        )
+
+
+# match-v5はプラットフォームではなく地域単位のホストで提供される
+ROUTING = {
+    "jp1": "asia",
+    "kr": "asia",
+    "na1": "americas",
+    "br1": "americas",
+    "la1": "americas",
+    "la2": "americas",
+    "euw1": "europe",
+    "eun1": "europe",
+    "tr1": "europe",
+    "ru": "europe",
+    "oc1": "sea",
+}
+
+
+class RiotClient(object):
+    DEFAULT_TIMEOUT = 5.0
+    MAX_CONNECTIONS = 20
+    KEEPALIVE_TIMEOUT = 60.0
+    MAX_RETRIES = 3
+
+    def __init__(
+        self,
+        api_key: str,
+        region: str = "jp1",
+        base_url: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        scheduler: Optional[RiotScheduler] = None,
+        cache: Optional["SummonerCache"] = None,
+        regional_url: Optional[str] = None,
+        league_cache: Optional["LeagueCache"] = None,
+    ):
+        self.api_key: str = api_key
+        self.region: str = region
+        self.routing: str = ROUTING.get(region, "americas")
+        self.base_url: str = base_url or f"https://{region}.api.riotgames.com"
+        # スタブサーバを指定した場合は地域単位のAPIも同じサーバで受ける
+        self.regional_url: str = regional_url or base_url or f"https://{self.routing}.api.riotgames.com"
+        self.timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=timeout)
+        self.scheduler: RiotScheduler = scheduler or RiotScheduler()
+        self.cache: Optional["SummonerCache"] = cache
+        self.league_cache: Optional["LeagueCache"] = league_cache
+        self.latency: Dict[str, QueueMetrics] = {}
+        self.responses: Dict[Tuple[str, str], int] = Counter()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    # セッションはイベントループ上で初めて使われた時に作成し、全Gameで共有する
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=RiotClient.MAX_CONNECTIONS, keepalive_timeout=RiotClient.KEEPALIVE_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"X-Riot-Token": self.api_key},
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _observe(self, method: str, status: str, start: float):
+        self.responses[(method, status)] += 1
+        if method not in self.latency:
+            self.latency[method] = QueueMetrics()
+        self.latency[method].observe(time.monotonic() - start)
+
+    async def _get(
+        self, path: str, method: str, priority: Priority, regional: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        session = self._get_session()
+        # レート制限はプラットフォームと地域で別々に数えられる
+        region = self.routing if regional else self.region
+        url = (self.regional_url if regional else self.base_url) + path
+        for _ in range(RiotClient.MAX_RETRIES + 1):
+            await self.scheduler.acquire(region, method, priority)
+            start = time.monotonic()
+            try:
+                async with session.get(url) as response:
+                    self._observe(method, str(response.status), start)
+                    self.scheduler.update(region, method, response.headers)
+                    if response.status == 429:
+                        self.scheduler.penalize(region, method, response.headers)
+                        continue
+                    if response.status == 404:
+                        return None
+                    if response.status != 200:
+                        raise RiotAPIError(response.status, await response.text())
+                    return await response.json()
+            except asyncio.TimeoutError:
+                self._observe(method, "timeout", start)
+                raise RiotAPIError(408, "timeout")
+            except aiohttp.ClientError as e:
+                self._observe(method, "error", start)
+                raise RiotAPIError(503, str(e))
+        raise RiotAPIError(429, "rate limit exceeded")
+
+    async def get_summoner_by_name(
+        self, summoner_name: str, priority: Priority = Priority.INTERACTIVE
+    ) -> Optional[Summoner]:
+        if self.cache is not None:
+            summoner = self.cache.get_by_name(summoner_name)
+            if summoner is not None:
+                return summoner
+
+        data = await self._get(
+            "/lol/summoner/v4/summoners/by-name/{}".format(urllib.parse.quote(summoner_name)),
+            "summoner-v4.by-name",
+            priority,
+        )
+        return self._cache_summoner(data, summoner_name)
+
+    async def get_summoner_by_id(
+        self, summoner_id: str, priority: Priority = Priority.INTERACTIVE
+    ) -> Optional[Summoner]:
+        if self.cache is not None:
+            summoner = self.cache.get_by_id(summoner_id)
+            if summoner is not None:
+                return summoner
+
+        data = await self._get(
+            "/lol/summoner/v4/summoners/{}".format(urllib.parse.quote(summoner_id)),
+            "summoner-v4.by-id",
+            priority,
+        )
+        if data is None and self.cache is not None:
+            self.cache.invalidate(summoner_id)
+        return self._cache_summoner(data)
+
+    def _cache_summoner(
+        self, data: Optional[Dict[str, Any]], summoner_name: Optional[str] = None
+    ) -> Optional[Summoner]:
+        if data is None:
+            if self.cache is not None and summoner_name is not None:
+                self.cache.invalidate_name(summoner_name)
+            return None
+        summoner = Summoner.from_json(data)
+        if self.cache is not None:
+            self.cache.put(summoner)
+        return summoner
+
+    async def get_active_game(
+        self, summoner_id: str, priority: Priority = Priority.BACKGROUND
+    ) -> Optional[ActiveGame]:
+        data = await self._get(
+            "/lol/spectator/v4/active-games/by-summoner/{}".format(urllib.parse.quote(summoner_id)),
+            "spectator-v4.by-summoner",
+            priority,
+        )
+        return ActiveGame.from_json(data) if data is not None else None
+
+    # ランク戦に参加していないサモナーの場合は空のリストを返す
+    async def get_league_entries(
+        self, summoner_id: str, priority: Priority = Priority.INTERACTIVE
+    ) -> List[LeagueEntry]:
+        if self.league_cache is not None:
+            entries = self.league_cache.get(summoner_id)
+            if entries is not None:
+                return entries
+
+        data = await self._get(
+            "/lol/league/v4/entries/by-summoner/{}".format(urllib.parse.quote(summoner_id)),
+            "league-v4.by-summoner",
+            priority,
+        )
+        entries = [LeagueEntry.from_json(entry) for entry in data or []]
+        if self.league_cache is not None:
+            self.league_cache.put(summoner_id, entries)
+        return entries
+
+    # スペクテイターAPIのgameIdから、match-v5の試合IDを作る
+    def match_id(self, game_id: int) -> str:
+        return "{}_{}".format(self.region.upper(), game_id)
+
+    async def get_match(self, match_id: str, priority: Priority = Priority.BACKGROUND) -> Optional[Match]:
+        data = await self._get(
+            "/lol/match/v5/matches/{}".format(urllib.parse.quote(match_id)), "match-v5.match", priority, regional=True
+        )
+        return Match.from_json(data) if data is not None else None
@@ -0,0 +1,187 @@
+import hmac
+import sqlite3
+import aiohttp
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+DMHandler = Callable[[int, str], Awaitable[bool]]
+
+
+# Discordと同じ計算方法で、ギルドを担当するシャードを求める
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+
+# "0,1,2" や "0-3" 形式のシャード指定を展開する
+def parse_shard_ids(text: str) -> List[int]:
+    shard_ids = []
+    for part in text.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-")
+            shard_ids.extend(range(int(first), int(last) + 1))
+        elif part:
+            shard_ids.append(int(part))
+    return shard_ids
+
+
+# メンバーIDから、そのメンバーが参加しているゲームを持つシャードを引く共有インデックス
+class MemberDirectory(object):
+    def assign(self, member_id: int, shard_id: int):
+        raise NotImplementedError()
+
+    def release(self, member_id: int):
+        raise NotImplementedError()
+
+    def lookup(self, member_id: int) -> Optional[int]:
+        raise NotImplementedError()
+
+
+class MemoryDirectory(MemberDirectory):
+    def __init__(self):
+        self.members: Dict[int, int] = {}
+
+    def assign(self, member_id: int, shard_id: int):
+        self.members[member_id] = shard_id
+
+    def release(self, member_id: int):
+        self.members.pop(member_id, None)
+
+    def lookup(self, member_id: int) -> Optional[int]:
+        return self.members.get(member_id)
+
+
+# 同一ホスト上の複数プロセスで共有するためのSQLite実装
+class SQLiteDirectory(MemberDirectory):
+    def __init__(self, path: str):
+        self.db: sqlite3.Connection = sqlite3.connect(path, timeout=5.0)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS members (member_id INTEGER PRIMARY KEY, shard_id INTEGER NOT NULL)"
+        )
+        self.db.commit()
+
+    def assign(self, member_id: int, shard_id: int):
+        self.db.execute("INSERT OR REPLACE INTO members (member_id, shard_id) VALUES (?, ?)", (member_id, shard_id))
+        self.db.commit()
+
+    def release(self, member_id: int):
+        self.db.execute("DELETE FROM members WHERE member_id = ?", (member_id,))
+        self.db.commit()
+
+    def lookup(self, member_id: int) -> Optional[int]:
+        row = self.db.execute("SELECT shard_id FROM members WHERE member_id = ?", (member_id,)).fetchone()
+        return row[0] if row is not None else None
+
+
+# DMはシャード0にしか届かないため、担当シャードのプロセスへ転送する
+class ShardBus(object):
+    def __init__(self):
+        self.handlers: Dict[int, DMHandler] = {}
+        self.forwarded: int = 0
+
+    def register(self, shard_ids: List[int], handler: DMHandler):
+        for shard_id in shard_ids:
+            self.handlers[shard_id] = handler
+
+    def is_local(self, shard_id: int) -> bool:
+        return shard_id in self.handlers
+
+    async def forward(self, shard_id: int, member_id: int, content: str) -> bool:
+        self.forwarded += 1
+        if shard_id in self.handlers:
+            return await self.handlers[shard_id](member_id, content)
+        return await self._forward_remote(shard_id, member_id, content)
+
+    async def _forward_remote(self, shard_id: int, member_id: int, content: str) -> bool:
+        return False
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+# 同じプロセス (またはテスト用に同じイベントループ) 内のシャード間で転送する
+class LocalBus(ShardBus):
+    pass
+
+
+# 他プロセスのシャードへHTTPで転送する
+# 転送されたDMはそのメンバーのコマンドとして実行されるため、共有の秘密鍵を持つ送信元のみ受け付ける
+class HttpBus(ShardBus):
+    SECRET_HEADER = "X-Shard-Secret"
+
+    def __init__(self, peers: Dict[int, str], secret: str, host: str = "127.0.0.1", port: int = 0):
+        super().__init__()
+        if not secret:
+            raise ValueError("HttpBus requires a shared secret")
+        self.peers: Dict[int, str] = peers
+        self.secret: str = secret
+        self.host: str = host
+        self.port: int = port
+        self.rejected: int = 0
+        self._runner: Optional["web.AppRunner"] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _receive(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+
+        if not hmac.compare_digest(
+            request.headers.get(HttpBus.SECRET_HEADER, "").encode("utf-8"), self.secret.encode("utf-8")
+        ):
+            self.rejected += 1
+            return web.json_response({"handled": False}, status=403)
+        body = await request.json()
+        handler = self.handlers.get(body["shard_id"])
+        if handler is None:
+            return web.json_response({"handled": False}, status=404)
+        return web.json_response({"handled": await handler(body["member_id"], body["content"])})
+
+    async def _forward_remote(self, shard_id: int, member_id: int, content: str) -> bool:
+        url = self.peers.get(shard_id)
+        if url is None:
+            return False
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=5.0), headers={HttpBus.SECRET_HEADER: self.secret}
+            )
+        body = {"shard_id": shard_id, "member_id": member_id, "content": content}
+        try:
+            async with self._session.post(url + "/dm", json=body) as response:
+                return response.status == 200 and (await response.json())["handled"]
+        except aiohttp.ClientError as e:
+            print("Failed to forward DM to shard {}: {}".format(shard_id, e))
+            return False
+
+    async def start(self):
+        # 単一プロセスでは転送を受け付けないため、aiohttp.webは受信を始める時に読み込む
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post("/dm", self._receive)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# "0=http://127.0.0.1:8701,1=http://127.0.0.1:8702" 形式の指定を展開する
+def parse_peers(text: str) -> Dict[int, str]:
+    peers = {}
+    for part in text.split(","):
+        if "=" in part:
+            shard_id, url = part.split("=", 1)
+            peers[int(shard_id)] = url.strip().rstrip("/")
+    return peers
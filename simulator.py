@@ -0,0 +1,507 @@
+import argparse
+import asyncio
+import importlib
+import importlib.util
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+from config import Config
+from fake_riot import FakeRiotServer
+from metrics import LoopLagMonitor
+from shard import shard_for_guild
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Discord APIの呼び出し回数と疑似的な遅延を共有する
+class FakeDiscord(object):
+    def __init__(self, latency: float = 0.0):
+        self.latency: float = latency
+        self.calls: Counter = Counter()
+        self._ids = itertools.count(1)
+
+    def next_id(self) -> int:
+        # シャードの計算に使われるため、Discordと同様にタイムスタンプ部分に連番を入れる
+        return next(self._ids) << 22
+
+    async def call(self, name: str):
+        self.calls[name] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+
+class FakePermissions(object):
+    def __init__(self, manage_guild: bool = False):
+        self.manage_guild: bool = manage_guild
+
+
+class FakeGuild(object):
+    def __init__(self, discord: FakeDiscord):
+        self.discord: FakeDiscord = discord
+        self.id: int = discord.next_id()
+        self.members: Dict[int, "FakeMember"] = {}
+
+    # メンバーのインテントを使わないため、キャッシュには無く取得が必要になる
+    def get_member(self, member_id: int) -> Optional["FakeMember"]:
+        return None
+
+    async def fetch_member(self, member_id: int) -> "FakeMember":
+        await self.discord.call("fetch_member")
+        return self.members[member_id]
+
+
+class FakeMessage(object):
+    def __init__(self, discord: FakeDiscord, channel: "FakeChannel", author: Any, content: str = "", embed=None):
+        self.discord: FakeDiscord = discord
+        self.id: int = discord.next_id()
+        self.channel: FakeChannel = channel
+        self.guild: Optional[FakeGuild] = getattr(channel, "guild", None)
+        self.author: Any = author
+        self.content: str = content
+        self.embed = embed
+
+    async def delete(self):
+        await self.discord.call("delete")
+
+    async def edit(self, content: Optional[str] = None, embed=None):
+        await self.discord.call("edit")
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embed = embed
+
+    async def pin(self):
+        await self.discord.call("pin")
+
+
+# 送信されたメッセージを記録し、特定の文言が送られるのを待てるようにする
+class FakeChannel(object):
+    def __init__(self, discord: FakeDiscord):
+        self.discord: FakeDiscord = discord
+        self.id: int = discord.next_id()
+        self.history: List[FakeMessage] = []
+        self._waiters: Dict[str, List[asyncio.Future]] = defaultdict(list)
+
+    def expect(self, content: str) -> asyncio.Future:
+        future = asyncio.get_event_loop().create_future()
+        self._waiters[content].append(future)
+        return future
+
+    async def send(self, content: Optional[str] = None, embed=None, file=None, embeds=None) -> FakeMessage:
+        await self.discord.call("send_file" if file is not None else "send")
+        message = FakeMessage(self.discord, self, None, content or "", embed or (embeds[0] if embeds else None))
+        self.history.append(message)
+        # 複数の発言が一つのメッセージにまとめられることがあるため、含まれているかで照合する
+        for expected in [expected for expected in self._waiters if expected in message.content]:
+            for future in self._waiters.pop(expected):
+                if not future.done():
+                    future.set_result(message)
+        return message
+
+
+class FakeTextChannel(FakeChannel):
+    def __init__(self, discord: FakeDiscord, guild: FakeGuild):
+        super().__init__(discord)
+        self.guild: FakeGuild = guild
+
+
+class FakeDMChannel(FakeChannel):
+    def __init__(self, discord: FakeDiscord, recipient: "FakeMember"):
+        super().__init__(discord)
+        self.recipient: FakeMember = recipient
+
+
+class FakeMember(object):
+    def __init__(self, discord: FakeDiscord, guild: FakeGuild, name: str, manage_guild: bool = False):
+        self.discord: FakeDiscord = discord
+        self.id: int = discord.next_id()
+        self.guild: FakeGuild = guild
+        self.name: str = name
+        self.nick: Optional[str] = None
+        self.bot: bool = False
+        self.guild_permissions: FakePermissions = FakePermissions(manage_guild)
+        self.dm_channel: FakeDMChannel = FakeDMChannel(discord, self)
+        guild.members[self.id] = self
+
+    @property
+    def display_name(self) -> str:
+        return self.nick or self.name
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    async def send(self, content: Optional[str] = None, embed=None, file=None) -> FakeMessage:
+        return await self.dm_channel.send(content, embed, file)
+
+    async def edit(self, nick: Optional[str] = None):
+        await self.discord.call("edit_member")
+        self.nick = nick
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class Lobby(object):
+    def __init__(self, simulator: "Simulator", index: int):
+        self.simulator: Simulator = simulator
+        self.index: int = index
+        discord = simulator.discord
+        guild = FakeGuild(discord)
+        self.channel: FakeTextChannel = FakeTextChannel(discord, guild)
+        self.host: FakeMember = FakeMember(discord, guild, f"host-{index}", manage_guild=True)
+        self.players: List[FakeMember] = [FakeMember(discord, guild, f"player-{index}-{i}") for i in range(10)]
+        self.summoner_names: Dict[int, str] = {}
+        for member in self.players:
+            self.summoner_names[member.id] = f"Summoner {member.id}"
+            simulator.riot.add_summoner(self.summoner_names[member.id])
+            tier = random.choice(("IRON", "BRONZE", "SILVER", "GOLD", "PLATINUM", "DIAMOND", None))
+            simulator.riot.set_rank(self.summoner_names[member.id], tier, random.choice(("I", "II", "III", "IV")))
+
+    async def say(self, member: FakeMember, content: str):
+        await self.simulator.send(FakeMessage(self.simulator.discord, self.channel, member, content))
+
+    async def dm(self, member: FakeMember, content: str):
+        await self.simulator.send(FakeMessage(self.simulator.discord, member.dm_channel, member, content))
+
+    async def wait(self, future: asyncio.Future):
+        await asyncio.wait_for(future, self.simulator.phase_timeout)
+
+    def text(self, key: str) -> str:
+        return self.simulator.bot.catalog.get(key, self.simulator.bot.DEFAULT_LANGUAGE)
+
+    async def run(self):
+        bot = self.simulator.bot_for(self.channel.guild)
+        await self.say(self.host, "/join host")
+        for i, member in enumerate(self.players):
+            await self.say(member, "/join blue" if i < 5 else "/join red")
+        for member in self.players:
+            await self.dm(member, "/name " + self.summoner_names[member.id])
+        await self.say(self.host, "/balance")
+
+        found = self.channel.expect(self.text("FoundActiveGame"))
+        await self.say(self.host, "/start 1")
+        champions = random.sample([champion.key for champion in bot.champions], len(self.players))
+        self.simulator.riot.start_game(
+            [(self.summoner_names[member.id], champion) for member, champion in zip(self.players, champions)],
+            game_id=self.index,
+        )
+        await self.wait(found)
+        self.simulator.riot.finish_game(self.index, random.choice((100, 200)))
+
+        voting = self.channel.expect(self.text("AnnounceVoting"))
+        await self.say(self.host, "/finish 1")
+        await self.wait(voting)
+
+        game = bot.games.get(self.channel.id)
+        while game.progress.state == "voting":
+            for member in self.players:
+                seat = bot.players.seat_of(member.id)
+                tally = game._tally(seat.team)
+                if not tally.has_voted(seat.slot):
+                    await self.dm(member, "/vote {}".format(random.choice(tally.candidates) + 1))
+            await self.say(self.host, "/aggregate")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bot_environ(directory: str, riot_base_url: str) -> Dict[str, str]:
+    return {
+        "DISCORD_TOKEN": os.environ.get("DISCORD_TOKEN", "simulator"),
+        "RIOT_API_KEY": os.environ.get("RIOT_API_KEY", "simulator"),
+        "RIOT_API_BASE_URL": riot_base_url,
+        "GAMES_DB": os.path.join(directory, "games.db"),
+        "SUMMONERS_DB": os.path.join(directory, "summoners.db"),
+        "CHAMPIONS_DB": os.path.join(directory, "champions.db"),
+        "HISTORY_DB": os.path.join(directory, "history.db"),
+        "DDRAGON_URL": "",
+        "SHARD_PEERS": "",
+    }
+
+
+# 再デプロイ時の停止時間の目安として、新しいプロセスで main.py --dry-run を繰り返し実行し
+# インタプリタの起動とimportを含めた時間と、ボット内部の各段階の時間を計測する
+# 最初の1回は一時ディレクトリにデータベースを作るため、2回目以降が既存のデータからの起動になる
+def benchmark_startup(runs: int) -> Dict[str, Any]:
+    directory = tempfile.mkdtemp(prefix="lolwolf-sim-")
+    env = dict(os.environ, **bot_environ(directory, "http://127.0.0.1:9"))
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    walls: List[float] = []
+    phases: Dict[str, List[float]] = defaultdict(list)
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, main_path, "--dry-run"],
+                cwd=os.path.dirname(main_path),
+                env=env,
+                check=True,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            ).stdout
+            walls.append(time.perf_counter() - start)
+            for name, value in json.loads(output.strip().splitlines()[-1]).items():
+                phases[name].append(value)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"runs": runs, "wall": walls, "phases": dict(phases)}
+
+
+def print_startup_report(report: Dict[str, Any]):
+    walls = report["wall"]
+    print("startup runs: {}".format(report["runs"]))
+    print(
+        "  wall clock   p50 {:7.1f}ms  max {:7.1f}ms  first {:7.1f}ms".format(
+            percentile(walls, 50) * 1000, max(walls) * 1000, walls[0] * 1000
+        )
+    )
+    for name, values in sorted(report["phases"].items()):
+        if name == "saved_games":
+            continue
+        print("  {:<12} p50 {:7.1f}ms  max {:7.1f}ms".format(name, percentile(values, 50) * 1000, max(values) * 1000))
+
+
+# Discordに接続せずに、偽のメンバー・チャンネルとRiot APIのスタブサーバで
+# on_message経由のゲーム進行を並行して実行し、性能を計測する
+class Simulator(object):
+    def __init__(
+        self,
+        games: int = 100,
+        concurrency: int = 20,
+        discord_latency: float = 0.0,
+        riot_rate_limit: str = "500:10,30000:600",
+        phase_timeout: float = 120.0,
+        trace_memory: bool = False,
+        shards: int = 1,
+    ):
+        self.games: int = games
+        self.shards: int = shards
+        self.concurrency: int = concurrency
+        self.phase_timeout: float = phase_timeout
+        self.trace_memory: bool = trace_memory
+        self.discord: FakeDiscord = FakeDiscord(discord_latency)
+        self.riot: FakeRiotServer = FakeRiotServer()
+        self.riot.app_rate_limit = riot_rate_limit
+        self.monitor: LoopLagMonitor = LoopLagMonitor(0.05, keep_samples=True)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.failures: List[str] = []
+        self.recorded: int = 0
+        # shutdown後はジョブキュー等が閉じられるため、メトリクスは終了前に取得しておく
+        self.metrics_text: str = ""
+        # シャードごとのボット (DMはDiscordと同様に常にシャード0に届く)
+        self.bots: List[Any] = []
+        self.bot: Any = None
+        self._directory: Optional[str] = None
+
+    # スタブサーバと一時ファイルを指定した設定でボットを生成する
+    def _load_bot(self):
+        self._directory = tempfile.mkdtemp(prefix="lolwolf-sim-")
+        environ = dict(os.environ, **bot_environ(self._directory, self.riot.base_url))
+        if self.shards == 1:
+            self.bot = importlib.import_module("main")
+            self.bot.create_app(Config.from_env(environ))
+            self.bots = [self.bot]
+            return
+
+        # 複数シャードの場合は、main.pyを別々のモジュールとして読み込んで別プロセスの代わりにする
+        # 各シャードはHttpBusでDMを転送し、メンバーの参加先はSQLiteDirectoryで共有する
+        ports = [free_port() for _ in range(self.shards)]
+        peers = ",".join("{}=http://127.0.0.1:{}".format(i, port) for i, port in enumerate(ports))
+        main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        for shard_id in range(self.shards):
+            directory = os.path.join(self._directory, str(shard_id))
+            os.mkdir(directory)
+            spec = importlib.util.spec_from_file_location("lolwolf_shard{}".format(shard_id), main_path)
+            bot = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(bot)
+            shard_environ = dict(environ, **bot_environ(directory, self.riot.base_url))
+            shard_environ.update(
+                SHARD_COUNT=str(self.shards),
+                SHARD_IDS=str(shard_id),
+                SHARD_DIRECTORY=os.path.join(self._directory, "members.db"),
+                SHARD_PEERS=peers,
+                SHARD_BUS_PORT=str(ports[shard_id]),
+                SHARD_SECRET="simulator",
+            )
+            bot.create_app(Config.from_env(shard_environ))
+            self.bots.append(bot)
+        self.bot = self.bots[0]
+
+    def bot_for(self, guild: Optional[FakeGuild]) -> Any:
+        if guild is None:
+            return self.bots[0]
+        return self.bots[shard_for_guild(guild.id, self.shards)]
+
+    async def send(self, message: FakeMessage):
+        parts = message.content.split(None, 1)
+        name = parts[0] if message.guild is not None else "dm " + parts[0]
+        start = time.perf_counter()
+        await self.bot_for(message.guild).on_message(message)
+        self.latencies[name].append(time.perf_counter() - start)
+
+    async def _run_lobby(self, semaphore: asyncio.Semaphore, index: int):
+        async with semaphore:
+            lobby = Lobby(self, index)
+            try:
+                await lobby.run()
+            except Exception as e:
+                self.failures.append("game {}: {!r}".format(index, e))
+
+    async def run(self) -> Dict[str, Any]:
+        await self.riot.start()
+        self._load_bot()
+        for bot in self.bots:
+            await bot.bus.start()
+            await bot.cards.warm()
+        if self.trace_memory:
+            tracemalloc.start()
+        self.monitor.start()
+        start = time.perf_counter()
+        try:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*[self._run_lobby(semaphore, i + 1) for i in range(self.games)])
+            elapsed = time.perf_counter() - start
+            for bot in self.bots:
+                await bot.outbox.flush_all()
+            await self._drain_jobs()
+            self.metrics_text = self.bot.metrics.render()
+        finally:
+            self.monitor.stop()
+            for bot in self.bots:
+                await bot.shutdown()
+            await self.riot.stop()
+            shutil.rmtree(self._directory, ignore_errors=True)
+        return self.report(elapsed)
+
+    # 試合結果の取り込みはバックグラウンドで行われるため、終わるまで待ってから集計する
+    async def _drain_jobs(self):
+        deadline = time.monotonic() + self.phase_timeout
+        while sum(bot.jobs.pending() for bot in self.bots) > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self.recorded = sum(
+            bot.history.db.execute("SELECT COUNT(*) FROM games").fetchone()[0] for bot in self.bots
+        )
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        report: Dict[str, Any] = {
+            "games": self.games,
+            "failed": len(self.failures),
+            "concurrency": self.concurrency,
+            "elapsed": elapsed,
+            "commands": {},
+            "loop_lag": {q: percentile(self.monitor.samples, q) for q in (50, 99, 100)},
+            "riot_calls_per_game": len(self.riot.requests) / self.games,
+            "riot_calls": dict(Counter(path.rsplit("/", 1)[0] for path in self.riot.requests)),
+            "discord_calls_per_game": sum(self.discord.calls.values()) / self.games,
+            "discord_calls": dict(self.discord.calls),
+            "recorded": self.recorded,
+            "outbox": dict(sum((Counter(bot.outbox.stats()) for bot in self.bots), Counter())),
+            "outbox_saved_per_game": sum(bot.outbox.saved() for bot in self.bots) / self.games,
+            "shards": self.shards,
+            "forwarded_dms": sum(bot.bus.forwarded for bot in self.bots),
+            "peak_rss": None,
+            "peak_traced": None,
+        }
+        for name, values in sorted(self.latencies.items()):
+            report["commands"][name] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+        if resource is not None:
+            # Linuxではキロバイト単位
+            report["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        if self.trace_memory:
+            report["peak_traced"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return report
+
+
+def print_report(report: Dict[str, Any], failures: List[str]):
+    print("{games} games ({failed} failed), concurrency {concurrency}, {elapsed:.1f}s".format(**report))
+    print("{:<14}{:>8}{:>10}{:>10}{:>10}{:>10}".format("command", "count", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for name, stats in report["commands"].items():
+        print(
+            "{:<14}{:>8}".format(name, stats["count"])
+            + "".join("{:>10.2f}".format(stats[key] * 1000) for key in ("p50", "p90", "p99", "max"))
+        )
+    lag = report["loop_lag"]
+    print("event loop lag: p50 {:.2f}ms, p99 {:.2f}ms, max {:.2f}ms".format(*[lag[q] * 1000 for q in (50, 99, 100)]))
+    print("riot calls per game: {:.1f} {}".format(report["riot_calls_per_game"], report["riot_calls"]))
+    print("discord calls per game: {:.1f} {}".format(report["discord_calls_per_game"], report["discord_calls"]))
+    print("results recorded: {}".format(report["recorded"]))
+    print(
+        "channel messages: {requested} requested, {sent} sent".format(**report["outbox"])
+        + " ({:.1f} saved per game)".format(report["outbox_saved_per_game"])
+    )
+    if report["shards"] > 1:
+        print("shards: {shards}, DMs forwarded between shards: {forwarded_dms}".format(**report))
+    if report["peak_rss"] is not None:
+        print("peak rss: {:.1f}MB".format(report["peak_rss"] / 1024 / 1024))
+    if report["peak_traced"] is not None:
+        print("peak traced memory: {:.1f}MB".format(report["peak_traced"] / 1024 / 1024))
+    for failure in failures:
+        print(failure)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run LoLWolf games against fake Discord and Riot API")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="seconds added to each Discord call")
+    parser.add_argument("--riot-rate-limit", default="500:10,30000:600")
+    parser.add_argument("--phase-timeout", type=float, default=120.0)
+    parser.add_argument("--trace-memory", action="store_true", help="measure peak Python heap with tracemalloc")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--metrics", action="store_true", help="print the bot's metrics endpoint output at the end")
+    parser.add_argument("--shards", type=int, default=1, help="run N shards that forward DMs to each other")
+    parser.add_argument("--startup", type=int, default=0, help="measure cold start time over N new processes")
+    args = parser.parse_args(argv)
+
+    if args.startup > 0:
+        print_startup_report(benchmark_startup(args.startup))
+        return
+
+    random.seed(args.seed)
+    simulator = Simulator(
+        args.games,
+        args.concurrency,
+        args.discord_latency,
+        args.riot_rate_limit,
+        args.phase_timeout,
+        args.trace_memory,
+        args.shards,
+    )
+    report = asyncio.run(simulator.run())
+    print_report(report, simulator.failures)
+    if args.metrics:
+        print(simulator.metrics_text)
+    if simulator.failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from typing import Dict, Optional, Tuple
+
+
+class TransitionError(Exception):
+    pass
+
+
+# transitions.Machineの代わりに、現在の状態を一つの属性だけで持つ軽量なステートマシン
+# 状態と遷移の定義はサブクラスのクラス属性として全インスタンスで共有する
+class StateMachine(object):
+    __slots__ = ("state",)
+
+    STATES: Tuple[str, ...] = ()
+    # トリガー名から (遷移元, 遷移先) への対応
+    TRANSITIONS: Dict[str, Tuple[str, str]] = {}
+    INITIAL: str = ""
+
+    def __init__(self, state: Optional[str] = None):
+        self.state: str = self.INITIAL
+        if state is not None:
+            self.set_state(state)
+
+    def set_state(self, state: str):
+        if state not in self.STATES:
+            raise ValueError(f"unknown state {state!r}")
+        self.state = state
+
+    def may_trigger(self, trigger: str) -> bool:
+        transition = self.TRANSITIONS.get(trigger)
+        return transition is not None and transition[0] == self.state
+
+    def trigger(self, trigger: str):
+        if trigger not in self.TRANSITIONS:
+            raise TransitionError(f"unknown trigger {trigger!r}")
+        source, dest = self.TRANSITIONS[trigger]
+        if self.state != source:
+            raise TransitionError(f"can't trigger {trigger!r} from state {self.state!r}")
+        self.state = dest
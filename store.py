@@ -0,0 +1,236 @@
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class PlayerRecord(NamedTuple):
+    member_id: int
+    team: str
+    slot: int
+    is_wolf: bool = False
+    is_vote: bool = False
+    is_votable: bool = True
+    voted_to: int = -1
+    voted_from: int = 0
+    summoner_name: Optional[str] = None
+    summoner_id: Optional[str] = None
+    champion_name: Optional[str] = None
+    position: str = "mid"
+    display_name: str = ""
+
+
+# 決選投票の途中で再起動しても、回数の上限と確定済みの投票先を引き継ぐ
+class TallyRecord(NamedTuple):
+    team: str
+    round: int
+    elected: Tuple[int, ...] = ()
+
+
+class GameRecord(NamedTuple):
+    channel_id: int
+    state: str
+    host_id: Optional[int] = None
+    deadline: Optional[float] = None
+    players: Tuple[PlayerRecord, ...] = ()
+    match_id: Optional[str] = None
+    tallies: Tuple[TallyRecord, ...] = ()
+
+
+# ゲームの状態を変更のあった部分だけ書き込むストア
+class StateStore(object):
+    def save_game(
+        self,
+        channel_id: int,
+        state: str,
+        host_id: Optional[int],
+        deadline: Optional[float],
+        match_id: Optional[str] = None,
+    ):
+        raise NotImplementedError()
+
+    def save_player(self, channel_id: int, player: PlayerRecord):
+        raise NotImplementedError()
+
+    def delete_player(self, channel_id: int, member_id: int):
+        raise NotImplementedError()
+
+    def save_tally(self, channel_id: int, tally: TallyRecord):
+        raise NotImplementedError()
+
+    def delete_tallies(self, channel_id: int):
+        raise NotImplementedError()
+
+    def delete_game(self, channel_id: int):
+        raise NotImplementedError()
+
+    def load(self) -> List[GameRecord]:
+        raise NotImplementedError()
+
+    def save_language(self, guild_id: int, language: str):
+        raise NotImplementedError()
+
+    def load_languages(self) -> Dict[int, str]:
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        self.games: Dict[int, GameRecord] = {}
+        self.players: Dict[int, Dict[int, PlayerRecord]] = {}
+        self.tallies: Dict[int, Dict[str, TallyRecord]] = {}
+        self.languages: Dict[int, str] = {}
+
+    def save_game(
+        self,
+        channel_id: int,
+        state: str,
+        host_id: Optional[int],
+        deadline: Optional[float],
+        match_id: Optional[str] = None,
+    ):
+        self.games[channel_id] = GameRecord(channel_id, state, host_id, deadline, match_id=match_id)
+        self.players.setdefault(channel_id, {})
+
+    def save_player(self, channel_id: int, player: PlayerRecord):
+        self.players.setdefault(channel_id, {})[player.member_id] = player
+
+    def delete_player(self, channel_id: int, member_id: int):
+        self.players.get(channel_id, {}).pop(member_id, None)
+
+    def save_tally(self, channel_id: int, tally: TallyRecord):
+        self.tallies.setdefault(channel_id, {})[tally.team] = tally
+
+    def delete_tallies(self, channel_id: int):
+        self.tallies.pop(channel_id, None)
+
+    def delete_game(self, channel_id: int):
+        self.games.pop(channel_id, None)
+        self.players.pop(channel_id, None)
+        self.tallies.pop(channel_id, None)
+
+    def load(self) -> List[GameRecord]:
+        return [
+            game._replace(
+                players=tuple(self.players.get(channel_id, {}).values()),
+                tallies=tuple(self.tallies.get(channel_id, {}).values()),
+            )
+            for channel_id, game in self.games.items()
+        ]
+
+    def save_language(self, guild_id: int, language: str):
+        self.languages[guild_id] = language
+
+    def load_languages(self) -> Dict[int, str]:
+        return dict(self.languages)
+
+
+class SQLiteStateStore(StateStore):
+    def __init__(self, path: str):
+        self.db: sqlite3.Connection = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS games ("
+            "channel_id INTEGER PRIMARY KEY, state TEXT NOT NULL, host_id INTEGER, deadline REAL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS players ("
+            "channel_id INTEGER NOT NULL, member_id INTEGER NOT NULL, team TEXT NOT NULL, slot INTEGER NOT NULL, "
+            "is_wolf INTEGER NOT NULL, is_vote INTEGER NOT NULL, is_votable INTEGER NOT NULL, "
+            "voted_to INTEGER NOT NULL, voted_from INTEGER NOT NULL, summoner_name TEXT, summoner_id TEXT, "
+            "champion_name TEXT, position TEXT NOT NULL, display_name TEXT NOT NULL, "
+            "PRIMARY KEY (channel_id, member_id))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS tallies ("
+            "channel_id INTEGER NOT NULL, team TEXT NOT NULL, round INTEGER NOT NULL, elected TEXT NOT NULL, "
+            "PRIMARY KEY (channel_id, team))"
+        )
+        # match_id が無かった頃のデータベースに列を追加する
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(games)")]
+        if "match_id" not in columns:
+            self.db.execute("ALTER TABLE games ADD COLUMN match_id TEXT")
+        self.db.execute("CREATE TABLE IF NOT EXISTS languages (guild_id INTEGER PRIMARY KEY, language TEXT NOT NULL)")
+        self.db.commit()
+
+    def save_game(
+        self,
+        channel_id: int,
+        state: str,
+        host_id: Optional[int],
+        deadline: Optional[float],
+        match_id: Optional[str] = None,
+    ):
+        self.db.execute(
+            "INSERT OR REPLACE INTO games (channel_id, state, host_id, deadline, match_id) VALUES (?, ?, ?, ?, ?)",
+            (channel_id, state, host_id, deadline, match_id),
+        )
+        self.db.commit()
+
+    def save_player(self, channel_id: int, player: PlayerRecord):
+        self.db.execute(
+            "INSERT OR REPLACE INTO players VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (channel_id,) + tuple(player),
+        )
+        self.db.commit()
+
+    def delete_player(self, channel_id: int, member_id: int):
+        self.db.execute("DELETE FROM players WHERE channel_id = ? AND member_id = ?", (channel_id, member_id))
+        self.db.commit()
+
+    # 確定済みの投票先はチーム内の位置をカンマ区切りで保存する
+    def save_tally(self, channel_id: int, tally: TallyRecord):
+        self.db.execute(
+            "INSERT OR REPLACE INTO tallies (channel_id, team, round, elected) VALUES (?, ?, ?, ?)",
+            (channel_id, tally.team, tally.round, ",".join(str(i) for i in tally.elected)),
+        )
+        self.db.commit()
+
+    def delete_tallies(self, channel_id: int):
+        self.db.execute("DELETE FROM tallies WHERE channel_id = ?", (channel_id,))
+        self.db.commit()
+
+    def delete_game(self, channel_id: int):
+        self.db.execute("DELETE FROM players WHERE channel_id = ?", (channel_id,))
+        self.db.execute("DELETE FROM tallies WHERE channel_id = ?", (channel_id,))
+        self.db.execute("DELETE FROM games WHERE channel_id = ?", (channel_id,))
+        self.db.commit()
+
+    def load(self) -> List[GameRecord]:
+        players: Dict[int, List[PlayerRecord]] = {}
+        for row in self.db.execute("SELECT * FROM players ORDER BY channel_id, team, slot"):
+            player = PlayerRecord(*row[1:])
+            player = player._replace(
+                is_wolf=bool(player.is_wolf), is_vote=bool(player.is_vote), is_votable=bool(player.is_votable)
+            )
+            players.setdefault(row[0], []).append(player)
+        tallies: Dict[int, List[TallyRecord]] = {}
+        for channel_id, team, round, elected in self.db.execute("SELECT * FROM tallies"):
+            tally = TallyRecord(team, round, tuple(int(i) for i in elected.split(",") if i))
+            tallies.setdefault(channel_id, []).append(tally)
+        return [
+            GameRecord(
+                channel_id,
+                state,
+                host_id,
+                deadline,
+                tuple(players.get(channel_id, [])),
+                match_id,
+                tuple(tallies.get(channel_id, [])),
+            )
+            for channel_id, state, host_id, deadline, match_id in self.db.execute(
+                "SELECT channel_id, state, host_id, deadline, match_id FROM games"
+            )
+        ]
+
+    def save_language(self, guild_id: int, language: str):
+        self.db.execute("INSERT OR REPLACE INTO languages (guild_id, language) VALUES (?, ?)", (guild_id, language))
+        self.db.commit()
+
+    def load_languages(self) -> Dict[int, str]:
+        return dict(self.db.execute("SELECT guild_id, language FROM languages"))
+
+    def close(self):
+        self.db.close()
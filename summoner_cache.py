@@ -0,0 +1,183 @@
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from riot import LeagueEntry, Summoner
+
+
+# Riot側と同様に空白を除去し小文字にしたものをキーとする
+def normalize_name(summoner_name: str) -> str:
+    return "".join(summoner_name.split()).lower()
+
+
+# TTL付きLRUキャッシュ (pathを指定するとSQLiteに永続化される)
+class SummonerCache(object):
+    DEFAULT_TTL = 7 * 24 * 60 * 60
+    DEFAULT_MAX_SIZE = 10000
+
+    def __init__(self, path: Optional[str] = None, ttl: float = DEFAULT_TTL, max_size: int = DEFAULT_MAX_SIZE):
+        self.ttl: float = ttl
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self._by_id: "OrderedDict[str, Tuple[Summoner, float]]" = OrderedDict()
+        self._by_name: Dict[str, str] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS summoners ("
+                "id TEXT PRIMARY KEY, name TEXT NOT NULL, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS summoners_name ON summoners (name)")
+            self._db.commit()
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _load(self):
+        now = time.time()
+        self._db.execute("DELETE FROM summoners WHERE expires_at <= ?", (now,))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT data, expires_at FROM summoners ORDER BY expires_at DESC LIMIT ?", (self.max_size,)
+        ).fetchall()
+        for data, expires_at in reversed(rows):
+            self._store(Summoner(**json.loads(data)), expires_at)
+
+    def _store(self, summoner: Summoner, expires_at: float):
+        self._by_id[summoner.id] = (summoner, expires_at)
+        self._by_id.move_to_end(summoner.id)
+        self._by_name[normalize_name(summoner.name)] = summoner.id
+
+    def _lookup(self, summoner_id: Optional[str]) -> Optional[Summoner]:
+        entry = self._by_id.get(summoner_id) if summoner_id is not None else None
+        if entry is None:
+            self.misses += 1
+            return None
+        summoner, expires_at = entry
+        if expires_at <= time.time():
+            self.invalidate(summoner_id)
+            self.misses += 1
+            return None
+        self._by_id.move_to_end(summoner_id)
+        self.hits += 1
+        return summoner
+
+    def get_by_name(self, summoner_name: str) -> Optional[Summoner]:
+        return self._lookup(self._by_name.get(normalize_name(summoner_name)))
+
+    def get_by_id(self, summoner_id: str) -> Optional[Summoner]:
+        return self._lookup(summoner_id)
+
+    def put(self, summoner: Summoner):
+        # 改名された場合は古い名前のキーを削除する
+        old = self._by_id.get(summoner.id)
+        if old is not None:
+            self._by_name.pop(normalize_name(old[0].name), None)
+
+        expires_at = time.time() + self.ttl
+        self._store(summoner, expires_at)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summoners (id, name, data, expires_at) VALUES (?, ?, ?, ?)",
+                (summoner.id, normalize_name(summoner.name), json.dumps(summoner._asdict()), expires_at),
+            )
+
+        while len(self._by_id) > self.max_size:
+            summoner_id, (evicted, _) = self._by_id.popitem(last=False)
+            self._by_name.pop(normalize_name(evicted.name), None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM summoners WHERE id = ?", (summoner_id,))
+        if self._db is not None:
+            self._db.commit()
+
+    def invalidate(self, summoner_id: str):
+        entry = self._by_id.pop(summoner_id, None)
+        if entry is not None:
+            self._by_name.pop(normalize_name(entry[0].name), None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM summoners WHERE id = ?", (summoner_id,))
+            self._db.commit()
+
+    def invalidate_name(self, summoner_name: str):
+        summoner_id = self._by_name.pop(normalize_name(summoner_name), None)
+        if summoner_id is not None:
+            self.invalidate(summoner_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._by_id), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# サモナーIDごとのランク情報のキャッシュ (ランクは試合ごとに変わるため、サモナー情報より短い期限にする)
+class LeagueCache(object):
+    DEFAULT_TTL = 6 * 60 * 60
+    DEFAULT_MAX_SIZE = 10000
+
+    def __init__(self, path: Optional[str] = None, ttl: float = DEFAULT_TTL, max_size: int = DEFAULT_MAX_SIZE):
+        self.ttl: float = ttl
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self._entries: "OrderedDict[str, Tuple[List[LeagueEntry], float]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS league_entries ("
+                "summoner_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM league_entries WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT summoner_id, data, expires_at FROM league_entries ORDER BY expires_at DESC LIMIT ?",
+                (self.max_size,),
+            ).fetchall()
+            for summoner_id, data, expires_at in reversed(rows):
+                self._entries[summoner_id] = ([LeagueEntry(*entry) for entry in json.loads(data)], expires_at)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, summoner_id: str) -> Optional[List[LeagueEntry]]:
+        entry = self._entries.get(summoner_id)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[summoner_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(summoner_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, summoner_id: str, entries: List[LeagueEntry]):
+        expires_at = time.time() + self.ttl
+        self._entries[summoner_id] = (entries, expires_at)
+        self._entries.move_to_end(summoner_id)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO league_entries (summoner_id, data, expires_at) VALUES (?, ?, ?)",
+                (summoner_id, json.dumps([list(entry) for entry in entries]), expires_at),
+            )
+
+        while len(self._entries) > self.max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            if self._db is not None:
+                self._db.execute("DELETE FROM league_entries WHERE summoner_id = ?", (evicted,))
+        if self._db is not None:
+            self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
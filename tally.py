@@ -0,0 +1,118 @@
+import random
+import sys
+import time
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class VoteError(Exception):
+    pass
+
+
+class TallyResult(NamedTuple):
+    counts: Tuple[int, ...]
+    # 確定した投票先 (決着していない場合は過半の票で確定した分のみ)
+    elected: Tuple[int, ...]
+    # 次の枠を争って同票になっている候補
+    tied: Tuple[int, ...]
+    decided: bool
+    round: int
+
+
+# I/Oを持たない投票集計エンジン
+# 人数や人狼の数に依存せず、同票の場合は決選投票を繰り返す
+class Tally(object):
+    MAX_ROUNDS = 3
+
+    def __init__(
+        self,
+        size: int,
+        seats: int = 1,
+        candidates: Optional[Iterable[int]] = None,
+        voters: Optional[Iterable[int]] = None,
+        elected: Sequence[int] = (),
+        round: int = 1,
+    ):
+        self.size: int = size
+        self.seats: int = seats
+        self.candidates: Tuple[int, ...] = tuple(range(size)) if candidates is None else tuple(sorted(candidates))
+        self.voters: Tuple[int, ...] = tuple(range(size)) if voters is None else tuple(sorted(voters))
+        self.elected: Tuple[int, ...] = tuple(elected)
+        self.round: int = round
+        self.counts: List[int] = [0] * size
+        self.ballots: List[int] = [-1] * size
+        self._eligible: List[bool] = [False] * size
+        for candidate in self.candidates:
+            self._eligible[candidate] = True
+        self._can_vote: List[bool] = [False] * size
+        for voter in self.voters:
+            self._can_vote[voter] = True
+        self.cast_count: int = 0
+
+    def is_candidate(self, target: int) -> bool:
+        return 0 <= target < self.size and self._eligible[target]
+
+    def has_voted(self, voter: int) -> bool:
+        return self.ballots[voter] != -1
+
+    def cast(self, voter: int, target: int):
+        if not 0 <= voter < self.size or not self._can_vote[voter]:
+            raise VoteError("voter is not allowed to vote")
+        if self.ballots[voter] != -1:
+            raise VoteError("already voted")
+        if not self.is_candidate(target):
+            raise VoteError("invalid target")
+        self.ballots[voter] = target
+        self.counts[target] += 1
+        self.cast_count += 1
+
+    @property
+    def complete(self) -> bool:
+        return self.cast_count == len(self.voters)
+
+    def result(self) -> TallyResult:
+        seats = self.seats - len(self.elected)
+        ranked = sorted(self.candidates, key=lambda candidate: -self.counts[candidate])
+        if seats <= 0 or not ranked:
+            return TallyResult(tuple(self.counts), self.elected, (), True, self.round)
+        if seats >= len(ranked):
+            return TallyResult(tuple(self.counts), self.elected + tuple(ranked), (), True, self.round)
+
+        # seats番目の得票数を境に、それより多い候補は確定、同数の候補は同票とする
+        threshold = self.counts[ranked[seats - 1]]
+        secure = tuple(c for c in ranked if self.counts[c] > threshold)
+        tied = tuple(sorted(c for c in ranked if self.counts[c] == threshold))
+        if len(secure) + len(tied) == seats:
+            return TallyResult(tuple(self.counts), self.elected + secure + tied, (), True, self.round)
+        # 規定回数を超えても決着しない場合は同票の候補を全員とする
+        if self.round >= Tally.MAX_ROUNDS:
+            return TallyResult(tuple(self.counts), self.elected + secure + tied, (), True, self.round)
+        return TallyResult(tuple(self.counts), self.elected + secure, tied, False, self.round)
+
+    def runoff(self) -> "Tally":
+        result = self.result()
+        if result.decided:
+            raise VoteError("no runoff is needed")
+        return Tally(self.size, self.seats, result.tied, self.voters, result.elected, self.round + 1)
+
+
+# python tally.py 1000000 で、ランダムな投票をその数だけ集計する速度を計測する
+def main(args: List[str]):
+    ballots = int(args[0]) if args else 1000000
+    rng = random.Random(0)
+    start = time.perf_counter()
+    cast = 0
+    while cast < ballots:
+        tally = Tally(5, 1)
+        while True:
+            for voter in tally.voters:
+                tally.cast(voter, rng.choice(tally.candidates))
+            cast += len(tally.voters)
+            if tally.result().decided:
+                break
+            tally = tally.runoff()
+    elapsed = time.perf_counter() - start
+    print("{} ballots in {:.2f}s ({:.0f} ballots/s)".format(cast, elapsed, cast / elapsed))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
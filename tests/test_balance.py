@@ -0,0 +1,63 @@
+import random
+from itertools import combinations
+import pytest
+from balance import DEFAULT_RATING, POSITIONS, ROLE_PENALTY, balance, fill_unranked, rating
+from riot import LeagueEntry
+
+
+def entry(queue: str, tier: str, rank: str = "IV", league_points: int = 0) -> LeagueEntry:
+    return LeagueEntry(queue, tier, rank, league_points, 10, 10)
+
+
+def test_rating_prefers_solo_queue():
+    assert rating([]) is None
+    assert rating([entry("RANKED_FLEX_SR", "GOLD", "II", 50)]) == 3 * 400 + 2 * 100 + 50
+    assert rating([entry("RANKED_FLEX_SR", "GOLD"), entry("RANKED_SOLO_5x5", "IRON", "I", 10)]) == 310
+    # マスター以上はディビジョンが無いため、LPのみで比べる
+    assert rating([entry("RANKED_SOLO_5x5", "CHALLENGER", "I", 900)]) == rating(
+        [entry("RANKED_SOLO_5x5", "MASTER", "I", 900)]
+    )
+
+
+def test_fill_unranked():
+    assert fill_unranked([None, None]) == [DEFAULT_RATING, DEFAULT_RATING]
+    assert fill_unranked([100, None, 300]) == [100, 200, 300]
+
+
+# 全ての分け方を直接評価して、最も良い評価値を求める
+def brute_force(ratings, positions):
+    best = None
+    for blue in combinations(range(10), 5):
+        red = [i for i in range(10) if i not in blue]
+        difference = abs(sum(ratings[i] for i in blue) - sum(ratings[i] for i in red))
+        conflicts = 0
+        if positions:
+            for team in (blue, red):
+                conflicts += len(team) - len(set(positions[i] for i in team))
+        score = difference + ROLE_PENALTY * conflicts
+        if best is None or score < best:
+            best = score
+    return best
+
+
+@pytest.mark.parametrize("use_positions", [False, True])
+def test_balance_matches_brute_force(use_positions):
+    rng = random.Random(0)
+    for _ in range(200):
+        ratings = [rng.randint(0, 3000) for _ in range(10)]
+        positions = [rng.choice(POSITIONS) for _ in range(10)] if use_positions else None
+        split = balance(ratings, positions)
+        assert sorted(split.blue + split.red) == list(range(10))
+        assert split.difference == abs(sum(ratings[i] for i in split.blue) - sum(ratings[i] for i in split.red))
+        assert split.difference + ROLE_PENALTY * split.role_conflicts == brute_force(ratings, positions)
+
+
+def test_balance_keeps_current_teams_when_even():
+    split = balance([1000] * 10)
+    assert split.blue == (0, 1, 2, 3, 4)
+    assert split.difference == 0
+
+
+def test_balance_needs_ten_players():
+    with pytest.raises(ValueError):
+        balance([1000] * 9)
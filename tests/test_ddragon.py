@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import time
+import pytest
+from champion import ChampionRegistry, ChampionStore
+from ddragon import ChampionSync, DataDragon, DataDragonError
+
+
+def champion(key: int, id: str, name: str) -> dict:
+    return {"key": str(key), "id": id, "name": name, "image": {"full": id + ".png"}}
+
+
+def write_json(path: str, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+# Data Dragonと同じ構成のローカルディレクトリを作る
+def make_bundle(root: str, version: str, champions: list):
+    write_json(os.path.join(root, "api", "versions.json"), [version, "0.0.1"])
+    write_json(
+        os.path.join(root, "cdn", version, "data", "ja_JP", "champion.json"),
+        {"version": version, "data": {c["id"]: c for c in champions}},
+    )
+    images = os.path.join(root, "cdn", version, "img", "champion")
+    os.makedirs(images, exist_ok=True)
+    for c in champions:
+        with open(os.path.join(images, c["image"]["full"]), "wb") as f:
+            f.write(c["id"].encode("utf-8"))
+
+
+@pytest.fixture
+def setup(tmp_path):
+    seed = str(tmp_path / "champion.json")
+    data = {"Ahri": champion(103, "Ahri", "アーリ"), "Annie": champion(1, "Annie", "アニー")}
+    write_json(seed, {"version": "1.0.0", "data": data})
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "Ahri.png").write_bytes(b"old")
+    (images / "Annie.png").write_bytes(b"old")
+    store = ChampionStore(str(tmp_path / "champions.db"))
+    registry = ChampionRegistry(seed, store)
+    bundle = str(tmp_path / "bundle")
+    make_bundle(bundle, "2.0.0", [champion(103, "Ahri", "アーリ改"), champion(266, "Aatrox", "エイトロックス")])
+    yield registry, store, DataDragon(bundle), str(images)
+    store.close()
+
+
+def test_sync_applies_only_the_diff(setup):
+    registry, store, dragon, images = setup
+    changed = []
+    sync = ChampionSync(registry, store, dragon, images, lambda: changed.append(True))
+
+    assert registry.version == "1.0.0"
+    diff = asyncio.run(sync.sync())
+    assert [c.id for c in diff.added] == ["Aatrox"]
+    assert [c.name for c in diff.changed] == ["アーリ改"]
+    assert [c.id for c in diff.removed] == ["Annie"]
+
+    # 手元に無い画像だけを取得する
+    assert open(os.path.join(images, "Aatrox.png"), "rb").read() == b"Aatrox"
+    assert open(os.path.join(images, "Ahri.png"), "rb").read() == b"old"
+    assert changed == [True]
+
+    assert registry.version == "2.0.0"
+    assert registry.by_key(1) is None
+    assert registry.by_name("アーリ改").key == 103
+    assert store.version == "2.0.0"
+    assert asyncio.run(sync.sync()) is None
+
+
+# 同期済みのストアからは、champion.jsonを読まずに最新の情報を読み込む
+def test_registry_loads_synced_snapshot(setup):
+    registry, store, dragon, images = setup
+    asyncio.run(ChampionSync(registry, store, dragon, images).sync())
+    reloaded = ChampionRegistry("does-not-exist.json", store)
+    assert reloaded.version == "2.0.0"
+    assert sorted(c.id for c in reloaded) == ["Aatrox", "Ahri"]
+
+
+def test_missing_bundle_is_an_error(tmp_path):
+    with pytest.raises(DataDragonError):
+        asyncio.run(DataDragon(str(tmp_path)).latest_version())
+
+
+# ディスクへの書き込みなど、Data Dragon以外のエラーでも同期タスクは止まらずに再試行する
+def test_sync_task_retries_after_unexpected_error(setup):
+    registry, store, dragon, images = setup
+    sync = ChampionSync(registry, store, dragon, images)
+    attempts = []
+    original = sync.sync
+
+    async def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) <= 2:
+            raise OSError("disk full")
+        return await original()
+
+    sync.sync = flaky
+
+    async def run():
+        deadline = time.monotonic() + 5.0
+        sync.start(interval=3600.0, retry_delay=0.05)
+        try:
+            while registry.version != "2.0.0":
+                assert time.monotonic() < deadline
+                await asyncio.sleep(0.01)
+        finally:
+            sync.stop()
+
+    asyncio.run(run())
+    assert len(attempts) == 3
+    # 失敗するたびに待ち時間を倍にする
+    assert attempts[2] - attempts[1] >= 2 * 0.05 * 0.9
+    assert sync.failures == 0
+    assert sync.last_error is None
@@ -0,0 +1,159 @@
+import asyncio
+import sqlite3
+import time
+import main
+from fake_riot import FakeRiotServer
+from history import HistoryStore, PlayerResult, PlayerStats
+from riot import RiotClient
+
+
+def player(member_id: int, is_wolf: bool = False, voted_correctly: bool = False, elected: bool = False, won=None):
+    return PlayerResult(member_id, "blue", is_wolf, voted_correctly, elected, won)
+
+
+def test_score():
+    assert player(1, won=True, voted_correctly=True).score == 2
+    assert player(1, won=False, voted_correctly=True).score == 1
+    assert player(1, won=None).score == 0
+    # 人狼は自チームが負けると2点、投票で選ばれなければ1点
+    assert player(1, is_wolf=True, won=False).score == 3
+    assert player(1, is_wolf=True, won=False, elected=True).score == 2
+    assert player(1, is_wolf=True, won=True, elected=True).score == 0
+    # 試合結果が無い場合は勝敗の点は付かない
+    assert player(1, is_wolf=True, won=None).score == 1
+    assert player(1, is_wolf=True, won=False).victory
+    assert not player(1, is_wolf=True, won=None).victory
+
+
+def test_record_is_idempotent(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.db"))
+    results = [player(1, won=True, voted_correctly=True), player(2, is_wolf=True, won=True, elected=True)]
+    assert history.record("game-1", 10, 100, "JP1_1", 1.0, results)
+    assert not history.record("game-1", 10, 100, "JP1_1", 1.0, results)
+    assert history.db.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 2
+    assert history.stats(1, 10) == PlayerStats(1, 1, 1, 0, 0, 1, 2)
+    assert history.stats(2, 10) == PlayerStats(2, 1, 0, 1, 0, 0, 0)
+    history.close()
+
+
+def test_leaderboard_and_stats(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.db"))
+    history.record("a", 10, 100, None, 1.0, [player(1, won=True), player(2, is_wolf=True, won=True)])
+    history.record("b", 10, 100, None, 2.0, [player(1, won=False), player(2, is_wolf=True, won=False)])
+    history.record("c", 20, 200, None, 3.0, [player(1, won=True, voted_correctly=True), player(3, won=True)])
+
+    assert [(s.member_id, s.score) for s in history.leaderboard(10)] == [(2, 4), (1, 1)]
+    assert [s.member_id for s in history.leaderboard(10, limit=1)] == [2]
+    assert history.stats(1, 10) == PlayerStats(1, 2, 1, 0, 0, 0, 1)
+    # サーバーを指定しない場合は全サーバーの合計
+    assert history.stats(1) == PlayerStats(1, 3, 2, 0, 0, 1, 3)
+    assert history.stats(4) is None
+    assert [r.won for r in history.recent(1, 10)] == [False, True]
+    history.close()
+
+
+# 試合数が増えてもランキングと個人成績は索引を引くだけで返せる
+def test_queries_at_300k_games(tmp_path):
+    # 300万行の挿入はディスク上では遅いため、メモリ上で作ってからファイルに複写する
+    source = HistoryStore(":memory:")
+    games, members = 300000, 5000
+    with source.db:
+        source.db.execute(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+            "INSERT INTO games (key, guild_id, channel_id, match_id, finished_at) "
+            "SELECT 'game-' || i, 10, 100, NULL, i FROM n",
+            (games,),
+        )
+        # 1試合10人分の結果を作る
+        source.db.execute(
+            "WITH RECURSIVE s(j) AS (SELECT 0 UNION ALL SELECT j + 1 FROM s WHERE j < 9) "
+            "INSERT INTO results SELECT id, 10, (id * 10 + j) % ?, CASE WHEN j < 5 THEN 'blue' ELSE 'red' END, "
+            "j % 5 = 0, id % 2, 0, id % 2, (id + j) % 4, finished_at FROM games, s",
+            (members,),
+        )
+        source.db.execute(
+            "INSERT INTO player_stats SELECT guild_id, member_id, COUNT(*), SUM(won), SUM(is_wolf), "
+            "SUM(is_wolf AND won), SUM(voted_correctly), SUM(score) FROM results GROUP BY guild_id, member_id"
+        )
+    path = str(tmp_path / "history.db")
+    target = sqlite3.connect(path)
+    source.db.backup(target)
+    target.close()
+    source.close()
+    history = HistoryStore(path)
+
+    def elapsed(query) -> float:
+        samples = []
+        for _ in range(20):
+            start = time.perf_counter()
+            query()
+            samples.append(time.perf_counter() - start)
+        return sorted(samples)[len(samples) // 2]
+
+    assert len(history.leaderboard(10)) == 10
+    assert history.stats(7).games == games * 10 // members
+    assert elapsed(lambda: history.leaderboard(10)) < 0.01
+    assert elapsed(lambda: history.stats(7, 10)) < 0.01
+    assert elapsed(lambda: history.stats(7)) < 0.01
+    assert elapsed(lambda: history.recent(7, 10)) < 0.01
+    history.close()
+
+
+# 偽のRiot APIを相手にmain.ingest_resultsを呼ぶ
+def run_ingest(server: FakeRiotServer, history: HistoryStore, monkeypatch, calls):
+    async def run():
+        await server.start()
+        client = RiotClient("test", base_url=server.base_url)
+        monkeypatch.setattr(main, "riot", client)
+        monkeypatch.setattr(main, "history", history)
+        try:
+            return [await main.ingest_results(payload, final) for payload, final in calls]
+        finally:
+            await client.close()
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def entry(member_id: int, is_wolf: bool, summoner_id: str, voted_correctly: bool, elected: bool):
+    return {
+        "member_id": member_id,
+        "team": "blue",
+        "is_wolf": is_wolf,
+        "summoner_id": summoner_id,
+        "voted_correctly": voted_correctly,
+        "elected": elected,
+    }
+
+
+def payload(match_id):
+    return {
+        "key": "game-1",
+        "guild_id": 10,
+        "channel_id": 100,
+        "match_id": match_id,
+        "finished_at": 1.0,
+        "players": [entry(1, False, "id-a", True, False), entry(2, True, "id-b", False, True)],
+    }
+
+
+def test_ingest_finished_match(tmp_path, monkeypatch):
+    server = FakeRiotServer()
+    history = HistoryStore(str(tmp_path / "history.db"))
+    server.start_game([("a", 1), ("b", 2), ("c", 3), ("d", 4)])
+    server.finish_game(winning_team=200)
+    assert run_ingest(server, history, monkeypatch, [(payload("JP1_1"), False)]) == [True]
+    # 青チームが負けたので村人は勝利点無し、人狼は敗北の2点
+    assert history.stats(1, 10) == PlayerStats(1, 1, 0, 0, 0, 1, 1)
+    assert history.stats(2, 10) == PlayerStats(2, 1, 1, 1, 1, 0, 2)
+    history.close()
+
+
+def test_ingest_retries_until_match_is_published(tmp_path, monkeypatch):
+    server = FakeRiotServer()
+    history = HistoryStore(str(tmp_path / "history.db"))
+    # 最後の試行では勝敗無しで投票の結果だけを記録する
+    calls = [(payload("JP1_1"), False), (payload("JP1_1"), True)]
+    assert run_ingest(server, history, monkeypatch, calls) == [False, True]
+    assert history.stats(1, 10) == PlayerStats(1, 1, 0, 0, 0, 1, 1)
+    history.close()
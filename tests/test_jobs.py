@@ -0,0 +1,86 @@
+import asyncio
+import time
+from jobs import JobQueue
+
+
+# 条件を満たすまでイベントループを回す
+async def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_retries_with_backoff(tmp_path):
+    calls = []
+
+    async def handler(payload, final: bool) -> bool:
+        calls.append((time.monotonic(), final))
+        return len(calls) >= 3
+
+    async def run():
+        jobs = JobQueue(str(tmp_path / "jobs.db"), handler, max_attempts=6, base_delay=0.1)
+        jobs.enqueue({"key": "game-1"})
+        await wait_until(lambda: jobs.completed == 1)
+        stats = jobs.stats()
+        jobs.close()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats == {"pending": 0, "completed": 1, "retried": 2, "failed": 0}
+    assert [final for _, final in calls] == [False, False, False]
+    # 再試行の間隔は base_delay, base_delay * 2 と倍になる
+    first, second = calls[1][0] - calls[0][0], calls[2][0] - calls[1][0]
+    assert first >= 0.09
+    assert second >= 0.19
+
+
+def test_gives_up_after_final_attempt(tmp_path):
+    finals = []
+
+    async def handler(payload, final: bool) -> bool:
+        finals.append(final)
+        if len(finals) == 2:
+            raise RuntimeError("boom")
+        return False
+
+    async def run():
+        jobs = JobQueue(str(tmp_path / "jobs.db"), handler, max_attempts=3, base_delay=0.01)
+        jobs.enqueue({"key": "game-1"})
+        await wait_until(lambda: jobs.failed == 1)
+        stats = jobs.stats()
+        jobs.close()
+        return stats
+
+    stats = asyncio.run(run())
+    # 例外も失敗として再試行し、最後の試行だけfinal=Trueで呼ばれる
+    assert finals == [False, False, True]
+    assert stats == {"pending": 0, "completed": 0, "retried": 2, "failed": 1}
+
+
+def test_resumes_pending_jobs_after_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    payloads = []
+
+    async def fail(payload, final: bool) -> bool:
+        return False
+
+    async def succeed(payload, final: bool) -> bool:
+        payloads.append(payload)
+        return True
+
+    async def run():
+        jobs = JobQueue(path, fail, base_delay=0.01)
+        jobs.enqueue({"key": "game-1"})
+        await wait_until(lambda: jobs.retried == 1)
+        jobs.close()
+        assert jobs.pending() == 0
+
+        restarted = JobQueue(path, succeed, base_delay=0.01)
+        assert restarted.pending() == 1
+        restarted.start()
+        await wait_until(lambda: restarted.completed == 1)
+        restarted.close()
+
+    asyncio.run(run())
+    assert payloads == [{"key": "game-1"}]
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import pytest
+import main
+from config import Config
+from message import CatalogError, MessageCatalog
+from simulator import FakeDiscord, FakeGuild, FakeMember, FakeMessage, FakeTextChannel, bot_environ
+
+
+def test_catalog_has_exactly_the_required_messages():
+    catalog = MessageCatalog.load("OutputMessage.json", main.DEFAULT_LANGUAGE, main.REQUIRED_MESSAGES)
+    assert catalog.get("WhatYouAre", "ja", "人狼") != ""
+
+
+def test_catalog_rejects_problems():
+    raw = {
+        "Hello": {"ja": "こんにちは {}", "en": "Hello"},
+        "Unused": {"ja": "使われていない"},
+        "English": {"en": "only English"},
+    }
+    with pytest.raises(CatalogError) as e:
+        MessageCatalog.compile(raw, "ja", {"Hello": 1, "English": 0, "Missing": 0})
+    assert sorted(e.value.problems) == [
+        "English: missing default language 'ja'",
+        "Hello: placeholders differ between languages [(), ('',)]",
+        "Hello[en]: expected 1 placeholders, got 0",
+        "Missing: missing",
+        "Unused: not used",
+    ]
+
+
+# 登録されていないコマンドには、チャンネルではヘルプの案内を返し、DMでは何も返さない
+def test_unknown_command_replies_with_help(tmp_path):
+    async def run():
+        main.create_app(Config.from_env(dict(os.environ, **bot_environ(str(tmp_path), "http://127.0.0.1:9"))))
+        discord = FakeDiscord()
+        guild = FakeGuild(discord)
+        channel = FakeTextChannel(discord, guild)
+        member = FakeMember(discord, guild, "player")
+        await main.on_message(FakeMessage(discord, channel, member, "/nosuchcommand"))
+        await main.on_message(FakeMessage(discord, member.dm_channel, member, "/nosuchcommand"))
+        await main.outbox.flush_all()
+        await main.shutdown()
+        return discord, channel, member
+
+    discord, channel, member = asyncio.run(run())
+    assert [message.content for message in channel.history] == [main.catalog.get("HelpMessage")]
+    assert member.dm_channel.history == []
+    assert discord.calls["delete"] == 1
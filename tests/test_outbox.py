@@ -0,0 +1,41 @@
+import asyncio
+import re
+from outbox import Outbox
+from simulator import FakeDiscord, FakeGuild, FakeTextChannel, Simulator
+
+
+def test_debounced_posts_are_counted_per_channel():
+    discord = FakeDiscord()
+    guild = FakeGuild(discord)
+    first, second = FakeTextChannel(discord, guild), FakeTextChannel(discord, guild)
+
+    async def run():
+        outbox = Outbox(debounce=0.01)
+        futures = [outbox.post(first, "line {}".format(i)) for i in range(3)]
+        futures.append(outbox.post(second, "alone"))
+        await asyncio.gather(*futures)
+        # 固定表示用の単独のメッセージは前後とまとめない
+        outbox.post(first, "before")
+        await outbox.send(first, "pinned", alone=True)
+        return outbox
+
+    outbox = asyncio.run(run())
+    assert [message.content for message in first.history] == ["line 0\nline 1\nline 2", "before", "pinned"]
+    assert outbox.stats() == {"requested": 6, "sent": 4, "failed": 0, "pending": 0}
+    assert outbox.saved() == 2
+    assert outbox.saved(first.id) == 2
+    assert outbox.saved(second.id) == 0
+    # ゲームの終了時に取り出した後は、次のゲームのために0から数え直す
+    assert outbox.take_saved(first.id) == 2
+    assert outbox.saved(first.id) == 0
+
+
+# ゲームごとに記録した削減数の合計が、全体の削減数と一致する
+def test_savings_are_logged_per_game(capsys):
+    simulator = Simulator(games=3, concurrency=3, phase_timeout=30.0)
+    asyncio.run(simulator.run())
+    saved = [int(n) for n in re.findall(r"Game \d+ finished, (\d+) messages saved", capsys.readouterr().out)]
+    assert simulator.failures == []
+    assert len(saved) == 3
+    assert all(n > 0 for n in saved)
+    assert sum(saved) == sum(bot.outbox.saved() for bot in simulator.bots)
@@ -0,0 +1,120 @@
+import asyncio
+import random
+import time
+from ratelimit import FixedWindow, Priority, RateLimit, RiotScheduler, parse_rate_limit
+
+
+def test_parse_rate_limit():
+    assert parse_rate_limit("20:1,100:120") == [(20, 1.0), (100, 120.0)]
+
+
+def test_fixed_window_resets_after_window():
+    window = FixedWindow(2, 10.0)
+    window.consume(0.0)
+    window.consume(3.0)
+    assert window.delay(5.0) == 5.0
+    assert window.delay(10.0) == 0.0
+    window.consume(10.0)
+    assert window.count == 1
+
+
+# 時刻をランダムに進めながら許される限り送り、どのウィンドウでも上限を超えないことを確かめる
+def test_never_exceeds_limit_within_a_window():
+    rng = random.Random(0)
+    limits = [(5, 4.0), (20, 30.0)]
+    rate = RateLimit(limits)
+    now = 0.0
+    sent = []
+    while now < 300.0:
+        now += rng.random() * 0.5
+        while rate.delay(now) <= 0:
+            rate.consume(now)
+            sent.append(now)
+    for limit, length in limits:
+        # Riotは最初のリクエストから始まる固定ウィンドウで数えるため、同じ方法で数え直す
+        start, count = None, 0
+        for at in sent:
+            if start is None or at >= start + length:
+                start, count = at, 0
+            count += 1
+            assert count <= limit
+
+
+def test_sync_with_server_count():
+    rate = RateLimit([(10, 60.0)])
+    rate.consume(0.0)
+    # 他のプロセスも同じキーで送っている場合は、サーバ側のカウントに合わせる
+    rate.update(None, "10:60", 1.0)
+    assert rate.delay(1.0) > 0
+    assert rate.delay(60.0) == 0.0
+
+
+# 指定した順にacquireを呼び、送信が許された順を返す
+def dispatch_order(scheduler: RiotScheduler, requests, before=None):
+    order = []
+
+    async def acquire(name: str, method: str, priority: Priority):
+        await scheduler.acquire("jp1", method, priority)
+        order.append(name)
+
+    async def run():
+        if before is not None:
+            await before()
+        tasks = []
+        for name, method, priority in requests:
+            tasks.append(asyncio.ensure_future(acquire(name, method, priority)))
+            await asyncio.sleep(0)
+        await asyncio.wait_for(asyncio.gather(*tasks), 5.0)
+
+    asyncio.run(run())
+    return order
+
+
+def test_interactive_requests_go_first_under_contention():
+    scheduler = RiotScheduler([(1, 0.05)])
+    requests = [("background-{}".format(i), "league", Priority.BACKGROUND) for i in range(3)]
+    requests += [("interactive-{}".format(i), "summoner", Priority.INTERACTIVE) for i in range(3)]
+    order = dispatch_order(scheduler, requests)
+    # 最初の1件はウィンドウが空いていたためすぐに送られ、残りは優先度順になる
+    assert order == [
+        "background-0",
+        "interactive-0",
+        "interactive-1",
+        "interactive-2",
+        "background-1",
+        "background-2",
+    ]
+    assert scheduler.pending() == 0
+    assert scheduler.metrics[Priority.INTERACTIVE].count == 3
+
+
+def test_blocked_method_does_not_hold_back_others():
+    scheduler = RiotScheduler([(100, 1.0)])
+
+    async def block():
+        scheduler.penalize("jp1", "summoner", {"Retry-After": "0.2"})
+
+    start = time.monotonic()
+    order = dispatch_order(
+        scheduler,
+        [("summoner", "summoner", Priority.INTERACTIVE), ("league", "league", Priority.BACKGROUND)],
+        block,
+    )
+    assert order == ["league", "summoner"]
+    assert time.monotonic() - start >= 0.19
+
+
+def test_raised_limit_releases_waiting_requests():
+    scheduler = RiotScheduler([(1, 60.0)])
+
+    async def raise_limit():
+        await asyncio.sleep(0.05)
+        scheduler.update("jp1", "summoner", {"X-App-Rate-Limit": "100:60", "X-App-Rate-Limit-Count": "1:60"})
+
+    async def run():
+        await scheduler.acquire("jp1", "summoner", Priority.INTERACTIVE)
+        asyncio.ensure_future(raise_limit())
+        await asyncio.wait_for(scheduler.acquire("jp1", "summoner", Priority.INTERACTIVE), 5.0)
+
+    asyncio.run(run())
+    assert scheduler.pending() == 0
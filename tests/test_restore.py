@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+import main
+from config import Config
+from fake_riot import FakeRiotServer
+from simulator import FakeDiscord, FakeGuild, FakeMember, FakeMessage, FakeTextChannel, bot_environ
+from store import GameRecord, PlayerRecord, SQLiteStateStore, TallyRecord
+
+
+def test_store_round_trip(tmp_path):
+    path = str(tmp_path / "games.db")
+    store = SQLiteStateStore(path)
+    store.save_game(1, "voting", 10, 123.5, "JP1_1")
+    first = PlayerRecord(10, "blue", 0, is_wolf=True, summoner_name="a", summoner_id="id-a", display_name="A")
+    second = PlayerRecord(11, "red", 0, voted_to=2, voted_from=1, champion_name="Ahri", position="top")
+    store.save_player(1, first)
+    store.save_player(1, second)
+    store.save_player(1, PlayerRecord(12, "red", 1))
+    store.delete_player(1, 12)
+    store.save_tally(1, TallyRecord("blue", 2, (0, 3)))
+    store.save_game(2, "pre-game", None, None)
+    store.delete_game(2)
+    store.save_language(5, "en")
+    store.close()
+
+    reopened = SQLiteStateStore(path)
+    [record] = reopened.load()
+    assert record._replace(players=tuple(sorted(record.players))) == GameRecord(
+        1, "voting", 10, 123.5, (first, second), "JP1_1", (TallyRecord("blue", 2, (0, 3)),)
+    )
+    assert reopened.load_languages() == {5: "en"}
+    reopened.close()
+
+
+class Lobby(object):
+    def __init__(self, discord: FakeDiscord, riot: FakeRiotServer):
+        self.discord: FakeDiscord = discord
+        guild = FakeGuild(discord)
+        self.channel: FakeTextChannel = FakeTextChannel(discord, guild)
+        self.host: FakeMember = FakeMember(discord, guild, "host", manage_guild=True)
+        self.players = [FakeMember(discord, guild, "player-{}".format(i)) for i in range(10)]
+        for member in self.players:
+            riot.add_summoner("Summoner {}".format(member.id))
+
+    async def say(self, member: FakeMember, content: str):
+        await main.on_message(FakeMessage(self.discord, self.channel, member, content))
+
+    # バンピック中まで進める
+    async def start(self):
+        await self.say(self.host, "/join host")
+        for i, member in enumerate(self.players):
+            await self.say(member, "/join blue" if i < 5 else "/join red")
+            await main.on_message(
+                FakeMessage(self.discord, member.dm_channel, member, "/name Summoner {}".format(member.id))
+            )
+        await self.say(self.host, "/start 600")
+
+
+def snapshot(game: main.Game):
+    return {
+        "state": game.progress.state,
+        "host": game.host.info.id,
+        "blue": [(player.info.id, player.is_wolf, player.summoner_name) for player in game.blue_team],
+        "red": [(player.info.id, player.is_wolf, player.summoner_name) for player in game.red_team],
+        "deadline": game.deadline,
+    }
+
+
+# ゲームを保存したまま終了し、同じデータベースで起動し直したボットに復元させる
+def run_restart(tmp_path, lobbies: int, environ=None):
+    async def run():
+        riot = FakeRiotServer()
+        await riot.start()
+        config = Config.from_env(dict(os.environ, **bot_environ(str(tmp_path), riot.base_url)))
+        discord = FakeDiscord()
+        main.create_app(config)
+        started = [Lobby(discord, riot) for _ in range(lobbies)]
+        before = []
+        for lobby in started:
+            await lobby.start()
+            before.append(snapshot(main.games.get(lobby.channel.id)))
+        await main.shutdown()
+
+        config = Config.from_env(dict(os.environ, **bot_environ(str(tmp_path), riot.base_url), **(environ or {})))
+        main.create_app(config)
+        channels = {lobby.channel.id: lobby.channel for lobby in started}
+        main.client.get_channel = channels.get
+        await main.restore_games()
+        after = [main.games.get(lobby.channel.id) for lobby in started]
+        result = (
+            before,
+            [snapshot(game) if game is not None else None for game in after],
+            [main.timers.remaining(lobby.channel.id) for lobby in started],
+            [[main.players.seat_of(member.id) is not None for member in lobby.players] for lobby in started],
+            len(main.store.load()),
+        )
+        await main.shutdown()
+        await riot.stop()
+        return result
+
+    return asyncio.run(run())
+
+
+def test_restore_after_restart(tmp_path):
+    start = time.time()
+    [before], [after], [remaining], [seated], saved = run_restart(tmp_path, 1)
+    assert before["state"] == "ban-pick"
+    # チーム・ホスト・人狼・期限が保存前と一致し、バンピックの残り時間から再開する
+    assert after == before
+    assert sum(is_wolf for _, is_wolf, _ in after["blue"]) == 1
+    assert sum(is_wolf for _, is_wolf, _ in after["red"]) == 1
+    assert 0 < remaining <= before["deadline"] - start
+    assert all(seated)
+    assert saved == 1
+
+
+def test_restore_keeps_games_over_the_limit(tmp_path):
+    before, after, remaining, seated, saved = run_restart(tmp_path, 2, {"MAX_GAMES": "1"})
+    restored = [i for i, game in enumerate(after) if game is not None]
+    assert len(restored) == 1
+    skipped = 1 - restored[0]
+    assert after[restored[0]] == before[restored[0]]
+    # 上限を超えたゲームは席を空けるが、保存された状態は次回の起動のために残す
+    assert remaining[skipped] is None
+    assert not any(seated[skipped])
+    assert saved == 2
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from aiohttp import web
+from fake_riot import FakeRiotServer
+from riot import RiotAPIError, RiotClient
+
+
+# 指定した秒数だけ応答を遅らせるスタブサーバ
+class SlowRiotServer(FakeRiotServer):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay: float = delay
+
+    async def _summoner_by_name(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.delay)
+        return await super()._summoner_by_name(request)
+
+
+def run_with_server(server: FakeRiotServer, test, **kwargs):
+    async def run():
+        await server.start()
+        client = RiotClient("test", base_url=server.base_url, **kwargs)
+        try:
+            return await test(client)
+        finally:
+            await client.close()
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def test_found_summoner():
+    server = FakeRiotServer()
+    server.add_summoner("Hide on bush")
+    summoner = run_with_server(server, lambda client: client.get_summoner_by_name("Hide on bush"))
+    assert summoner.name == "Hide on bush"
+    assert summoner.id == "id-Hide on bush"
+
+
+def test_missing_summoner_returns_none():
+    server = FakeRiotServer()
+    assert run_with_server(server, lambda client: client.get_summoner_by_name("nobody")) is None
+    assert run_with_server(FakeRiotServer(), lambda client: client.get_match("JP1_1")) is None
+
+
+def test_retries_after_429():
+    server = FakeRiotServer()
+    server.add_summoner("ggwp")
+    server.throttle(2, retry_after=0)
+
+    async def test(client: RiotClient):
+        summoner = await client.get_summoner_by_name("ggwp")
+        return summoner, client.responses
+
+    summoner, responses = run_with_server(server, test)
+    assert summoner is not None
+    assert responses[("summoner-v4.by-name", "429")] == 2
+    assert responses[("summoner-v4.by-name", "200")] == 1
+    assert len(server.requests) == 3
+
+
+def test_gives_up_after_max_retries():
+    server = FakeRiotServer()
+    server.add_summoner("ggwp")
+    server.throttle(RiotClient.MAX_RETRIES + 1, retry_after=0)
+    with pytest.raises(RiotAPIError) as e:
+        run_with_server(server, lambda client: client.get_summoner_by_name("ggwp"))
+    assert e.value.status == 429
+
+
+def test_timeout_is_api_error():
+    server = SlowRiotServer(1.0)
+    server.add_summoner("ggwp")
+    with pytest.raises(RiotAPIError) as e:
+        run_with_server(server, lambda client: client.get_summoner_by_name("ggwp"), timeout=0.1)
+    assert e.value.status == 408
@@ -0,0 +1,77 @@
+import asyncio
+import aiohttp
+from shard import HttpBus, LocalBus, SQLiteDirectory, parse_peers, parse_shard_ids, shard_for_guild
+from simulator import Simulator, free_port
+
+
+def test_parse():
+    assert parse_shard_ids("0-2,5") == [0, 1, 2, 5]
+    assert parse_peers("0=http://a:1/,1=http://b:2") == {0: "http://a:1", 1: "http://b:2"}
+    assert shard_for_guild(3 << 22, 2) == 1
+
+
+def test_sqlite_directory_is_shared(tmp_path):
+    path = str(tmp_path / "members.db")
+    first, second = SQLiteDirectory(path), SQLiteDirectory(path)
+    first.assign(10, 1)
+    assert second.lookup(10) == 1
+    second.release(10)
+    assert first.lookup(10) is None
+
+
+def test_local_bus_forwards_to_registered_shard():
+    received = []
+
+    async def handler(member_id: int, content: str) -> bool:
+        received.append((member_id, content))
+        return True
+
+    bus = LocalBus()
+    bus.register([0, 1], handler)
+    assert asyncio.run(bus.forward(1, 10, "/vote 2"))
+    assert not asyncio.run(bus.forward(2, 10, "/vote 2"))
+    assert received == [(10, "/vote 2")]
+
+
+def test_http_bus_requires_secret():
+    received = []
+
+    async def handler(member_id: int, content: str) -> bool:
+        received.append((member_id, content))
+        return True
+
+    async def run():
+        port = free_port()
+        peers = {1: f"http://127.0.0.1:{port}"}
+        shard0, shard1 = HttpBus(peers, "secret"), HttpBus({}, "secret", port=port)
+        shard1.register([1], handler)
+        await shard1.start()
+        try:
+            forwarded = await shard0.forward(1, 10, "/vote 2")
+            # 秘密鍵が無い、または異なるリクエストはハンドラを呼ばずに拒否する
+            statuses = []
+            async with aiohttp.ClientSession() as session:
+                body = {"shard_id": 1, "member_id": 20, "content": "/vote 3"}
+                for headers in ({}, {HttpBus.SECRET_HEADER: "wrong"}):
+                    async with session.post(peers[1] + "/dm", json=body, headers=headers) as response:
+                        statuses.append(response.status)
+            return forwarded, statuses, shard1.rejected
+        finally:
+            await shard0.stop()
+            await shard1.stop()
+
+    forwarded, statuses, rejected = asyncio.run(run())
+    assert forwarded
+    assert statuses == [403, 403]
+    assert rejected == 2
+    assert received == [(10, "/vote 2")]
+
+
+# 2つのシャードで偽のギルドのゲームを進め、シャード0に届いたDMの投票を担当シャードへ転送する
+def test_two_shards_forward_dm_votes():
+    simulator = Simulator(games=2, concurrency=2, phase_timeout=30.0, shards=2)
+    report = asyncio.run(simulator.run())
+    assert simulator.failures == []
+    assert report["recorded"] == 2
+    assert report["forwarded_dms"] > 0
+    assert report["commands"]["dm /vote"]["count"] >= 20
@@ -0,0 +1,9 @@
+import simulator
+
+
+# --metricsはボットの終了後に出力されるため、閉じたジョブキューを参照して落ちないことを確かめる
+def test_metrics_flag_prints_snapshot(capsys):
+    simulator.main(["--games", "2", "--concurrency", "2", "--phase-timeout", "30", "--metrics"])
+    output = capsys.readouterr().out
+    assert "lolwolf_result_jobs_pending 0" in output
+    assert "lolwolf_result_jobs_total" in output
@@ -0,0 +1,94 @@
+import random
+from itertools import combinations
+import pytest
+from store import MemoryStateStore, SQLiteStateStore, TallyRecord
+from tally import Tally, VoteError
+
+
+# 得票数の多い順に席を埋める全ての選び方を列挙し、そこから期待される結果を求める
+def reference(counts, candidates, seats, elected, round):
+    remaining = seats - len(elected)
+    if remaining <= 0 or not candidates:
+        return set(elected), set(), True
+    if remaining >= len(candidates):
+        return set(elected) | set(candidates), set(), True
+    valid = [
+        set(chosen)
+        for chosen in combinations(candidates, remaining)
+        if min(counts[c] for c in chosen) >= max((counts[c] for c in candidates if c not in chosen), default=0)
+    ]
+    union = set().union(*valid)
+    secure = set.intersection(*valid)
+    if len(valid) == 1 or round >= Tally.MAX_ROUNDS:
+        return set(elected) | union, set(), True
+    return set(elected) | secure, union - secure, False
+
+
+def random_tally(rng: random.Random) -> Tally:
+    size = rng.randint(1, 10)
+    seats = rng.randint(1, 3)
+    candidates = rng.sample(range(size), rng.randint(1, size))
+    voters = rng.sample(range(size), rng.randint(0, size))
+    tally = Tally(size, seats, candidates, voters)
+    for voter in voters:
+        if rng.random() < 0.9:
+            tally.cast(voter, rng.choice(candidates))
+    return tally
+
+
+def check(tally: Tally):
+    result = tally.result()
+    elected, tied, decided = reference(tally.counts, tally.candidates, tally.seats, tally.elected, tally.round)
+    assert set(result.elected) == elected
+    assert len(result.elected) == len(elected)
+    assert set(result.tied) == tied
+    assert result.decided == decided
+    assert result.round == tally.round
+    return result
+
+
+def test_result_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(5000):
+        check(random_tally(rng))
+
+
+def test_runoffs_match_brute_force_and_stop_at_max_rounds():
+    rng = random.Random(1)
+    for _ in range(2000):
+        tally = random_tally(rng)
+        result = check(tally)
+        while not result.decided:
+            runoff = tally.runoff()
+            assert runoff.candidates == tuple(sorted(result.tied))
+            assert runoff.elected == result.elected
+            assert runoff.round == tally.round + 1
+            for voter in runoff.voters:
+                runoff.cast(voter, rng.choice(runoff.candidates))
+            tally = runoff
+            result = check(tally)
+        assert tally.round <= Tally.MAX_ROUNDS
+        with pytest.raises(VoteError):
+            tally.runoff()
+
+
+def test_rejects_invalid_ballots():
+    tally = Tally(5, 1, candidates=[0, 1], voters=[0, 1, 2])
+    tally.cast(0, 1)
+    with pytest.raises(VoteError):
+        tally.cast(0, 1)
+    with pytest.raises(VoteError):
+        tally.cast(3, 1)
+    with pytest.raises(VoteError):
+        tally.cast(1, 4)
+
+
+@pytest.mark.parametrize("make_store", [lambda path: MemoryStateStore(), lambda path: SQLiteStateStore(path)])
+def test_store_keeps_runoff_rounds(tmp_path, make_store):
+    store = make_store(str(tmp_path / "games.db"))
+    store.save_game(1, "voting", None, None)
+    store.save_tally(1, TallyRecord("blue", 2, (0, 3)))
+    store.save_tally(1, TallyRecord("red", 3))
+    assert sorted(store.load()[0].tallies) == [TallyRecord("blue", 2, (0, 3)), TallyRecord("red", 3, ())]
+    store.delete_tallies(1)
+    assert store.load()[0].tallies == ()
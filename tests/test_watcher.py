@@ -0,0 +1,32 @@
+import asyncio
+from riot import ActiveGame, Participant
+from watcher import ActiveGameWatcher
+
+
+# 最初の数回は例外を投げ、その後は試合を返すRiotClientの代わり
+class FlakyRiot(object):
+    def __init__(self, failures: int):
+        self.failures: int = failures
+        self.calls: int = 0
+
+    async def get_active_game(self, summoner_id: str) -> ActiveGame:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OSError("connection reset")
+        return ActiveGame(1, 0, [Participant(summoner_id, "name", 1, 100)])
+
+
+def test_keeps_polling_after_unexpected_error():
+    riot = FlakyRiot(2)
+
+    async def run():
+        watcher = ActiveGameWatcher(riot, min_interval=0.01, max_interval=0.01)
+        try:
+            return await asyncio.wait_for(watcher.watch(["a", "b"]), 5.0), watcher
+        finally:
+            watcher.stop()
+
+    active_game, watcher = asyncio.run(run())
+    assert active_game.game_id == 1
+    assert riot.calls == 3
+    assert watcher.errors == 2
@@ -0,0 +1,101 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class Timer(object):
+    __slots__ = ("key", "deadline", "callback", "seq", "cancelled")
+
+    def __init__(self, key: Hashable, deadline: float, callback: Callable[[], Awaitable[Any]], seq: int):
+        self.key: Hashable = key
+        self.deadline: float = deadline
+        self.callback: Callable[[], Awaitable[Any]] = callback
+        self.seq: int = seq
+        self.cancelled: bool = False
+
+    def __lt__(self, other: "Timer") -> bool:
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.time())
+
+
+# 全ゲームの期限付きイベントを一つのヒープと一つのタスクで管理する
+# 期限は永続化できるようにUNIX時間 (time.time()) で扱う
+class DeadlineScheduler(object):
+    def __init__(self):
+        self.timers: Dict[Hashable, Timer] = {}
+        self._heap: List[Timer] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def schedule(self, key: Hashable, deadline: float, callback: Callable[[], Awaitable[Any]]) -> Timer:
+        self.cancel(key)
+        timer = Timer(key, deadline, callback, next(self._seq))
+        self.timers[key] = timer
+        heapq.heappush(self._heap, timer)
+        self._ensure_running()
+        self._wakeup.set()
+        return timer
+
+    def reschedule(self, key: Hashable, deadline: float) -> Optional[Timer]:
+        timer = self.timers.get(key)
+        if timer is None:
+            return None
+        return self.schedule(key, deadline, timer.callback)
+
+    def cancel(self, key: Hashable) -> bool:
+        timer = self.timers.pop(key, None)
+        if timer is None:
+            return False
+        # ヒープからは取り出された時に捨てる
+        timer.cancelled = True
+        return True
+
+    def get(self, key: Hashable) -> Optional[Timer]:
+        return self.timers.get(key)
+
+    def remaining(self, key: Hashable) -> Optional[float]:
+        timer = self.timers.get(key)
+        return timer.remaining() if timer is not None else None
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.timers.clear()
+        self._heap.clear()
+
+    async def _fire(self, timer: Timer):
+        try:
+            await timer.callback()
+        except Exception as e:
+            print("Timer {} failed: {!r}".format(timer.key, e))
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self._heap and (self._heap[0].cancelled or self._heap[0].deadline <= now):
+                timer = heapq.heappop(self._heap)
+                if timer.cancelled:
+                    continue
+                del self.timers[timer.key]
+                asyncio.ensure_future(self._fire(timer))
+
+            timeout = self._heap[0].deadline - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional
+from riot import ActiveGame, RiotAPIError, RiotClient
+
+
+class _Watch(object):
+    __slots__ = ("summoner_ids", "futures", "interval", "next_poll", "deadline", "cursor")
+
+    def __init__(self, summoner_ids: List[str], interval: float, deadline: float):
+        self.summoner_ids: List[str] = summoner_ids
+        self.futures: List[asyncio.Future] = []
+        self.interval: float = interval
+        self.next_poll: float = time.monotonic()
+        self.deadline: float = deadline
+        self.cursor: int = 0
+
+    # 登録されたサモナーを順番に一人ずつ問い合わせる
+    def next_summoner(self) -> str:
+        summoner_id = self.summoner_ids[self.cursor % len(self.summoner_ids)]
+        self.cursor += 1
+        return summoner_id
+
+
+# 全てのゲームのアクティブゲーム検出を一つのタスクでまとめて行う
+class ActiveGameWatcher(object):
+    MIN_INTERVAL = 1.0
+    MAX_INTERVAL = 30.0
+    BACKOFF = 1.5
+    TIMEOUT = 600.0
+
+    def __init__(
+        self,
+        riot: RiotClient,
+        min_interval: float = MIN_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+        backoff: float = BACKOFF,
+    ):
+        self.riot: RiotClient = riot
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+        self.backoff: float = backoff
+        self.watches: Dict[FrozenSet[str], _Watch] = {}
+        self.polls: int = 0
+        self.errors: int = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    # 見つかった場合はActiveGame、タイムアウトした場合はNoneが結果となるFutureを返す
+    def watch(self, summoner_ids: Iterable[str], timeout: float = TIMEOUT) -> asyncio.Future:
+        self._ensure_running()
+        ids = [summoner_id for summoner_id in summoner_ids if summoner_id is not None]
+        future = asyncio.get_event_loop().create_future()
+        if not ids:
+            future.set_result(None)
+            return future
+
+        key = frozenset(ids)
+        watch = self.watches.get(key)
+        if watch is None:
+            watch = _Watch(ids, self.min_interval, time.monotonic() + timeout)
+            self.watches[key] = watch
+        else:
+            watch.deadline = max(watch.deadline, time.monotonic() + timeout)
+        watch.futures.append(future)
+        self._wakeup.set()
+        return future
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for watch in self.watches.values():
+            for future in watch.futures:
+                if not future.done():
+                    future.cancel()
+        self.watches.clear()
+
+    def _resolve(self, active_game: ActiveGame):
+        found = set(participant.summoner_id for participant in active_game.participants)
+        for key in [key for key in self.watches if key & found]:
+            for future in self.watches.pop(key).futures:
+                if not future.done():
+                    future.set_result(active_game)
+
+    async def _poll(self, watch: _Watch) -> Optional[ActiveGame]:
+        self.polls += 1
+        try:
+            return await self.riot.get_active_game(watch.next_summoner())
+        except RiotAPIError as e:
+            self.errors += 1
+            print("Riot API error: {}".format(e.status))
+            return None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 接続エラーなどで監視タスクごと止まらないよう、見つからなかった場合と同様に間隔を空けて再試行する
+            self.errors += 1
+            print("Active game poll failed: {!r}".format(e))
+            return None
+
+    def _prune(self, now: float):
+        for key, watch in list(self.watches.items()):
+            watch.futures = [future for future in watch.futures if not future.done()]
+            if not watch.futures:
+                del self.watches[key]
+            elif now >= watch.deadline:
+                for future in watch.futures:
+                    future.set_result(None)
+                del self.watches[key]
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            self._prune(now)
+
+            due = [watch for watch in self.watches.values() if watch.next_poll <= now]
+            results = await asyncio.gather(*[self._poll(watch) for watch in due])
+            for watch, active_game in zip(due, results):
+                if active_game is not None:
+                    self._resolve(active_game)
+                    continue
+                # 見つからない間は徐々に間隔を広げる
+                watch.next_poll = time.monotonic() + watch.interval
+                watch.interval = min(self.max_interval, watch.interval * self.backoff)
+
+            if not self.watches:
+                await self._wakeup.wait()
+                continue
+            wake_at = min(min(watch.next_poll, watch.deadline) for watch in self.watches.values())
+            delay = max(0.0, wake_at - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass